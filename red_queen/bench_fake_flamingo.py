@@ -0,0 +1,143 @@
+"""
+Construction-time benchmark of the FakeFlamingo backend across device sizes.
+
+Compares the bulk-draw builder of FakeFlamingo against the original
+per-qubit/per-edge scalar loop and checks that both produce identical
+error and duration values.
+
+Usage: python3 bench_fake_flamingo.py [--repeats N]
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import argparse
+import functools
+import time
+
+import numpy as np
+import rustworkx as rx
+
+from qiskit.transpiler import Target, InstructionProperties
+from qiskit.circuit.library import XGate, SXGate, RZGate, CZGate
+from qiskit.circuit import Measure, Delay, Parameter, IfElseOp
+
+from utils import FakeFlamingo, BACKEND_SEED
+
+# (target, qubits, distance) device sizes to build
+SIZES = [
+    ("heavy_hex", None, 11),
+    ("heavy_hex", None, 21),
+    ("heavy_hex", None, 31),
+    ("linear", 200, None),
+    ("linear", 1000, None),
+    ("linear", 5000, None),
+    ("all_to_all", 100, None),
+    ("all_to_all", 200, None),
+    ("all_to_all", 300, None),
+]
+
+
+def build_graph(target, qubits, distance):
+    if target == "heavy_hex":
+        return rx.generators.directed_heavy_hex_graph(distance, bidirectional=False)
+    if target == "linear":
+        return rx.generators.directed_path_graph(qubits)
+    return rx.generators.directed_complete_graph(qubits)
+
+
+def build_scalar_target(graph, seed=BACKEND_SEED):
+    """
+    Build the FakeFlamingo target with the original one-draw-at-a-time loops.
+    """
+    num_qubits = len(graph)
+    rng = np.random.default_rng(seed=seed)
+    rz_props, x_props, sx_props, measure_props, delay_props = {}, {}, {}, {}, {}
+    target = Target("Fake multi-chip backend", num_qubits=num_qubits)
+    for i in range(num_qubits):
+        qarg = (i,)
+        rz_props[qarg] = InstructionProperties(error=0.0, duration=0.0)
+        x_props[qarg] = InstructionProperties(
+            error=rng.uniform(1e-6, 1e-4), duration=rng.uniform(1e-8, 9e-7)
+        )
+        sx_props[qarg] = InstructionProperties(
+            error=rng.uniform(1e-6, 1e-4), duration=rng.uniform(1e-8, 9e-7)
+        )
+        measure_props[qarg] = InstructionProperties(
+            error=rng.uniform(1e-3, 1e-1), duration=rng.uniform(1e-8, 9e-7)
+        )
+        delay_props[qarg] = None
+    target.add_instruction(XGate(), x_props)
+    target.add_instruction(SXGate(), sx_props)
+    target.add_instruction(RZGate(Parameter("theta")), rz_props)
+    target.add_instruction(Measure(), measure_props)
+    target.add_instruction(Delay(Parameter("t")), delay_props)
+    cz_props = {}
+    for root_edge in graph.edge_list():
+        edge = (root_edge[0], root_edge[1])
+        cz_props[edge] = InstructionProperties(
+            error=rng.uniform(1e-5, 5e-3), duration=rng.uniform(1e-8, 9e-7)
+        )
+    target.add_instruction(CZGate(), cz_props)
+    target.add_instruction(IfElseOp, name="if_else")
+    return target
+
+
+def targets_match(expected, actual):
+    """
+    Check that two targets hold bit-identical errors and durations.
+    """
+    for name in ("x", "sx", "rz", "measure", "cz"):
+        if set(expected[name]) != set(actual[name]):
+            return False
+        for qarg, props in expected[name].items():
+            other = actual[name][qarg]
+            if (props.error, props.duration) != (other.error, other.duration):
+                return False
+    return True
+
+
+def best_time(func, repeats):
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start_time)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'target':<12}{'qubits':>8}{'edges':>9}"
+        f"{'scalar (s)':>13}{'bulk (s)':>11}{'speedup':>9}  identical"
+    )
+    for target, qubits, distance in SIZES:
+        graph = build_graph(target, qubits, distance)
+        scalar_time, scalar_target = best_time(
+            functools.partial(build_scalar_target, graph), args.repeats
+        )
+        bulk_time, backend = best_time(
+            functools.partial(
+                FakeFlamingo, qubits=qubits, target=target, distance=distance
+            ),
+            args.repeats,
+        )
+        identical = targets_match(scalar_target, backend.target)
+        print(
+            f"{target:<12}{len(graph):>8}{graph.num_edges():>9}"
+            f"{scalar_time:>13.4f}{bulk_time:>11.4f}"
+            f"{scalar_time / bulk_time:>9.2f}  {identical}"
+        )
+
+
+if __name__ == "__main__":
+    main()
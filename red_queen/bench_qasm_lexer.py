@@ -0,0 +1,111 @@
+"""
+Benchmark of the array-backed QASM lexer of Preprocess.
+
+Compiles a benchmark (efficient_su2_200.qasm by default) with qiskit, dumps
+the result to QASM like the runner does and compares computing the per-qubit
+depths and the CX count with the original line-by-line string handling of
+Preprocess against lexing once into the instruction table and counting with
+NumPy. Both start from the same processed QASM lines.
+
+Usage: python3 bench_qasm_lexer.py [--benchmark PATH] [--repeats N] [--raw]
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import argparse
+import os
+import time
+
+from qiskit import transpile, QuantumCircuit, qasm2
+
+from preprocessing import Preprocess
+from utils import get_fake_flamingo
+
+DEFAULT_BENCHMARK = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "benchmarking",
+    "efficientSU2",
+    "efficient_su2_200.qasm",
+)
+
+
+def reference_counts(benchmark: Preprocess):
+    """
+    Per-qubit depths and CX count with the original string handling.
+    """
+    qubit_depth = {}
+    cx_count = 0
+    for gate in benchmark.processed_qasm:
+        op = benchmark.get_op(gate)
+        if op not in benchmark.GATE_TABLE:
+            continue
+        cx_count += benchmark.CX_TABLE[op]
+        for qubit in benchmark.get_qubit_id(gate):
+            qubit_depth[qubit] = qubit_depth.get(qubit, 0) + 1
+    return qubit_depth, cx_count
+
+
+def lexer_counts(benchmark: Preprocess):
+    """
+    Per-qubit depths and CX count from the array-backed instruction table.
+    """
+    benchmark.tokenize()
+    depths = benchmark.qubit_depths()
+    labels = {index: label for label, index in benchmark.qubit_labelled.items()}
+    qubit_depth = {labels[i]: int(depth) for i, depth in enumerate(depths) if depth}
+    return qubit_depth, benchmark.cx_count()
+
+
+def best_time(func, repeats):
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start_time)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--benchmark", default=DEFAULT_BENCHMARK)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--raw", action="store_true", help="lex the benchmark without compiling it"
+    )
+    args = parser.parse_args()
+
+    with open(args.benchmark, "r", encoding="utf-8") as file:
+        qasm = file.read()
+    if not args.raw:
+        backend = get_fake_flamingo("heavy_hex", 200, 11)
+        compiled = transpile(
+            QuantumCircuit.from_qasm_str(qasm), backend, optimization_level=1
+        )
+        qasm = qasm2.dumps(compiled)
+    benchmark = Preprocess(qasm)
+
+    reference_time, reference = best_time(
+        lambda: reference_counts(benchmark), args.repeats
+    )
+    lexer_time, lexed = best_time(lambda: lexer_counts(benchmark), args.repeats)
+    depth = max(lexed[0].values())
+    print(
+        f"{os.path.basename(args.benchmark)}: {len(benchmark.processed_qasm)} "
+        f"statements, {len(benchmark.qubit_indices)} qubit operands"
+    )
+    print(f"depth {depth}, cx count {lexed[1]}, identical {reference == lexed}")
+    print(f"{'reference (s)':>14}{'lexer (s)':>11}{'speedup':>9}")
+    print(
+        f"{reference_time:>14.4f}{lexer_time:>11.4f}"
+        f"{reference_time / lexer_time:>9.2f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
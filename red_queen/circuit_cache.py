@@ -0,0 +1,185 @@
+"""
+This module contains the CircuitCache class, an on-disk cache of parsed
+benchmark circuits shared by every Runner, worker process and session.
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import hashlib
+import json
+import os
+import tempfile
+
+from pytket import Circuit
+from pytket import __version__ as pytket_version
+from pytket.qasm import circuit_from_qasm
+
+from qiskit import QuantumCircuit, qpy
+from qiskit import __version__ as qiskit_version
+
+CIRCUIT_CACHE_DIR = os.path.join(os.path.dirname(__file__), ".cache", "circuits")
+DEFAULT_CACHE_SIZE_MIB = 512
+
+# Versions of the libraries whose serialization formats are cached
+COMPILER_VERSIONS = {"qiskit": qiskit_version, "pytket": pytket_version}
+# File suffix of the cache entries of every compiler
+ENTRY_SUFFIXES = {"qiskit": ".qpy", "pytket": ".json"}
+
+
+def parse_circuit(path: str, compiler: str):
+    """
+    Parse a .qasm benchmark into the circuit type of a compiler.
+
+    :param path: path of the .qasm benchmark
+    :param compiler: name of the compiler, "qiskit" or "pytket"
+    """
+    if compiler == "pytket":
+        return circuit_from_qasm(path)
+    return QuantumCircuit.from_qasm_file(path)
+
+
+class CircuitCache:
+    """
+    Content-addressed cache of parsed circuits.
+
+    Entries are keyed by the SHA-256 of the .qasm file together with the
+    compiler and the version of its library, so an edited benchmark or an
+    upgraded compiler never reads a stale circuit. qiskit circuits are stored
+    as QPY and pytket circuits as the JSON of Circuit.to_dict. Once the cache
+    grows past ``max_size_mib`` the least recently used entries are evicted.
+    """
+
+    def __init__(
+        self,
+        directory: str = CIRCUIT_CACHE_DIR,
+        max_size_mib: float = DEFAULT_CACHE_SIZE_MIB,
+    ):
+        """
+        :param directory: directory holding the cache entries
+        :param max_size_mib: size the cache is trimmed to after every store
+        """
+        self.directory = directory
+        self.max_size_mib = max_size_mib
+        self._digests = {}
+
+    def entry_path(self, path: str, compiler: str):
+        """
+        :param path: path of the .qasm benchmark
+        :param compiler: name of the compiler
+        :return: path of the cache entry of the benchmark
+        """
+        stat = os.stat(path)
+        file_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        if file_key not in self._digests:
+            with open(path, "rb") as file:
+                self._digests[file_key] = hashlib.sha256(file.read()).hexdigest()
+        digest = hashlib.sha256(
+            f"{self._digests[file_key]}:{compiler}:{COMPILER_VERSIONS[compiler]}".encode()
+        ).hexdigest()
+        return os.path.join(self.directory, digest + ENTRY_SUFFIXES[compiler])
+
+    def get(self, path: str, compiler: str):
+        """
+        Look up the parsed circuit of a benchmark.
+
+        :param path: path of the .qasm benchmark
+        :param compiler: name of the compiler
+        :return: the circuit, or ``None`` if it is not cached
+        """
+        entry = self.entry_path(path, compiler)
+        try:
+            if compiler == "pytket":
+                with open(entry, "r", encoding="utf-8") as file:
+                    circuit = Circuit.from_dict(json.load(file))
+            else:
+                with open(entry, "rb") as file:
+                    circuit = qpy.load(file)[0]
+        except FileNotFoundError:
+            return None
+        except Exception:  # pylint: disable=broad-except
+            # A corrupt entry is dropped and the circuit parsed again
+            self._remove(entry)
+            return None
+        # The modification time orders the entries for eviction; the entry may
+        # have been evicted by another worker since it was read
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            pass
+        return circuit
+
+    def put(self, path: str, compiler: str, circuit):
+        """
+        Store the parsed circuit of a benchmark and evict old entries.
+
+        :param path: path of the .qasm benchmark
+        :param compiler: name of the compiler
+        :param circuit: circuit parsed from the benchmark
+        :type circuit: QuantumCircuit or Circuit
+        """
+        entry = self.entry_path(path, compiler)
+        os.makedirs(self.directory, exist_ok=True)
+        # Write to a temporary file first so concurrent workers never read a
+        # partially written entry
+        with tempfile.NamedTemporaryFile(
+            dir=self.directory, suffix=".tmp", delete=False
+        ) as file:
+            if compiler == "pytket":
+                file.write(json.dumps(circuit.to_dict()).encode())
+            else:
+                qpy.dump(circuit, file)
+        os.replace(file.name, entry)
+        self.evict()
+
+    def contains(self, path: str, compiler: str):
+        """
+        :return: whether the benchmark has a cache entry for the compiler
+        """
+        return os.path.exists(self.entry_path(path, compiler))
+
+    def load(self, path: str, compiler: str):
+        """
+        Get the parsed circuit of a benchmark, parsing and storing it on a miss.
+
+        :param path: path of the .qasm benchmark
+        :param compiler: name of the compiler
+        """
+        circuit = self.get(path, compiler)
+        if circuit is None:
+            circuit = parse_circuit(path, compiler)
+            self.put(path, compiler, circuit)
+        return circuit
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in
+        ``max_size_mib``.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(tuple(ENTRY_SUFFIXES.values())):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, name))
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, name in sorted(entries):
+            if size <= self.max_size_mib * 1024 * 1024:
+                break
+            self._remove(os.path.join(self.directory, name))
+            size -= entry_size
+
+    @staticmethod
+    def _remove(entry: str):
+        try:
+            os.remove(entry)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,658 @@
+"""
+This module stores the measurements of a results log in columns, one row per
+measured value, so that many sessions can be loaded and filtered for
+cross-run analytics without parsing their nested JSON.
+
+A store is a directory of uncompressed ``.npy`` columns, which are memory-
+mapped on load, next to a small ``dictionary.json`` naming the compilers,
+targets, benchmarks and metrics the integer columns refer to:
+
+* ``timestamp``: Unix time the value was logged at (NaN when unknown)
+* ``compiler``: index of the compiler, version and optimization level
+* ``target``: index of the target, -1 for a parsing/build_time, which every
+  target of the compiler shares
+* ``benchmark``, ``metric``: index of the benchmark and of the metric
+* ``run``: index of the run, or of the parse for a parsing/build_time
+* ``sample``: index of the value in its run, e.g. of an adaptive timing
+* ``value``: the measured value
+
+With pyarrow installed a store can also be a single Parquet file with the
+same rows and the names in place of the indices.
+
+The results entries of runner.py are derived from a store exactly, see
+build_results_from_store.
+
+Usage: python3 columnar_store.py SOURCE [OUTPUT] [--format {npy,parquet}]
+       python3 columnar_store.py STORE --to-json OUTPUT
+
+converts a results log, or a results file, to a store and a store back to a
+results file.
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from results_log import (
+    EXECUTION_KEY,
+    PARSE_METRIC,
+    aggregate_entries,
+    compiler_key,
+    import_results,
+    read_log,
+    results_from_records,
+    write_results,
+)
+
+DICTIONARY_FILE = "dictionary.json"
+
+COLUMNS = {
+    "timestamp": np.float64,
+    "compiler": np.int16,
+    "target": np.int16,
+    "benchmark": np.int32,
+    "metric": np.int16,
+    "run": np.int32,
+    "sample": np.int32,
+    "value": np.float64,
+}
+# Columns holding an index into the dictionary, and the list it indexes
+CATEGORIES = {
+    "compiler": "compilers",
+    "target": "targets",
+    "benchmark": "benchmarks",
+    "metric": "metrics",
+}
+# Filters on a field of the compiler dictionaries
+COMPILER_FIELDS = ("compiler", "version", "optimization_level")
+
+
+def store_path(results_path: str, store_format: str = "npy"):
+    """
+    :param results_path: path of a results file, e.g. results/results_run3.json
+    :param store_format: "npy" or "parquet"
+    :return: path of its store, e.g. results/columnar/results_run3
+    """
+    name = os.path.splitext(os.path.basename(results_path))[0]
+    if store_format == "parquet":
+        name += ".parquet"
+    return os.path.join(os.path.dirname(results_path), "columnar", name)
+
+
+class _Categories:
+    # Assigns consecutive indices to the values of a categorical column in
+    # the order they are first seen
+    def __init__(self, key=None):
+        self.values = []
+        self._indices = {}
+        self._key = key or (lambda value: value)
+
+    def index(self, value):
+        key = self._key(value)
+        if key not in self._indices:
+            self._indices[key] = len(self.values)
+            self.values.append(value)
+        return self._indices[key]
+
+
+def _timestamp(record: dict):
+    # Logs written before records were timestamped have no "time"
+    return record.get("time", np.nan)
+
+
+def columns_from_records(records: list):
+    """
+    Lay the records of a results log out in columns.
+
+    :param records: records as returned by results_log.read_log
+    :return: dictionary mapping column name to its array, and the dictionary
+        of the store with the "compilers", "targets", "benchmarks" and
+        "metrics" the columns refer to, the metrics whose values are all
+        integers ("integer_metrics") and the "sessions" of the log
+    """
+    compilers = _Categories(compiler_key)
+    targets = _Categories()
+    benchmarks = _Categories()
+    metrics = _Categories()
+    sessions = []
+    rows = {name: [] for name in COLUMNS}
+    non_integer = set()
+    parses = {}
+
+    def add_row(record, target, benchmark, metric, run, sample, value):
+        if not isinstance(value, int) or isinstance(value, bool):
+            non_integer.add(metric)
+        rows["timestamp"].append(_timestamp(record))
+        rows["compiler"].append(compilers.index(record["compiler"]))
+        rows["target"].append(target)
+        rows["benchmark"].append(benchmarks.index(benchmark))
+        rows["metric"].append(metrics.index(metric))
+        rows["run"].append(run)
+        rows["sample"].append(sample)
+        rows["value"].append(value)
+
+    for record in records:
+        if record["type"] == "session":
+            session = {
+                "compiler": compilers.index(record["compiler"]),
+                "targets": [targets.index(target) for target in record["targets"]],
+                "metrics": [metrics.index(metric) for metric in record["metrics"]],
+                "benchmarks": [
+                    benchmarks.index(benchmark) for benchmark in record["benchmarks"]
+                ],
+            }
+            if EXECUTION_KEY in record:
+                session[EXECUTION_KEY] = record[EXECUTION_KEY]
+            sessions.append(session)
+        elif record["type"] == "parse":
+            key = (compiler_key(record["compiler"]), record["benchmark"])
+            parses[key] = parses.get(key, -1) + 1
+            add_row(
+                record,
+                -1,
+                record["benchmark"],
+                PARSE_METRIC,
+                parses[key],
+                0,
+                record["seconds"],
+            )
+        elif record["type"] == "run":
+            target = targets.index(record["target"])
+            for metric, values in record["metrics"].items():
+                if not isinstance(values, list):
+                    values = [values]
+                for sample, value in enumerate(values):
+                    add_row(
+                        record,
+                        target,
+                        record["benchmark"],
+                        metric,
+                        record["run"],
+                        sample,
+                        value,
+                    )
+
+    columns = {
+        name: np.array(values, dtype=dtype).reshape(-1)
+        for (name, dtype), values in zip(COLUMNS.items(), rows.values())
+    }
+    dictionary = {
+        "compilers": compilers.values,
+        "targets": targets.values,
+        "benchmarks": benchmarks.values,
+        "metrics": metrics.values,
+        "integer_metrics": [
+            metric for metric in metrics.values if metric not in non_integer
+        ],
+        "sessions": sessions,
+    }
+    return columns, dictionary
+
+
+def _replace(temp_path: str, path: str):
+    # Swap the new store in, so that a reader never sees a partial one
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(temp_path, path)
+
+
+def write_store(records: list, path: str, store_format: str = "npy"):
+    """
+    Write the records of a results log to a store, replacing any store at
+    the path.
+
+    :param records: records as returned by results_log.read_log
+    :param path: path of the store directory, or of the Parquet file
+    :param store_format: "npy" or "parquet"
+    """
+    columns, dictionary = columns_from_records(records)
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    if store_format == "parquet":
+        _write_parquet(columns, dictionary, path)
+        return
+    temp_path = tempfile.mkdtemp(dir=parent, prefix=".store-")
+    try:
+        # mkdtemp makes the directory private to its owner
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_path, 0o777 & ~umask)
+        for name, column in columns.items():
+            np.save(os.path.join(temp_path, name + ".npy"), column)
+        with open(
+            os.path.join(temp_path, DICTIONARY_FILE), "w", encoding="utf-8"
+        ) as json_file:
+            json.dump(dictionary, json_file, indent=2)
+        _replace(temp_path, path)
+    except BaseException:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+
+
+def _import_pyarrow():
+    try:
+        # pylint: disable=import-outside-toplevel
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError(
+            "Parquet stores need pyarrow, install it with 'pip install pyarrow' "
+            "or use the npy format"
+        ) from error
+    return pyarrow
+
+
+def _write_parquet(columns, dictionary, path: str):
+    pyarrow = _import_pyarrow()
+    compilers = dictionary["compilers"]
+    targets = np.array(dictionary["targets"] + [""], dtype=object)
+    table = pyarrow.table(
+        {
+            "timestamp": columns["timestamp"],
+            **{
+                field: pyarrow.DictionaryArray.from_arrays(
+                    columns["compiler"],
+                    [str(compiler[field]) for compiler in compilers],
+                )
+                for field in COMPILER_FIELDS
+            },
+            # The parsing/build_time rows have an empty target
+            "target": pyarrow.array(targets[columns["target"]]).dictionary_encode(),
+            "benchmark": pyarrow.DictionaryArray.from_arrays(
+                columns["benchmark"], dictionary["benchmarks"]
+            ),
+            "metric": pyarrow.DictionaryArray.from_arrays(
+                columns["metric"], dictionary["metrics"]
+            ),
+            "run": columns["run"],
+            "sample": columns["sample"],
+            "value": columns["value"],
+        }
+    )
+    table = table.replace_schema_metadata(
+        {"red_queen": json.dumps(dictionary).encode("utf-8")}
+    )
+    temp_path = path + ".tmp"
+    pyarrow.parquet.write_table(table, temp_path)
+    os.replace(temp_path, path)
+
+
+class Measurements:
+    """
+    Rows of a store, as a dictionary of ``columns`` laid out like COLUMNS and
+    the ``dictionary`` their categorical columns index into.
+    """
+
+    def __init__(self, columns: dict, dictionary: dict):
+        self.columns = columns
+        self.dictionary = dictionary
+
+    def __len__(self):
+        return len(self.columns["value"])
+
+    def __getitem__(self, name: str):
+        return self.columns[name]
+
+    def decode(self, name: str):
+        """
+        :param name: a categorical column, or one of the fields "version" and
+            "optimization_level" of the compilers
+        :return: array with the name (or field) of every row; the target of a
+            parsing/build_time is ""
+        """
+        if name in COMPILER_FIELDS:
+            names = [compiler[name] for compiler in self.dictionary["compilers"]]
+            return np.array(names, dtype=object)[self.columns["compiler"]]
+        names = self.dictionary[CATEGORIES[name]]
+        # Index -1 picks the trailing "" of a target-less row
+        return np.array(names + [""], dtype=object)[self.columns[name]]
+
+
+def _as_set(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set)):
+        return set(value)
+    return {value}
+
+
+def _allowed(dictionary: dict, filters: dict):
+    # Boolean lookup tables of the indices every categorical column may hold,
+    # with an extra trailing slot for index -1
+    allowed = {}
+    compilers = dictionary["compilers"]
+    wanted = {field: _as_set(filters.get(field)) for field in COMPILER_FIELDS}
+    if any(values is not None for values in wanted.values()):
+        allowed["compiler"] = np.array(
+            [
+                # Compared as strings, so that 3 and "3" both pick O3
+                all(
+                    values is None
+                    or str(compiler[field]) in {str(value) for value in values}
+                    for field, values in wanted.items()
+                )
+                for compiler in compilers
+            ]
+            + [False]
+        )
+    for column, key in (
+        ("target", "targets"),
+        ("benchmark", "benchmarks"),
+        ("metric", "metrics"),
+    ):
+        values = _as_set(filters.get(column))
+        if values is None:
+            continue
+        names = dictionary[key]
+        if column == "metric":
+            # A metric may be named without its unit
+            keep = [name in values or name.split(" (")[0] in values for name in names]
+        else:
+            keep = [name in values for name in names]
+        # The parsing/build_times are shared by every target
+        allowed[column] = np.array(keep + [column == "target"])
+    return allowed
+
+
+def _filter(columns: dict, dictionary: dict, filters: dict):
+    masks = [
+        table[columns[column]]
+        for column, table in _allowed(dictionary, filters).items()
+    ]
+    if filters.get("since") is not None:
+        masks.append(columns["timestamp"] >= filters["since"])
+    if filters.get("until") is not None:
+        masks.append(columns["timestamp"] < filters["until"])
+    if not masks:
+        return columns
+    mask = np.logical_and.reduce(masks)
+    return {name: column[mask] for name, column in columns.items()}
+
+
+def load_store(path: str, **filters):
+    """
+    Load the rows of a store that pass the filters.
+
+    The columns of a npy store are memory-mapped, so only the columns the
+    filters test are read in full and only the matching rows of the others
+    are copied; without filters nothing is read until it is used. A Parquet
+    store is read with pyarrow, pushing the filters down to it.
+
+    :param path: path of the store
+    :param filters: any of "compiler", "version", "optimization_level",
+        "target", "benchmark" and "metric" (with or without its unit), each a
+        value or a list of values to keep, and "since" and "until", Unix
+        times bounding the timestamps. Filtering on the target keeps the
+        parsing/build_times, which every target shares.
+    :return: Measurements
+    """
+    if not os.path.isdir(path):
+        return _load_parquet(path, filters)
+    with open(os.path.join(path, DICTIONARY_FILE), "r", encoding="utf-8") as json_file:
+        dictionary = json.load(json_file)
+    columns = {
+        name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+        for name in COLUMNS
+    }
+    return Measurements(_filter(columns, dictionary, filters), dictionary)
+
+
+def _load_parquet(path: str, filters: dict):
+    pyarrow = _import_pyarrow()
+    metadata = pyarrow.parquet.read_schema(path).metadata
+    dictionary = json.loads(metadata[b"red_queen"])
+    # The exact matches are pushed down to the reader and the rest, like the
+    # metric names without their unit, is filtered on the indices afterwards
+    pushed = [
+        (field, "in", [str(value) for value in _as_set(filters[field])])
+        for field in COMPILER_FIELDS + ("benchmark",)
+        if filters.get(field) is not None
+    ]
+    if filters.get("since") is not None:
+        pushed.append(("timestamp", ">=", filters["since"]))
+    if filters.get("until") is not None:
+        pushed.append(("timestamp", "<", filters["until"]))
+    table = pyarrow.parquet.read_table(path, filters=pushed or None, memory_map=True)
+    compilers = {
+        tuple(str(compiler[field]) for field in COMPILER_FIELDS): index
+        for index, compiler in enumerate(dictionary["compilers"])
+    }
+    indices = {
+        column: {name: index for index, name in enumerate(dictionary[key])}
+        for column, key in CATEGORIES.items()
+        if column != "compiler"
+    }
+    indices["target"][""] = -1
+
+    def encode(column, lookup):
+        values = table.column(column).to_pylist()
+        return np.array([lookup[value] for value in values], dtype=COLUMNS[column])
+
+    compiler_fields = zip(
+        *(table.column(field).to_pylist() for field in COMPILER_FIELDS)
+    )
+    columns = {
+        "compiler": np.array(
+            [compilers[fields] for fields in compiler_fields],
+            dtype=COLUMNS["compiler"],
+        ),
+        **{column: encode(column, lookup) for column, lookup in indices.items()},
+        **{
+            column: table.column(column).to_numpy().astype(COLUMNS[column])
+            for column in ("timestamp", "run", "sample", "value")
+        },
+    }
+    columns = {name: columns[name] for name in COLUMNS}
+    return Measurements(_filter(columns, dictionary, filters), dictionary)
+
+
+def load_stores(paths: list, **filters):
+    """
+    Load the rows of many stores that pass the filters, e.g. to chart the
+    trend of a metric over months of sessions.
+
+    :param paths: paths of the stores
+    :param filters: filters, see load_store
+    :return: Measurements of the rows of every store, with one dictionary
+        merging the names of every store
+    """
+    compilers = _Categories(compiler_key)
+    names = {key: _Categories() for key in CATEGORIES.values() if key != "compilers"}
+    parts = []
+    non_integer = set()
+    for path in paths:
+        measurements = load_store(path, **filters)
+        dictionary = measurements.dictionary
+        remapped = dict(measurements.columns)
+        remapped["compiler"] = np.array(
+            [compilers.index(compiler) for compiler in dictionary["compilers"]],
+            dtype=COLUMNS["compiler"],
+        )[measurements["compiler"]]
+        for column, key in CATEGORIES.items():
+            if column == "compiler":
+                continue
+            # The trailing -1 keeps the target-less rows target-less
+            lookup = np.array(
+                [names[key].index(name) for name in dictionary[key]] + [-1],
+                dtype=COLUMNS[column],
+            )
+            remapped[column] = lookup[measurements[column]]
+        parts.append(remapped)
+        non_integer |= set(dictionary["metrics"]) - set(dictionary["integer_metrics"])
+    columns = {
+        name: np.concatenate([part[name] for part in parts])
+        if parts
+        else np.empty(0, dtype=dtype)
+        for name, dtype in COLUMNS.items()
+    }
+    dictionary = {
+        "compilers": compilers.values,
+        **{key: categories.values for key, categories in names.items()},
+        "integer_metrics": [
+            metric for metric in names["metrics"].values if metric not in non_integer
+        ],
+        "sessions": [],
+    }
+    return Measurements(columns, dictionary)
+
+
+def records_from_store(measurements: Measurements):
+    """
+    Rebuild the records of the results log a store was written from.
+
+    :param measurements: every row of a store, as loaded without filters
+    :return: list of records, see results_log.read_log
+    """
+    dictionary = measurements.dictionary
+    compilers = dictionary["compilers"]
+    targets = dictionary["targets"]
+    benchmarks = dictionary["benchmarks"]
+    metrics = dictionary["metrics"]
+    integer_metrics = {
+        metrics.index(metric) for metric in dictionary["integer_metrics"]
+    }
+    records = []
+    for session in dictionary["sessions"]:
+        record = {
+            "type": "session",
+            "compiler": compilers[session["compiler"]],
+            "targets": [targets[target] for target in session["targets"]],
+            "metrics": [metrics[metric] for metric in session["metrics"]],
+            "benchmarks": [
+                benchmarks[benchmark] for benchmark in session["benchmarks"]
+            ],
+        }
+        if EXECUTION_KEY in session:
+            record[EXECUTION_KEY] = session[EXECUTION_KEY]
+        records.append(record)
+
+    columns = {
+        name: np.asarray(column) for name, column in measurements.columns.items()
+    }
+    order = np.lexsort(
+        (
+            columns["sample"],
+            columns["run"],
+            columns["benchmark"],
+            columns["target"],
+            columns["compiler"],
+        )
+    )
+    runs = {}
+    for row in order:
+        compiler, target, benchmark, metric, run = (
+            int(columns[name][row])
+            for name in ("compiler", "target", "benchmark", "metric", "run")
+        )
+        value = columns["value"][row].item()
+        if metric in integer_metrics:
+            value = int(value)
+        if target < 0:
+            records.append(
+                {
+                    "type": "parse",
+                    "compiler": compilers[compiler],
+                    "benchmark": benchmarks[benchmark],
+                    "seconds": value,
+                }
+            )
+            continue
+        key = (compiler, target, benchmark, run)
+        if key not in runs:
+            runs[key] = {
+                "type": "run",
+                "compiler": compilers[compiler],
+                "target": targets[target],
+                "benchmark": benchmarks[benchmark],
+                "run": run,
+                "metrics": {},
+            }
+            records.append(runs[key])
+        run_metrics = runs[key]["metrics"]
+        name = metrics[metric]
+        if name in run_metrics:
+            if not isinstance(run_metrics[name], list):
+                run_metrics[name] = [run_metrics[name]]
+            run_metrics[name].append(value)
+        else:
+            run_metrics[name] = value
+    return records
+
+
+def build_results_from_store(path: str):
+    """
+    Build the aggregated results entries of a store, the same as
+    results_log.build_results builds from the log it was written from.
+
+    :param path: path of the store
+    :return: list of results entries with their "aggregate" statistics
+    """
+    return aggregate_entries(results_from_records(records_from_store(load_store(path))))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a results log or file to a columnar store, or back."
+    )
+    parser.add_argument(
+        "source",
+        help="path of a results log (.jsonl) or results file (.json) to convert, "
+        "or of a store with --to-json",
+    )
+    parser.add_argument(
+        "output",
+        nargs="?",
+        default=None,
+        help="path of the store, results/columnar/<name> by default",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["npy", "parquet"],
+        default="npy",
+        help="npy columns (default) or a Parquet file, which needs pyarrow",
+    )
+    parser.add_argument(
+        "--to-json",
+        default=None,
+        metavar="OUTPUT",
+        help="derive the results file of the store SOURCE and write it to OUTPUT",
+    )
+    args = parser.parse_args()
+
+    if args.to_json:
+        write_results(build_results_from_store(args.source), args.to_json)
+        print(f"Results saved to: {args.to_json}")
+        return
+
+    if args.source.endswith(".jsonl"):
+        records = read_log(args.source)
+        name = os.path.basename(args.source)[: -len(".jsonl")] + ".json"
+        results_path = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(args.source))), name
+        )
+    else:
+        # A results file is converted through the log it would have had
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_log = os.path.join(temp_dir, "results.jsonl")
+            import_results(args.source, temp_log)
+            records = read_log(temp_log)
+        results_path = args.source
+    output = args.output or store_path(results_path, args.format)
+    write_store(records, output, args.format)
+    print(f"Store saved to: {output}")
+
+
+if __name__ == "__main__":
+    main()
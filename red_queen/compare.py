@@ -0,0 +1,394 @@
+"""
+This module compares two sets of benchmark results, e.g. the same suite run
+with two releases of a compiler, and detects performance regressions.
+
+The results entries of the baseline and of the candidate are aligned on their
+targets and benchmarks. For every metric compared, the raw samples of every
+benchmark are compared with a two-sided Mann-Whitney U test and the ratio of
+the medians, ``baseline / candidate``, is reported as the speedup (below 1
+the candidate is slower, or deeper, or uses more memory). The speedups of a
+target are summarized by their geometric mean.
+
+A benchmark regresses when the candidate is significantly worse (p-value
+below ``--alpha``) by more than ``--threshold`` of the baseline; a target
+regresses when the geometric mean of its speedups is worse by more than
+``--threshold``. The exit status is 1 if anything regressed, so the
+comparison can gate a compiler upgrade in a pipeline.
+
+A measured metric, like the transpile time, with fewer than two samples on
+either side cannot be tested: its comparison is reported as inconclusive,
+and a benchmark is then a regression whenever its candidate is worse by more
+than ``--threshold``. The geometric means gate as usual. When nothing
+regressed but some comparisons are inconclusive, the exit status is 2. Run
+more runs, or use adaptive timing, to test such metrics.
+
+Usage: python3 compare.py BASELINE [CANDIDATE] [--metric NAME ...]
+
+With a single results file, holding the two compilers of a second-compiler
+session, the first compiler is the baseline and the second the candidate.
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import argparse
+import json
+import numbers
+import sys
+
+import numpy as np
+from scipy import stats
+
+from results_log import compiler_key
+
+DEFAULT_METRICS = ["transpile_time (seconds)"]
+DEFAULT_THRESHOLD = 0.05
+DEFAULT_ALPHA = 0.05
+
+# Keys of a results entry that are not benchmarks
+ENTRY_KEYS = ("metadata: ", "backend")
+
+
+def load_entries(path: str):
+    """
+    :param path: path of a results file
+    :return: list of its results entries
+    """
+    with open(path, "r", encoding="utf-8") as json_file:
+        return json.load(json_file)
+
+
+def split_compilers(entries: list):
+    """
+    Group results entries by compiler.
+
+    :param entries: list of results entries
+    :return: list of the entries of every compiler, in the order the
+        compilers first appear
+    """
+    compilers = {}
+    for entry in entries:
+        compilers.setdefault(compiler_key(entry["metadata: "]), []).append(entry)
+    return list(compilers.values())
+
+
+def resolve_metric(name: str, benchmark_data: dict):
+    """
+    :param name: a metric name, with or without its unit, e.g.
+        "transpile_time" or "transpile_time (seconds)"
+    :param benchmark_data: dictionary mapping metric name to its values
+    :return: the full name of the metric in the benchmark, ``None`` if it has
+        no such metric
+    """
+    for metric in benchmark_data:
+        if name in (metric, metric.split(" (")[0]):
+            return metric
+    return None
+
+
+def is_exact(values: list):
+    """
+    :param values: values of a metric
+    :return: whether the metric is an integer count, like the depth, which a
+        deterministic compiler reproduces exactly on every run
+    """
+    return all(
+        isinstance(value, numbers.Integral) and not isinstance(value, bool)
+        for value in values
+    )
+
+
+def compare_samples(baseline: list, candidate: list, exact: bool = False):
+    """
+    Compare the samples of a metric of a benchmark.
+
+    When an exact metric varies on neither side, the test has nothing to
+    measure and any difference of the medians is taken as exact, with a
+    p-value of 0. Otherwise a side with fewer than two samples leaves the
+    comparison inconclusive, with no p-value.
+
+    :param baseline: values of the metric in the baseline
+    :param candidate: values of the metric in the candidate
+    :param exact: whether the metric is exact, see is_exact
+    :return: dictionary with the "baseline_median", "candidate_median",
+        "speedup" (``None`` if a median is not positive), the Mann-Whitney
+        "u_statistic" and "p_value" (``None`` when not tested), whether the
+        comparison is "inconclusive", and the number of samples of each side
+    """
+    baseline = np.asarray(baseline, dtype=float)
+    candidate = np.asarray(candidate, dtype=float)
+    baseline_median = float(np.median(baseline))
+    candidate_median = float(np.median(candidate))
+    u_statistic = None
+    p_value = None
+    if exact and np.ptp(baseline) == 0 and np.ptp(candidate) == 0:
+        p_value = 1.0 if baseline_median == candidate_median else 0.0
+    elif len(baseline) >= 2 and len(candidate) >= 2:
+        test = stats.mannwhitneyu(baseline, candidate, alternative="two-sided")
+        u_statistic = float(test.statistic)
+        # Samples that are all equal give no p-value
+        p_value = 1.0 if np.isnan(test.pvalue) else float(test.pvalue)
+    speedup = None
+    if baseline_median > 0 and candidate_median > 0:
+        speedup = baseline_median / candidate_median
+    return {
+        "baseline_median": baseline_median,
+        "candidate_median": candidate_median,
+        "speedup": speedup,
+        "u_statistic": u_statistic,
+        "p_value": p_value,
+        "inconclusive": p_value is None,
+        "baseline_samples": len(baseline),
+        "candidate_samples": len(candidate),
+    }
+
+
+def geometric_mean(ratios: list):
+    """
+    :param ratios: positive ratios
+    :return: their geometric mean, ``None`` if there are none
+    """
+    if not ratios:
+        return None
+    return float(np.exp(np.mean(np.log(ratios))))
+
+
+def compare_entries(
+    baseline_entries: list,
+    candidate_entries: list,
+    metrics: list = None,
+    threshold: float = DEFAULT_THRESHOLD,
+    alpha: float = DEFAULT_ALPHA,
+):
+    """
+    Compare the results entries of a baseline and of a candidate compiler.
+
+    Only the targets, benchmarks and metrics present on both sides are
+    compared.
+
+    :param baseline_entries: results entries of the baseline
+    :param candidate_entries: results entries of the candidate
+    :param metrics: names of the metrics to compare, with or without their
+        unit
+    :param threshold: relative slowdown above which a difference is a
+        regression, e.g. 0.05 for 5%
+    :param alpha: significance level of the Mann-Whitney U tests
+    :return: comparison report, a dictionary with the "baseline" and
+        "candidate" compiler info, the "threshold" and "alpha", the list of
+        per-benchmark "comparisons", the per-target and per-metric
+        "summaries" with the geometric mean of the speedups and the number
+        of "inconclusive" comparisons it includes, the number of
+        "inconclusive" comparisons, and whether anything "regressed"; an
+        inconclusive comparison regresses whenever its candidate is worse by
+        more than the threshold
+    """
+    metrics = metrics or DEFAULT_METRICS
+    # A speedup below this is a slowdown by more than the threshold
+    limit = 1 / (1 + threshold)
+    candidates = {entry["backend"]: entry for entry in candidate_entries}
+    comparisons = []
+    summaries = []
+    for baseline_entry in baseline_entries:
+        target = baseline_entry["backend"]
+        candidate_entry = candidates.get(target)
+        if candidate_entry is None:
+            continue
+        benchmarks = [
+            name
+            for name in baseline_entry
+            if name not in ENTRY_KEYS and name in candidate_entry
+        ]
+        for name in metrics:
+            speedups = []
+            inconclusive = 0
+            metric = name
+            for benchmark in benchmarks:
+                baseline_data = baseline_entry[benchmark]
+                candidate_data = candidate_entry[benchmark]
+                full_name = resolve_metric(name, baseline_data)
+                if (
+                    full_name is None
+                    or not baseline_data[full_name]
+                    or not candidate_data.get(full_name)
+                ):
+                    continue
+                metric = full_name
+                comparison = compare_samples(
+                    baseline_data[metric],
+                    candidate_data[metric],
+                    exact=is_exact(baseline_data[metric] + candidate_data[metric]),
+                )
+                slower = comparison["candidate_median"] > comparison[
+                    "baseline_median"
+                ] * (1 + threshold)
+                # Without a test, the slowdown alone decides
+                comparison["regression"] = slower and (
+                    comparison["inconclusive"] or comparison["p_value"] < alpha
+                )
+                inconclusive += comparison["inconclusive"]
+                comparisons.append(
+                    {
+                        "backend": target,
+                        "benchmark": benchmark,
+                        "metric": metric,
+                        **comparison,
+                    }
+                )
+                if comparison["speedup"] is not None:
+                    speedups.append(comparison["speedup"])
+            geomean = geometric_mean(speedups)
+            if geomean is not None:
+                summaries.append(
+                    {
+                        "backend": target,
+                        "metric": metric,
+                        "benchmarks": len(speedups),
+                        "geomean_speedup": geomean,
+                        "inconclusive": inconclusive,
+                        "regression": geomean < limit,
+                    }
+                )
+    return {
+        "baseline": baseline_entries[0]["metadata: "],
+        "candidate": candidate_entries[0]["metadata: "],
+        "threshold": threshold,
+        "alpha": alpha,
+        "comparisons": comparisons,
+        "summaries": summaries,
+        "inconclusive": sum(comparison["inconclusive"] for comparison in comparisons),
+        "regressed": any(result["regression"] for result in comparisons + summaries),
+    }
+
+
+def _label(compiler_dict: dict):
+    return (
+        f"{compiler_dict['compiler']} {compiler_dict['version']} "
+        f"O{compiler_dict['optimization_level']}"
+    )
+
+
+def format_report(report: dict):
+    """
+    :param report: comparison report as returned by compare_entries
+    :return: table of the comparisons followed by the geometric means
+    """
+
+    def value(number, spec):
+        return "n/a" if number is None else format(number, spec)
+
+    lines = [
+        f"baseline:  {_label(report['baseline'])}",
+        f"candidate: {_label(report['candidate'])}",
+        "",
+        f"{'target':<12}{'benchmark':<28}{'metric':<26}{'baseline':>12}"
+        f"{'candidate':>12}{'speedup':>9}{'p-value':>10}",
+    ]
+    for comparison in report["comparisons"]:
+        lines.append(
+            f"{comparison['backend']:<12}{comparison['benchmark']:<28}"
+            f"{comparison['metric']:<26}{comparison['baseline_median']:>12.6g}"
+            f"{comparison['candidate_median']:>12.6g}"
+            f"{value(comparison['speedup'], '.3f'):>9}"
+            f"{value(comparison['p_value'], '.3g'):>10}"
+            + ("  REGRESSION" if comparison["regression"] else "")
+            + ("  inconclusive" if comparison["inconclusive"] else "")
+        )
+    lines.append("")
+    lines.append(f"{'target':<12}{'metric':<26}{'benchmarks':>11}{'geomean':>9}")
+    for summary in report["summaries"]:
+        lines.append(
+            f"{summary['backend']:<12}{summary['metric']:<26}"
+            f"{summary['benchmarks']:>11}{summary['geomean_speedup']:>9.3f}"
+            + ("  REGRESSION" if summary["regression"] else "")
+            + ("  inconclusive" if summary["inconclusive"] else "")
+        )
+    if report["inconclusive"]:
+        lines.append("")
+        lines.append(
+            f"{report['inconclusive']} of {len(report['comparisons'])} comparisons are "
+            "inconclusive: they have fewer than 2 samples on a side, rerun with "
+            "more runs or --adaptive to test them"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare two sets of benchmark results and detect regressions."
+    )
+    parser.add_argument("baseline", help="path of the results file of the baseline")
+    parser.add_argument(
+        "candidate",
+        nargs="?",
+        default=None,
+        help="path of the results file of the candidate; without it the baseline "
+        "file must hold two compilers, the first being the baseline",
+    )
+    parser.add_argument(
+        "--metric",
+        action="append",
+        dest="metrics",
+        default=None,
+        help="metric to compare, with or without its unit (repeatable), "
+        "transpile_time by default",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="relative slowdown that counts as a regression, 0.05 by default",
+    )
+    parser.add_argument(
+        "--alpha",
+        type=float,
+        default=DEFAULT_ALPHA,
+        help="significance level of the Mann-Whitney U tests, 0.05 by default",
+    )
+    parser.add_argument(
+        "--output", default=None, help="path of a JSON file to save the report to"
+    )
+    args = parser.parse_args()
+
+    if args.candidate is None:
+        compilers = split_compilers(load_entries(args.baseline))
+        if len(compilers) != 2:
+            parser.error(
+                f"{args.baseline} holds {len(compilers)} compilers, "
+                "give a candidate results file"
+            )
+        baseline_entries, candidate_entries = compilers[0], compilers[1]
+    else:
+        baseline_compilers = split_compilers(load_entries(args.baseline))
+        candidate_compilers = split_compilers(load_entries(args.candidate))
+        if len(baseline_compilers) != 1 or len(candidate_compilers) != 1:
+            parser.error("each results file must hold a single compiler")
+        baseline_entries = baseline_compilers[0]
+        candidate_entries = candidate_compilers[0]
+
+    report = compare_entries(
+        baseline_entries,
+        candidate_entries,
+        args.metrics,
+        args.threshold,
+        args.alpha,
+    )
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as json_file:
+            json.dump(report, json_file, indent=2)
+        print(f"Comparison saved to: {args.output}")
+    if report["regressed"]:
+        print("Regression detected")
+        sys.exit(1)
+    if report["inconclusive"]:
+        print("Inconclusive comparisons, no regression detected")
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+This module is the long-lived worker an Orchestrator runs in the virtual
+environment of a compiler version. It imports the compilers once and then
+serves parse and compile requests until it is told to stop.
+
+The worker talks to the orchestrator over its standard input and output, one
+JSON object per line. Anything else the worker prints goes to its standard
+error. Once started it sends::
+
+    {"ready": true, "pid": ..., "python": "3.11.7", "versions": {...}, "execution": {...}}
+
+where "execution" holds its effective CPUs and thread settings (see
+pinning.execution_settings), and then answers every request, in order, with
+a reply carrying the "id" of the request::
+
+    {"id": 1, "op": "parse", "path": ..., "compiler": ..., "circuit_cache_mib": ...}
+    {"id": 2, "op": "compile", "task": {...}}
+    {"id": 3, "op": "stop"}
+
+    {"id": 1, "ok": true, "result": {"seconds": ...}, "rss": ...}
+    {"id": 2, "ok": false, "error": "...", "traceback": "...", "rss": ...}
+
+A "parse" request times the parse of a benchmark and stores the circuit in
+the circuit cache for the compile requests. A "compile" request runs a task
+of runner.run_task, whose "target" is the name of the target and "timing"
+the keyword arguments of its TimingHarness. "rss" is the resident set size
+of the worker in MiB after the request, for the orchestrator to recycle
+workers that grow. "stop" is not answered.
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import json
+import os
+import platform
+import sys
+import traceback
+
+# The compilers, and the modules importing them, are imported once main has
+# moved the standard output away from the protocol, so that anything they
+# print while loading cannot corrupt it
+
+
+def parse(request: dict):
+    """
+    :param request: "parse" request
+    :return: dictionary with the parsing/build_time of the benchmark
+    """
+    from circuit_cache import DEFAULT_CACHE_SIZE_MIB, CircuitCache
+    from runner import time_parse
+
+    circuit, seconds = time_parse(request["path"], request["compiler"])
+    cache_mib = request.get("circuit_cache_mib", DEFAULT_CACHE_SIZE_MIB)
+    if cache_mib:
+        circuit_cache = CircuitCache(max_size_mib=cache_mib)
+        if not circuit_cache.contains(request["path"], request["compiler"]):
+            circuit_cache.put(request["path"], request["compiler"], circuit)
+    return {"seconds": seconds}
+
+
+def compile_task(request: dict):
+    """
+    :param request: "compile" request
+    :return: the result of runner.run_task
+    """
+    from circuit_cache import DEFAULT_CACHE_SIZE_MIB
+    from runner import run_task, target_spec
+    from timing import TimingHarness
+
+    task = dict(request["task"])
+    task["target"] = target_spec(task["target"])
+    task["timing"] = TimingHarness(**task["timing"])
+    task["circuit_cache_mib"] = (
+        task.get("circuit_cache_mib", DEFAULT_CACHE_SIZE_MIB) or None
+    )
+    return run_task(task)
+
+
+HANDLERS = {"parse": parse, "compile": compile_task}
+
+
+def serve(requests, replies):
+    """
+    Answer requests until a "stop" request or the end of the input.
+
+    :param requests: text stream the requests are read from
+    :type requests: io.TextIOBase
+    :param replies: text stream the replies are written to
+    :type replies: io.TextIOBase
+    """
+    # pylint: disable=import-error
+    from memory_profiler import memory_usage
+
+    from results_log import to_builtin
+
+    for line in requests:
+        request = json.loads(line)
+        if request["op"] == "stop":
+            break
+        reply = {"id": request.get("id")}
+        try:
+            reply["result"] = HANDLERS[request["op"]](request)
+            reply["ok"] = True
+        except Exception as ex:  # pylint: disable=broad-except
+            reply["ok"] = False
+            reply["error"] = repr(ex)
+            reply["traceback"] = traceback.format_exc()
+        reply["rss"] = memory_usage(max_usage=True)
+        replies.write(json.dumps(reply, default=to_builtin) + "\n")
+        replies.flush()
+
+
+def main():
+    # Keep the protocol on the original standard output and send everything
+    # else printed, by Python or native code, to standard error
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+    from circuit_cache import COMPILER_VERSIONS
+    from pinning import execution_settings
+
+    replies.write(
+        json.dumps(
+            {
+                "ready": True,
+                "pid": os.getpid(),
+                "python": platform.python_version(),
+                "versions": COMPILER_VERSIONS,
+                "execution": execution_settings(),
+            }
+        )
+        + "\n"
+    )
+    replies.flush()
+    serve(sys.stdin, replies)
+
+
+if __name__ == "__main__":
+    main()
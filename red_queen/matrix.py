@@ -0,0 +1,464 @@
+"""
+This module runs a benchmark matrix described by a declarative spec, without
+the questions of run.sh: every combination of compiler, version,
+optimization level, target and benchmark is measured, for any number of
+compilers and versions, so that the suite can run on headless batch machines.
+
+The spec is a TOML (or, with PyYAML installed, YAML; or JSON) file such as::
+
+    runs = 5
+    targets = ["heavy_hex", "linear"]
+    optimization_levels = [1, 3]
+    benchmarks = ["qft_*", "adder_*"]
+
+    [[compilers]]
+    name = "qiskit"
+    versions = ["1.0.2", "1.1.0"]
+
+    [[compilers]]
+    name = "pytket"
+    versions = ["1.27.0"]
+    optimization_levels = [2]
+
+    [runner]
+    jobs = 4
+
+The matrix is expanded into one group per (compiler, version), whose work
+queue holds one session per optimization level. Set-up is shared along every
+dimension rather than paid per combination: the virtual environment of a
+group is created and entered once, by running the group in a process of its
+interpreter; the sessions of a group share one pool of worker processes,
+which keep their compiler imports and built backends, and the parse of every
+benchmark, loaded from the circuit cache by the other optimization levels;
+and every session compiles each parsed benchmark for all the targets.
+
+The groups run one after the other, or with ``--concurrent`` at the same
+time, each in a long-lived worker of its environment driven by an
+Orchestrator. All the sessions add their runs to the log of a single results
+file, so an interrupted matrix is finished by running it again with
+``--results``.
+
+Usage: python3 matrix.py SPEC [--results RESULTS] [--dry-run] [--concurrent]
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from orchestrator import Orchestrator, same_version
+from pinning import cpu_slots, thread_environment
+from results_log import next_results_path
+
+COMPILERS = ("qiskit", "pytket")
+TARGETS = ("heavy_hex", "all_to_all", "linear")
+ENVIRONMENTS = ("venv", "current")
+VENV_DIR = os.path.join(os.path.dirname(__file__), "virtual_environments")
+# Packages installed in every virtual environment besides the compilers
+VENV_PACKAGES = ["memory_profiler", "numpy", "scipy", "psutil"]
+
+# Runner keyword arguments that can be set in the [runner] table of a spec
+RUNNER_OPTIONS = (
+    "jobs",
+    "max_tasks_per_worker",
+    "max_rss_growth_mib",
+    "persist_backends",
+    "verify_depth",
+    "circuit_cache_mib",
+    "measure_parse",
+    "prefetch",
+    "memory_timeline",
+    "columnar",
+    "pass_timing",
+    "profile",
+    "profile_benchmarks",
+    "profile_dir",
+    "threads",
+    "pin_cpus",
+)
+# TimingHarness keyword arguments that can be set in the [timing] table
+TIMING_OPTIONS = (
+    "warmup",
+    "disable_gc",
+    "adaptive",
+    "target_rel_ci",
+    "budget",
+    "max_samples",
+)
+# Runner options holding paths, resolved against the directory of the spec
+PATH_OPTIONS = ("memory_timeline", "profile_dir")
+
+
+def read_spec_file(path: str):
+    """
+    :param path: path of a .toml, .yaml/.yml or .json spec
+    :return: the parsed spec
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".toml":
+        try:
+            import tomllib  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            try:
+                import tomli as tomllib  # pylint: disable=import-outside-toplevel
+            except ImportError as error:
+                raise ImportError(
+                    "Reading a TOML spec before Python 3.11 needs tomli, "
+                    "install it with: pip install tomli"
+                ) from error
+        with open(path, "rb") as spec_file:
+            return tomllib.load(spec_file)
+    if extension in (".yaml", ".yml"):
+        try:
+            import yaml  # pylint: disable=import-outside-toplevel
+        except ImportError as error:
+            raise ImportError(
+                "Reading a YAML spec needs PyYAML, install it with: pip install pyyaml"
+            ) from error
+        with open(path, "r", encoding="utf-8") as spec_file:
+            return yaml.safe_load(spec_file)
+    if extension == ".json":
+        with open(path, "r", encoding="utf-8") as spec_file:
+            return json.load(spec_file)
+    raise ValueError(f"Unknown spec format {extension}, expected .toml, .yaml or .json")
+
+
+def _as_list(value, name: str):
+    if not isinstance(value, list) or not value:
+        raise ValueError(f"{name} must be a non-empty list")
+    return value
+
+
+def _optimization_levels(value, name: str):
+    levels = _as_list(value, name)
+    for level in levels:
+        if not isinstance(level, int) or isinstance(level, bool) or level < 0:
+            raise ValueError(f"{name} must hold non-negative integers, got {level!r}")
+    return levels
+
+
+def _options(table, allowed, name: str):
+    table = table or {}
+    unknown = sorted(set(table) - set(allowed))
+    if unknown:
+        raise ValueError(
+            f"Unknown {name} options {unknown}, expected some of {list(allowed)}"
+        )
+    return dict(table)
+
+
+def load_spec(path: str):
+    """
+    Read and validate a matrix spec. Relative paths in it are resolved
+    against the directory of the spec.
+
+    :param path: path of the spec
+    :return: the spec with its defaults filled in: "runs", "targets",
+        "benchmarks" (``None`` for every benchmark), "benchmark_dir",
+        "results", "environment", "compilers" (each with its "name",
+        "versions" and "optimization_levels"), "runner" and "timing"
+    """
+    spec = read_spec_file(path)
+    if not isinstance(spec, dict):
+        raise ValueError(f"{path} does not hold a table")
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    def resolve(value):
+        if value is None:
+            return None
+        return os.path.join(base_dir, os.path.expanduser(value))
+
+    runs = spec.get("runs", 1)
+    if not isinstance(runs, int) or isinstance(runs, bool) or runs < 1:
+        raise ValueError(f"runs must be a positive integer, got {runs!r}")
+    targets = _as_list(spec.get("targets", list(TARGETS)), "targets")
+    for target in targets:
+        if target not in TARGETS:
+            raise ValueError(f"Unknown target {target!r}, expected one of {TARGETS}")
+    default_levels = spec.get("optimization_levels")
+    if default_levels is not None:
+        default_levels = _optimization_levels(default_levels, "optimization_levels")
+    benchmarks = spec.get("benchmarks")
+    if benchmarks is not None:
+        benchmarks = _as_list(benchmarks, "benchmarks")
+    environment = spec.get("environment", "venv")
+    if environment not in ENVIRONMENTS:
+        raise ValueError(
+            f"Unknown environment {environment!r}, expected one of {ENVIRONMENTS}"
+        )
+
+    compilers = []
+    for index, compiler in enumerate(_as_list(spec.get("compilers"), "compilers")):
+        name = compiler.get("name")
+        if name not in COMPILERS:
+            raise ValueError(
+                f"compilers[{index}] has unknown name {name!r}, "
+                f"expected one of {COMPILERS}"
+            )
+        levels = compiler.get("optimization_levels", default_levels)
+        if levels is None:
+            raise ValueError(
+                f"compilers[{index}] has no optimization_levels and the spec "
+                "sets no default"
+            )
+        compilers.append(
+            {
+                "name": name,
+                "versions": [
+                    str(version)
+                    for version in _as_list(
+                        compiler.get("versions"), f"compilers[{index}].versions"
+                    )
+                ],
+                "optimization_levels": _optimization_levels(
+                    levels, f"compilers[{index}].optimization_levels"
+                ),
+            }
+        )
+
+    runner_options = _options(spec.get("runner"), RUNNER_OPTIONS, "runner")
+    for option in PATH_OPTIONS:
+        if option in runner_options:
+            runner_options[option] = resolve(runner_options[option])
+    return {
+        "runs": runs,
+        "targets": targets,
+        "benchmarks": benchmarks,
+        "benchmark_dir": resolve(spec.get("benchmark_dir")),
+        "results": resolve(spec.get("results")),
+        "environment": environment,
+        "compilers": compilers,
+        "runner": runner_options,
+        "timing": _options(spec.get("timing"), TIMING_OPTIONS, "timing"),
+    }
+
+
+def expand_spec(spec: dict):
+    """
+    Expand a matrix spec into its groups, one per (compiler, version) in the
+    order of the spec, each with the work queue of its sessions.
+
+    :param spec: matrix spec as returned by load_spec
+    :return: list of dictionaries with the "compiler", "version" and
+        "sessions" of every group, a session being the compiler_dict of a
+        Runner
+    """
+    groups = []
+    for compiler in spec["compilers"]:
+        for version in compiler["versions"]:
+            groups.append(
+                {
+                    "compiler": compiler["name"],
+                    "version": version,
+                    "sessions": [
+                        {
+                            "compiler": compiler["name"],
+                            "version": version,
+                            "optimization_level": level,
+                        }
+                        for level in compiler["optimization_levels"]
+                    ],
+                }
+            )
+    return groups
+
+
+def environment_python(compiler: str, version: str):
+    """
+    Find the interpreter of the virtual environment of a compiler version,
+    creating the environment as run.sh does if it does not exist.
+
+    :param compiler: "qiskit" or "pytket"
+    :param version: version of the compiler to install
+    :return: path of the python of the environment
+    """
+    venv_path = os.path.join(VENV_DIR, f"venv_{compiler}_{version}")
+    python = os.path.join(venv_path, "bin", "python")
+    if os.path.exists(python):
+        print(f"Using existing virtual environment: {venv_path}")
+        return python
+    print(f"Creating virtual environment: {venv_path}")
+    subprocess.run([sys.executable, "-m", "venv", venv_path], check=True)
+    # Both compilers are needed to parse the benchmarks and build the backends
+    other = [name for name in COMPILERS if name != compiler]
+    subprocess.run(
+        [python, "-m", "pip", "install", "--quiet"]
+        + VENV_PACKAGES
+        + [f"{compiler}=={version}"]
+        + other,
+        check=True,
+    )
+    return python
+
+
+def run_group(spec: dict, group: dict, results_path: str):
+    """
+    Run the sessions of a group in this process, which must have the
+    compiler version of the group installed.
+
+    :param spec: matrix spec as returned by load_spec
+    :param group: group as returned by expand_spec
+    :param results_path: path of the results file every session adds its
+        runs to
+    :raises ValueError: if this process has another version of the compiler,
+        whose runs would be recorded under the version of the group
+    """
+    # pylint: disable=import-outside-toplevel
+    from circuit_cache import COMPILER_VERSIONS
+    from runner import Runner
+    from timing import TimingHarness
+    from worker_pool import WorkerPool
+
+    installed = COMPILER_VERSIONS[group["compiler"]]
+    if not same_version(group["version"], installed):
+        raise ValueError(
+            f"{group['compiler']} {group['version']} was requested, but "
+            f"{sys.executable} has {group['compiler']} {installed}"
+        )
+
+    options = dict(spec["runner"])
+    jobs = options.pop("jobs", 1)
+    threads = options.get("threads")
+    parse_times = {}
+    with WorkerPool(
+        jobs,
+        max_tasks_per_worker=options.get("max_tasks_per_worker"),
+        max_rss_growth_mib=options.get("max_rss_growth_mib", 64),
+        cpu_sets=cpu_slots(jobs, threads or 1) if options.get("pin_cpus") else None,
+        environment=thread_environment(threads) if threads else None,
+    ) as pool:
+        for compiler_dict in group["sessions"]:
+            print(
+                f"Running {compiler_dict['compiler']} {compiler_dict['version']} "
+                f"at optimization level {compiler_dict['optimization_level']}"
+            )
+            runner = Runner(
+                compiler_dict,
+                spec["targets"],
+                spec["runs"],
+                "false",
+                jobs=jobs,
+                benchmark_dir=spec["benchmark_dir"],
+                resume=results_path,
+                timing=TimingHarness(**spec["timing"]),
+                benchmarks=spec["benchmarks"],
+                worker_pool=pool,
+                parse_times=parse_times,
+                **options,
+            )
+            runner.run_benchmarks()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the benchmark matrix of a declarative spec."
+    )
+    parser.add_argument("spec", help="path of the .toml, .yaml or .json spec")
+    parser.add_argument(
+        "--results",
+        default=None,
+        help="results file to add the runs to, the one of the spec or a new "
+        "results/results_runN.json by default; the runs already in it are skipped",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="print the work queue without running it",
+    )
+    parser.add_argument(
+        "--concurrent",
+        action="store_true",
+        help="measure the compiler versions at the same time, each in one "
+        "long-lived worker of its environment",
+    )
+    parser.add_argument(
+        "--max-environments",
+        type=int,
+        default=None,
+        help="with --concurrent, largest number of environments measured at "
+        "once, all of them by default",
+    )
+    # Set by the parent process when it runs a group in its environment
+    parser.add_argument("--group", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    spec = load_spec(args.spec)
+    groups = expand_spec(spec)
+    results_path = os.path.abspath(
+        args.results or spec["results"] or next_results_path()
+    )
+
+    if args.group is not None:
+        run_group(spec, groups[args.group], results_path)
+        return
+
+    print(f"{len(groups)} compiler versions, results in {results_path}")
+    for group in groups:
+        levels = ", ".join(
+            str(session["optimization_level"]) for session in group["sessions"]
+        )
+        print(
+            f"  {group['compiler']} {group['version']}: optimization levels "
+            f"{levels} x targets {', '.join(spec['targets'])} x "
+            f"{spec['runs']} runs"
+        )
+    if args.dry_run:
+        return
+
+    failed = []
+    # Interpreter of the environment of every group that could be set up
+    pythons = {}
+    for index, group in enumerate(groups):
+        if spec["environment"] == "current":
+            pythons[index] = sys.executable
+            continue
+        try:
+            pythons[index] = environment_python(group["compiler"], group["version"])
+        except subprocess.CalledProcessError:
+            print(f"Could not set up {group['compiler']} {group['version']}")
+            failed.append(group)
+
+    if args.concurrent:
+        orchestrator = Orchestrator(
+            spec, groups, pythons, results_path, max_environments=args.max_environments
+        )
+        orchestrator.run()
+        failed.extend(orchestrator.failed)
+        if failed:
+            sys.exit(1)
+        return
+
+    for index, python in pythons.items():
+        group = groups[index]
+        command = [
+            python,
+            os.path.abspath(__file__),
+            os.path.abspath(args.spec),
+            "--results",
+            results_path,
+            "--group",
+            str(index),
+        ]
+        # The thread limits must be set before the group imports the compilers
+        environment = dict(os.environ)
+        if spec["runner"].get("threads"):
+            environment.update(thread_environment(spec["runner"]["threads"]))
+        if subprocess.run(command, env=environment, check=False).returncode != 0:
+            print(f"{group['compiler']} {group['version']} failed")
+            failed.append(group)
+    print(f"Results saved to: {results_path}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
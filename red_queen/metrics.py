@@ -0,0 +1,107 @@
+"""
+This module computes circuit metrics directly from the native output of the
+compilers, without dumping the compiled circuit to QASM and parsing it again.
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+from pytket.circuit import OpType
+
+from preprocessing import GATE_TABLE
+
+# QASM names of the pytket operations whose name is not simply the lowercase
+# OpType name
+TKET_QASM_NAMES = {
+    OpType.ZZPhase: "rzz",
+    OpType.XXPhase: "rxx",
+    OpType.YYPhase: "ryy",
+    OpType.noop: "id",
+}
+
+# QASM names of a pytket CnX by its number of qubits
+TKET_CNX_NAMES = {2: "cx", 3: "ccx", 4: "c3x", 5: "c4x"}
+
+
+def tket_op_name(op_type: OpType, num_qubits: int):
+    """
+    Get the name a pytket operation has in QASM.
+
+    :param op_type: type of the operation
+    :param num_qubits: number of qubits the operation acts on
+    """
+    if op_type == OpType.CnX:
+        return TKET_CNX_NAMES.get(num_qubits, "cnx")
+    return TKET_QASM_NAMES.get(op_type, op_type.name.lower())
+
+
+def qiskit_qubit_depths(circuit, gate_table: dict = None):
+    """
+    Count the gates acting on every qubit of a qiskit circuit.
+
+    Only gates whose QASM name is in ``gate_table`` count, like the QASM path
+    in Runner.get_qubit_depths, so measurements and barriers are ignored.
+
+    :param circuit: qiskit QuantumCircuit
+    :type circuit: QuantumCircuit
+    :param gate_table: gate table, defaults to preprocessing.GATE_TABLE
+    :return: dictionary mapping qubit index to number of gates
+    """
+    gate_table = GATE_TABLE if gate_table is None else gate_table
+    qubit_indices = {qubit: index for index, qubit in enumerate(circuit.qubits)}
+    qubit_depth = {}
+    for instruction in circuit.data:
+        if instruction.operation.name not in gate_table:
+            continue
+        for qubit in instruction.qubits:
+            index = qubit_indices[qubit]
+            qubit_depth[index] = qubit_depth.get(index, 0) + 1
+    return qubit_depth
+
+
+def tket_qubit_depths(circuit, gate_table: dict = None):
+    """
+    Count the gates acting on every qubit of a pytket circuit.
+
+    :param circuit: pytket Circuit
+    :type circuit: pytket.Circuit
+    :param gate_table: gate table, defaults to preprocessing.GATE_TABLE
+    :return: dictionary mapping qubit to number of gates
+    """
+    gate_table = GATE_TABLE if gate_table is None else gate_table
+    qubit_depth = {}
+    for command in circuit.get_commands():
+        qubits = command.qubits
+        if tket_op_name(command.op.type, len(qubits)) not in gate_table:
+            continue
+        for qubit in qubits:
+            qubit_depth[qubit] = qubit_depth.get(qubit, 0) + 1
+    return qubit_depth
+
+
+def circuit_depth(compiled_circuit, compiler: str, gate_table: dict = None):
+    """
+    Get the depth of a compiled circuit in a single pass over its operations.
+
+    The depth is the largest number of counted gates acting on any qubit, the
+    same measure Runner.get_circuit_depth computes from the QASM dump.
+
+    :param compiled_circuit: circuit produced by the compiler
+    :type compiled_circuit: QuantumCircuit or pytket.Circuit
+    :param compiler: name of the compiler, "qiskit" or "pytket"
+    :param gate_table: gate table, defaults to preprocessing.GATE_TABLE
+    :raises ValueError: if the compiler is not supported
+    :return: the depth, 0 for a circuit without counted gates
+    """
+    if compiler == "qiskit":
+        qubit_depth = qiskit_qubit_depths(compiled_circuit, gate_table)
+    elif compiler == "pytket":
+        qubit_depth = tket_qubit_depths(compiled_circuit, gate_table)
+    else:
+        raise ValueError(f"No native depth metric for compiler {compiler}")
+    return max(qubit_depth.values(), default=0)
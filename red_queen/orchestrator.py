@@ -0,0 +1,453 @@
+"""
+This module contains the Orchestrator class, which measures the compiler
+versions of a matrix spec concurrently.
+
+run.sh, and matrix.py by default, measure one virtual environment after the
+other. The Orchestrator starts one long-lived worker per environment instead,
+env_worker.py run by the interpreter of the environment, and sends it the
+parse and compile tasks of its compiler version over a pipe with the JSON
+protocol described in env_worker.py. The workers compile at the same time on
+separate cores, keeping their compiler imports, parsed circuits and built
+backends warm for their whole queue, so a comparison of versions takes about
+as long as its slowest version instead of the sum of all of them.
+
+Every worker measures its tasks one at a time, and the work queue of its
+environment is that of matrix.py: every benchmark is parsed once, then its
+runs are compiled for every optimization level and target. All the
+measurements are appended to the log of a single results file.
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import json
+import os
+import subprocess
+from multiprocessing.connection import wait
+
+from packaging.version import InvalidVersion, Version
+
+from columnar_store import store_path, write_store
+from pinning import cpu_slots, execution_metadata, launch_settings, thread_environment
+from results_log import (
+    ResultsLog,
+    build_results,
+    completed_runs,
+    import_results,
+    log_path,
+    read_log,
+    session_metrics,
+    total_time,
+    write_results,
+)
+from tasks import BENCHMARK_DIR, build_task, list_benchmarks
+
+ENV_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "env_worker.py")
+
+
+def same_version(requested: str, installed: str):
+    """
+    :param requested: version of a compiler in a matrix spec, e.g. "1.0"
+    :param installed: version of the compiler found in an environment
+    :return: whether they are the same release, e.g. "1.0" and "1.0.0"
+    """
+    try:
+        return Version(requested) == Version(installed)
+    except (InvalidVersion, TypeError):
+        return requested == installed
+
+
+class EnvWorkerError(RuntimeError):
+    """
+    Raised in the orchestrator when a task fails in an environment worker, or
+    the worker dies.
+    """
+
+
+class EnvWorker:
+    """
+    A long-lived env_worker.py process running in the virtual environment of
+    a compiler version.
+
+    Like the workers of a WorkerPool, it serves one request at a time and is
+    recycled (stopped and replaced by a fresh one) once it has served
+    ``max_tasks`` requests, or once its resident set size has grown by more
+    than ``max_rss_growth_mib`` over the size it had after its first request.
+    """
+
+    def __init__(
+        self,
+        python: str,
+        label: str,
+        max_tasks: int = None,
+        max_rss_growth_mib: float = None,
+        cpus=None,
+        environment: dict = None,
+    ):
+        """
+        :param python: interpreter of the environment
+        :param label: name of the worker in messages, e.g. "qiskit 1.0.2"
+        :param max_tasks: recycle the worker after this many requests,
+            ``None`` to never recycle on request count
+        :param max_rss_growth_mib: recycle the worker once its RSS has grown
+            by this many MiB since its first request, ``None`` to never
+            recycle on RSS
+        :param cpus: CPUs to pin the worker to, ``None`` to leave it unpinned
+        :param environment: dictionary of environment variables the worker is
+            started with, e.g. thread limits
+        """
+        self.python = python
+        self.label = label
+        self.max_tasks = max_tasks
+        self.max_rss_growth_mib = max_rss_growth_mib
+        self.cpus = cpus
+        self.environment = environment
+        self.recycled = 0
+        self.process = None
+        self.info = None
+        self.tasks_done = 0
+        self.baseline_rss = None
+        self._next_id = 0
+        self.start()
+
+    def start(self):
+        """
+        Start the worker process and wait until it has imported the compilers.
+        """
+        try:
+            # The worker is pinned and limited before it imports the compilers
+            with launch_settings(self.cpus, self.environment):
+                self.process = subprocess.Popen(  # pylint: disable=consider-using-with
+                    [self.python, ENV_WORKER],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    cwd=os.path.dirname(ENV_WORKER),
+                    text=True,
+                    encoding="utf-8",
+                )
+        except OSError as ex:
+            raise EnvWorkerError(f"Could not start the worker of {self.label}") from ex
+        try:
+            self.info = self._read()
+        except EnvWorkerError:
+            self.stop()
+            raise
+        self.tasks_done = 0
+        self.baseline_rss = None
+
+    def fileno(self):
+        """
+        :return: file descriptor the replies of the worker are read from, so
+            that a busy worker can be waited for with
+            multiprocessing.connection.wait
+        """
+        return self.process.stdout.fileno()
+
+    def send(self, request: dict):
+        """
+        Send a request to the worker, which must be idle.
+
+        :param request: request without its "id"
+        """
+        self._next_id += 1
+        self.process.stdin.write(json.dumps({**request, "id": self._next_id}) + "\n")
+        self.process.stdin.flush()
+
+    def receive(self):
+        """
+        Wait for the reply to the request sent last and apply the recycle
+        policy.
+
+        :return: the result of the request
+        """
+        reply = self._read()
+        if not reply["ok"]:
+            raise EnvWorkerError(
+                f"{reply['error']} raised in {self.label}:\n{reply['traceback']}"
+            )
+
+        self.tasks_done += 1
+        if self.baseline_rss is None:
+            self.baseline_rss = reply["rss"]
+        exhausted = self.max_tasks is not None and self.tasks_done >= self.max_tasks
+        grown = (
+            self.max_rss_growth_mib is not None
+            and reply["rss"] - self.baseline_rss > self.max_rss_growth_mib
+        )
+        if exhausted or grown:
+            self.recycled += 1
+            self.stop()
+            self.start()
+        return reply["result"]
+
+    def stop(self):
+        """
+        Stop the worker process.
+        """
+        try:
+            self.process.stdin.write(json.dumps({"op": "stop"}) + "\n")
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+
+    def _read(self):
+        line = self.process.stdout.readline()
+        if not line:
+            raise EnvWorkerError(f"The worker of {self.label} died")
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError as ex:
+            raise EnvWorkerError(
+                f"The worker of {self.label} sent {line!r} instead of a reply"
+            ) from ex
+
+
+class Orchestrator:
+    """
+    Measures every group of an expanded matrix spec in its own environment
+    worker, the workers running concurrently.
+    """
+
+    def __init__(
+        self,
+        spec: dict,
+        groups: list,
+        pythons: dict,
+        results_path: str,
+        max_environments: int = None,
+    ):
+        """
+        :param spec: matrix spec as returned by matrix.load_spec
+        :param groups: groups of the spec as returned by matrix.expand_spec
+        :param pythons: dictionary mapping the index in ``groups`` of every
+            group to measure to the interpreter of its environment
+        :param results_path: path of the results file every group adds its
+            runs to; the runs already in it are skipped
+        :param max_environments: largest number of environments measured at
+            once, every environment by default; with the pin_cpus option of
+            the spec, every one of them is pinned to its own ``threads`` (1 by
+            default) CPUs
+        """
+        self.spec = spec
+        self.groups = groups
+        self.pythons = pythons
+        self.results_path = results_path
+        self.max_environments = max_environments or len(pythons) or 1
+        self.options = spec["runner"]
+        self.threads = self.options.get("threads")
+        self.worker_environment = (
+            thread_environment(self.threads) if self.threads else None
+        )
+        # Every environment measured at once gets a slot of CPUs of its own
+        self.cpu_sets = None
+        if self.options.get("pin_cpus"):
+            self.cpu_sets = cpu_slots(self.max_environments, self.threads or 1)
+        self._free_slots = list(range(self.max_environments))
+        self.failed = []
+        self.results_log = None
+
+        benchmark_dir = spec["benchmark_dir"] or BENCHMARK_DIR
+        self.benchmark_paths = {
+            benchmark: os.path.join(benchmark_dir, benchmark)
+            for benchmark in list_benchmarks(benchmark_dir, spec["benchmarks"])
+        }
+
+    def work_queue(self, group: dict, records: list, execution: dict = None):
+        """
+        Generate the requests of a group, one at a time, receiving the result
+        of every request before generating the next one.
+
+        :param group: group as returned by matrix.expand_spec
+        :param records: records of the results log before this session, to
+            skip the runs it holds
+        :param execution: execution settings of the worker of the group, see
+            pinning.execution_metadata
+        :return: generator of requests to send to the worker of the group
+        """
+        measure_parse = self.options.get("measure_parse", True)
+        sessions = []
+        for compiler_dict in group["sessions"]:
+            self.results_log.log_session(
+                compiler_dict,
+                self.spec["targets"],
+                session_metrics(
+                    compiler_dict["compiler"],
+                    measure_parse=measure_parse,
+                    adaptive=self.spec["timing"].get("adaptive", False),
+                    pass_timing=self.options.get("pass_timing", False),
+                ),
+                self.benchmark_paths,
+                execution,
+            )
+            sessions.append((compiler_dict, completed_runs(records, compiler_dict)))
+
+        for benchmark, path in self.benchmark_paths.items():
+            pending = []
+            for compiler_dict, completed in sessions:
+                runs = [
+                    (target, run)
+                    for target in self.spec["targets"]
+                    for run in range(self.spec["runs"])
+                    if run not in completed.get((target, benchmark), set())
+                ]
+                if runs:
+                    pending.append((compiler_dict, runs))
+            if not pending:
+                continue
+
+            parse_time = None
+            if measure_parse:
+                request = {"op": "parse", "path": path, "compiler": group["compiler"]}
+                if "circuit_cache_mib" in self.options:
+                    request["circuit_cache_mib"] = self.options["circuit_cache_mib"]
+                parse_time = (yield request)["seconds"]
+                # The parse is shared by the optimization levels of the group
+                for compiler_dict, _ in pending:
+                    self.results_log.log_parse(compiler_dict, benchmark, parse_time)
+
+            for compiler_dict, runs in pending:
+                for target, run in runs:
+                    result = yield {
+                        "op": "compile",
+                        "task": self.make_task(compiler_dict, benchmark, target, run),
+                    }
+                    metrics = result["metrics"]
+                    if parse_time is not None:
+                        metrics["total_time (seconds)"] = total_time(
+                            metrics["transpile_time (seconds)"], parse_time
+                        )
+                    self.results_log.log_run(
+                        compiler_dict, target, benchmark, run, metrics
+                    )
+                    print(
+                        f"{group['compiler']} {group['version']} "
+                        f"O{compiler_dict['optimization_level']}: {benchmark} "
+                        f"[{target}] run {run + 1}"
+                    )
+
+    def make_task(self, compiler_dict: dict, benchmark: str, target: str, run: int):
+        """
+        :return: task of a "compile" request, see env_worker.py
+        """
+        return build_task(
+            benchmark,
+            self.benchmark_paths[benchmark],
+            run,
+            compiler_dict,
+            target,
+            self.spec["timing"],
+            self.options,
+            self.results_path,
+        )
+
+    def run(self):
+        """
+        Measure every group and build the results file.
+
+        A group whose worker fails, or whose environment does not have the
+        compiler version of the group, is reported and left out of the rest
+        of the session; the other groups carry on.
+        """
+        path = log_path(self.results_path)
+        if not os.path.exists(path) and os.path.exists(self.results_path):
+            import_results(self.results_path, path)
+        records = read_log(path) if os.path.exists(path) else []
+        self.results_log = ResultsLog(path)
+
+        waiting = list(self.pythons)
+        # Group index, request generator and CPU slot of the worker of every
+        # environment being measured
+        busy = {}
+        try:
+            while waiting or busy:
+                while waiting and len(busy) < self.max_environments:
+                    self._start_group(waiting.pop(0), records, busy)
+                if not busy:
+                    continue
+                for worker in wait(list(busy)):
+                    index, queue, _ = busy[worker]
+                    try:
+                        result = worker.receive()
+                        worker.send(queue.send(result))
+                    except StopIteration:
+                        self._release(worker, busy)
+                    except EnvWorkerError as ex:
+                        self._fail(index, ex)
+                        self._release(worker, busy)
+        finally:
+            for worker in list(busy):
+                self._release(worker, busy)
+            self.results_log.close()
+
+        write_results(build_results(path), self.results_path)
+        print(f"Results saved to: {self.results_path}")
+        if self.options.get("columnar"):
+            columnar_path = store_path(self.results_path, self.options["columnar"])
+            write_store(read_log(path), columnar_path, self.options["columnar"])
+            print(f"Store saved to: {columnar_path}")
+
+    def _start_group(self, index: int, records, busy: dict):
+        group = self.groups[index]
+        label = f"{group['compiler']} {group['version']}"
+        slot = self._free_slots.pop(0)
+        cpus = self.cpu_sets[slot] if self.cpu_sets else None
+        try:
+            worker = EnvWorker(
+                self.pythons[index],
+                label,
+                max_tasks=self.options.get("max_tasks_per_worker"),
+                max_rss_growth_mib=self.options.get("max_rss_growth_mib", 64),
+                cpus=cpus,
+                environment=self.worker_environment,
+            )
+        except EnvWorkerError as ex:
+            self._fail(index, ex)
+            self._free_slots.append(slot)
+            return
+        installed = worker.info["versions"].get(group["compiler"])
+        if not same_version(group["version"], installed):
+            # Its runs would be recorded under the version of the group
+            worker.stop()
+            self._free_slots.append(slot)
+            self._fail(
+                index,
+                EnvWorkerError(
+                    f"{self.pythons[index]} has {group['compiler']} {installed}"
+                ),
+            )
+            return
+        # The parses of an environment run while the others compile
+        execution = execution_metadata(
+            self.threads,
+            [cpus] if cpus else None,
+            worker.info["execution"],
+            parse_overlap=self.options.get("measure_parse", True)
+            and min(self.max_environments, len(self.pythons)) > 1,
+        )
+        busy[worker] = (index, self.work_queue(group, records, execution), slot)
+        try:
+            worker.send(next(busy[worker][1]))
+        except StopIteration:
+            self._release(worker, busy)
+
+    def _release(self, worker: EnvWorker, busy: dict):
+        # Stop the worker of a group that is done and free its CPU slot
+        _, _, slot = busy.pop(worker)
+        worker.stop()
+        self._free_slots.append(slot)
+
+    def _fail(self, index: int, error: Exception):
+        group = self.groups[index]
+        print(f"{group['compiler']} {group['version']} failed: {error}")
+        self.failed.append(group)
@@ -0,0 +1,163 @@
+"""
+This module times the passes of a compilation one by one, to tell which
+stage of a compiler (layout, routing, optimization, ...) a change of the
+transpile time comes from.
+
+A qiskit compilation is timed through the ``callback`` of ``transpile``,
+which qiskit calls after every pass with its running time and the DAG it
+produced. A tket compilation applies the passes of its ``SequencePass`` one
+by one, timing every one of them.
+
+The time spent recording every pass is itself measured and reported as the
+overhead of the instrumentation, which the transpile time of an instrumented
+compilation includes.
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import time
+
+PASS_TIME_METRIC = "pass_time/{} (seconds)"
+PASS_SIZE_METRIC = "pass_size/{} (ops)"
+OVERHEAD_METRIC = "pass_timing_overhead (seconds)"
+
+
+def tket_pass_name(pass_dict: dict):
+    """
+    :param pass_dict: the ``to_dict()`` of a tket pass
+    :return: name of the pass, the names of its passes joined by "+" for a
+        SequencePass
+    """
+    pass_class = pass_dict["pass_class"]
+    if pass_class == "StandardPass":
+        return pass_dict["StandardPass"]["name"]
+    if pass_class == "SequencePass":
+        return "+".join(
+            tket_pass_name(inner) for inner in pass_dict["SequencePass"]["sequence"]
+        )
+    return pass_class
+
+
+class PassTimer:
+    """
+    Records the running time of every pass of one or more compilations.
+
+    Call ``start`` before every compilation. A qiskit compilation is then
+    given the timer as its ``callback``, and a tket compilation is run with
+    ``apply_tket``, after ``prepare_tket`` has listed the passes of its
+    SequencePass outside the timed region.
+
+    The time of a pass run several times in a compilation, like the passes of
+    the optimization loop of qiskit, is summed, and its size is that of the
+    circuit after its last run. Passes repeated in a tket sequence are told
+    apart by a "_2", "_3", ... suffix.
+    """
+
+    def __init__(self):
+        # One dictionary per compilation mapping pass name to its total time,
+        # and to the number of operations of the circuit after it
+        self.times = []
+        self.sizes = []
+        self.overheads = []
+        # The passes of every prepared tket SequencePass with their names
+        self._tket_sequences = {}
+
+    def start(self):
+        """
+        Start recording a new compilation.
+        """
+        self.times.append({})
+        self.sizes.append({})
+        self.overheads.append(0)
+
+    def record(self, name: str, seconds: float, size: int):
+        """
+        Record a pass of the current compilation.
+
+        :param name: name of the pass
+        :param seconds: running time of the pass
+        :param size: number of operations of the circuit after the pass
+        """
+        times = self.times[-1]
+        times[name] = times.get(name, 0.0) + seconds
+        self.sizes[-1][name] = size
+
+    def __call__(self, **kwargs):
+        # The transpile callback, called with the pass_, dag, time,
+        # property_set and count of every pass that ran
+        start_time = time.perf_counter_ns()
+        self.record(
+            type(kwargs["pass_"]).__name__, kwargs["time"], kwargs["dag"].size()
+        )
+        self.overheads[-1] += time.perf_counter_ns() - start_time
+
+    def prepare_tket(self, sequence_pass):
+        """
+        List the passes of a tket SequencePass and name them, which takes a
+        serialization of every pass, ahead of apply_tket.
+
+        :param sequence_pass: the SequencePass of the compilation
+        :type sequence_pass: pytket.passes.SequencePass
+        """
+        passes = []
+        counts = {}
+        for tket_pass in sequence_pass.get_sequence():
+            name = tket_pass_name(tket_pass.to_dict())
+            counts[name] = counts.get(name, 0) + 1
+            if counts[name] > 1:
+                name = f"{name}_{counts[name]}"
+            passes.append((tket_pass, name))
+        self._tket_sequences[id(sequence_pass)] = passes
+
+    def apply_tket(self, sequence_pass, circuit):
+        """
+        Apply the passes of a tket SequencePass to a circuit one by one, in
+        place, recording every one of them.
+
+        :param sequence_pass: the SequencePass of the compilation, prepared
+            with prepare_tket
+        :type sequence_pass: pytket.passes.SequencePass
+        :param circuit: the pytket circuit to compile
+        :type circuit: pytket.Circuit
+        :return: the circuit
+        """
+        for tket_pass, name in self._tket_sequences[id(sequence_pass)]:
+            pass_start = time.perf_counter_ns()
+            tket_pass.apply(circuit)
+            pass_end = time.perf_counter_ns()
+            self.record(name, (pass_end - pass_start) / 1e9, circuit.n_gates)
+            self.overheads[-1] += time.perf_counter_ns() - pass_end
+        return circuit
+
+    def metrics(self, compilations: int):
+        """
+        :param compilations: number of timed compilations, the last ones
+            recorded (the warm-up compilations come before them)
+        :return: dictionary with the time and the size after every pass and
+            the overhead of the instrumentation, each a list with one value
+            per compilation if there are several and a single value otherwise
+        """
+        times = self.times[-compilations:]
+        sizes = self.sizes[-compilations:]
+        overheads = [overhead / 1e9 for overhead in self.overheads[-compilations:]]
+
+        def values(items):
+            return items if compilations > 1 else items[0]
+
+        metrics = {}
+        for name in times[-1]:
+            metrics[PASS_TIME_METRIC.format(name)] = values(
+                [compilation.get(name, 0.0) for compilation in times]
+            )
+        for name in sizes[-1]:
+            metrics[PASS_SIZE_METRIC.format(name)] = values(
+                [compilation.get(name, 0) for compilation in sizes]
+            )
+        metrics[OVERHEAD_METRIC] = values(overheads)
+        return metrics
@@ -0,0 +1,263 @@
+"""
+This module pins worker processes to CPUs and limits the threads of the
+compilers, so that timings taken on a shared host, or by several workers in
+parallel, do not depend on how the operating system schedules them.
+
+The qiskit Rust internals size their thread pool from ``RAYON_NUM_THREADS``,
+OpenMP and the BLAS libraries from ``OMP_NUM_THREADS`` and friends, and
+qiskit's ``parallel_map`` from ``QISKIT_PARALLEL`` and ``QISKIT_NUM_PROCS``.
+They are read once, when the libraries are loaded or first used, so they are
+set in the environment a process is started with, before it imports the
+compilers. A process started in ``launch_settings`` inherits both its
+environment and the CPUs of the thread that started it.
+
+The effective settings of a process and the topology of the host are
+recorded under "execution" in the metadata of the results entries.
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import contextlib
+import glob
+import os
+import platform
+import sys
+
+# Environment variables sizing the thread pools of the compilers and of the
+# libraries they use
+THREAD_VARIABLES = (
+    "RAYON_NUM_THREADS",
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "QISKIT_NUM_PROCS",
+    "QISKIT_PARALLEL",
+)
+SYSFS_CPU_DIR = "/sys/devices/system/cpu"
+SYSFS_NODE_DIR = "/sys/devices/system/node"
+
+
+def thread_environment(threads: int):
+    """
+    :param threads: largest number of threads of a compiling process
+    :return: dictionary of the environment variables limiting the thread
+        pools to ``threads``; qiskit's process-based parallel_map is disabled
+    """
+    environment = {
+        variable: str(threads)
+        for variable in THREAD_VARIABLES
+        if variable != "QISKIT_PARALLEL"
+    }
+    environment["QISKIT_PARALLEL"] = "FALSE"
+    return environment
+
+
+def available_cpus():
+    """
+    :return: sorted list of the CPUs this process may run on
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _read_int(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return int(file.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def cpu_cores():
+    """
+    :return: dictionary mapping every CPU of the host to its (socket, core),
+        empty if the host does not expose its topology in sysfs
+    """
+    cores = {}
+    for topology in glob.glob(os.path.join(SYSFS_CPU_DIR, "cpu[0-9]*", "topology")):
+        cpu = int(os.path.basename(os.path.dirname(topology))[3:])
+        cores[cpu] = (
+            _read_int(os.path.join(topology, "physical_package_id")),
+            _read_int(os.path.join(topology, "core_id")),
+        )
+    return cores
+
+
+def cpu_slots(workers: int, cpus_per_worker: int = 1):
+    """
+    Split the CPUs available to this process into disjoint sets, one per
+    worker.
+
+    The first logical CPU of every physical core is handed out before its
+    hyperthread siblings, so that workers do not share a core while there are
+    idle ones.
+
+    :param workers: number of worker processes
+    :param cpus_per_worker: number of CPUs of every worker
+    :return: list of ``workers`` sorted lists of CPUs
+    """
+    cpus = available_cpus()
+    needed = workers * cpus_per_worker
+    if needed > len(cpus):
+        raise ValueError(
+            f"{workers} pinned workers of {cpus_per_worker} CPU(s) each need "
+            f"{needed} CPUs, only {len(cpus)} are available"
+        )
+    cores = cpu_cores()
+    sibling_rank = {}
+    seen = {}
+    for cpu in cpus:
+        core = cores.get(cpu, (None, cpu))
+        sibling_rank[cpu] = seen.get(core, 0)
+        seen[core] = sibling_rank[cpu] + 1
+    ordered = sorted(cpus, key=lambda cpu: (sibling_rank[cpu], cpu))
+    return [
+        sorted(ordered[index * cpus_per_worker : (index + 1) * cpus_per_worker])
+        for index in range(workers)
+    ]
+
+
+def pin_process(cpus):
+    """
+    Pin the calling thread, and the threads and processes it starts from now
+    on, to a set of CPUs.
+
+    :param cpus: CPUs to run on
+    :type cpus: iterable of int
+    """
+    if not hasattr(os, "sched_setaffinity"):
+        raise OSError("CPU pinning needs os.sched_setaffinity, which is Linux-only")
+    os.sched_setaffinity(0, cpus)
+
+
+@contextlib.contextmanager
+def launch_settings(cpus=None, environment: dict = None):
+    """
+    Context manager applying settings that the processes started in it
+    inherit: the CPUs of the calling thread and environment variables. Both
+    are restored on exit.
+
+    :param cpus: CPUs to pin the started processes to, ``None`` to leave
+        them unpinned
+    :type cpus: iterable of int
+    :param environment: dictionary of environment variables to start the
+        processes with
+    """
+    environment = environment or {}
+    saved_environment = {variable: os.environ.get(variable) for variable in environment}
+    saved_cpus = available_cpus() if cpus is not None else None
+    os.environ.update(environment)
+    try:
+        if cpus is not None:
+            pin_process(cpus)
+        yield
+    finally:
+        if saved_cpus is not None:
+            pin_process(saved_cpus)
+        for variable, value in saved_environment.items():
+            if value is None:
+                os.environ.pop(variable, None)
+            else:
+                os.environ[variable] = value
+
+
+def restart_with_environment(environment: dict):
+    """
+    Restart the running script with environment variables set, unless they
+    already are, so that they are in place before it imports the compilers.
+
+    :param environment: dictionary of environment variables
+    """
+    if all(
+        os.environ.get(variable) == value for variable, value in environment.items()
+    ):
+        return
+    os.execve(
+        sys.executable,
+        [sys.executable] + sys.argv,
+        {**os.environ, **environment},
+    )
+
+
+def execution_settings():
+    """
+    :return: dictionary with the CPUs this process runs on ("cpus"), the
+        thread variables of its environment ("environment", ``None`` for the
+        unset ones) and, once qiskit is imported, whether qiskit's
+        parallel_map would run in parallel ("qiskit_parallel") and with how
+        many processes ("qiskit_num_processes")
+    """
+    settings = {
+        "cpus": available_cpus(),
+        "environment": {
+            variable: os.environ.get(variable) for variable in THREAD_VARIABLES
+        },
+    }
+    parallel = sys.modules.get("qiskit.utils.parallel")
+    if parallel is not None and hasattr(parallel, "should_run_in_parallel"):
+        settings["qiskit_parallel"] = parallel.should_run_in_parallel()
+        settings["qiskit_num_processes"] = parallel.default_num_processes()
+    return settings
+
+
+def _cpu_model():
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or None
+
+
+def host_topology():
+    """
+    :return: dictionary describing the host: its "platform", "cpu_model",
+        number of "logical_cpus", "physical_cores", "sockets" and
+        "numa_nodes" (``None`` when unknown), and the CPUs available to this
+        process ("available_cpus")
+    """
+    cores = cpu_cores()
+    numa_nodes = glob.glob(os.path.join(SYSFS_NODE_DIR, "node[0-9]*"))
+    return {
+        "platform": platform.platform(),
+        "cpu_model": _cpu_model(),
+        "logical_cpus": os.cpu_count(),
+        "physical_cores": len(set(cores.values())) or None,
+        "sockets": len({socket for socket, _ in cores.values()}) or None,
+        "numa_nodes": len(numa_nodes) or None,
+        "available_cpus": available_cpus(),
+    }
+
+
+def execution_metadata(
+    threads: int = None,
+    worker_cpus: list = None,
+    settings: dict = None,
+    parse_overlap: bool = False,
+):
+    """
+    :param threads: thread limit of the compiling processes, ``None`` if
+        unlimited
+    :param worker_cpus: CPUs of every worker process, ``None`` if unpinned
+    :param settings: effective settings of the compiling process, those of
+        this process by default
+    :param parse_overlap: whether the timed parses ran while other processes
+        compiled, competing with them for the CPUs
+    :return: the "execution" metadata of a session
+    """
+    return {
+        "threads": threads,
+        "worker_cpus": worker_cpus,
+        "settings": settings or execution_settings(),
+        "parse_overlap": parse_overlap,
+        "host": host_topology(),
+    }
@@ -61,6 +61,144 @@ import qiskit
 from qiskit.transpiler.passes import RemoveBarriers
 
 
+# =======  Global tables and variables =========
+
+# Standard gates are gates defined in OpenQASM header.
+# Dictionary in {"gate name": number of standard gates inside}
+STANDARD_GATE_TABLE = {
+    "r": 1,  # 2-Parameter rotation around Z-axis and X-axis
+    "sx": 1,  # SX Gate - Square root X gate
+    "u3": 1,  # 3-parameter 2-pulse single qubit gate
+    "u2": 1,  # 2-parameter 1-pulse single qubit gate
+    "u1": 1,  # 1-parameter 0-pulse single qubit gate
+    "cx": 1,  # controlled-NOT
+    "id": 1,  # idle gate(identity)
+    "x": 1,  # Pauli gate: bit-flip
+    "y": 1,  # Pauli gate: bit and phase flip
+    "z": 1,  # Pauli gate: phase flip
+    "h": 1,  # Clifford gate: Hadamard
+    "s": 1,  # Clifford gate: sqrt(Z) phase gate
+    "sdg": 1,  # Clifford gate: conjugate of sqrt(Z)
+    "t": 1,  # C3 gate: sqrt(S) phase gate
+    "tdg": 1,  # C3 gate: conjugate of sqrt(S)
+    "rx": 1,  # Rotation around X-axis
+    "ry": 1,  # Rotation around Y-axis
+    "rz": 1,  # Rotation around Z-axis
+    "c1": 1,  # Arbitrary 1-qubit gate
+    "c2": 1,
+}  # Arbitrary 2-qubit gate
+
+# Composition gates are gates defined in OpenQASM header.
+# Dictionary in {"gate name": number of standard gates inside}
+COMPOSITION_GATE_TABLE = {
+    "p": 1,  # Phase Gate
+    "cz": 3,  # Controlled-Phase
+    "cy": 3,  # Controlled-Y
+    "swap": 3,  # Swap
+    "ch": 11,  # Controlled-H
+    "ccx": 15,  # C3 gate: Toffoli
+    "cswap": 17,  # Fredkin
+    "crx": 5,  # Controlled RX rotation
+    "cry": 4,  # Controlled RY rotation
+    "crz": 4,  # Controlled RZ rotation
+    "cu1": 5,  # Controlled phase rotation
+    "cu3": 5,  # Controlled-U
+    "rxx": 7,  # Two-qubit XX rotation
+    "ryy": 7,
+    "rzz": 3,  # Two-qubit ZZ rotation
+    "rccx": 9,  # Relative-phase CCX
+    "rc3x": 18,  # Relative-phase 3-controlled X gate
+    "c3x": 27,  # 3-controlled X gate
+    "c3sqrtx": 27,  # 3-controlled sqrt(X) gate
+    "c4x": 87,  # 4-controlled X gate
+}
+
+# OpenQASM native gate table, other gates are user-defined.
+GATE_TABLE = {
+    **COMPOSITION_GATE_TABLE,
+    **STANDARD_GATE_TABLE,
+}
+
+# ==================================================================================
+# For the statistics of the number of CNOT or CX gate in the circuit
+
+# Number of CX in Standard gates
+STANDARD_CX_TABLE = {
+    "r": 0,
+    "u3": 0,
+    "u2": 0,
+    "u1": 0,
+    "sx": 0,
+    "cx": 1,
+    "id": 0,
+    "x": 0,
+    "y": 0,
+    "z": 0,
+    "h": 0,
+    "s": 0,
+    "sdg": 0,
+    "t": 0,
+    "tdg": 0,
+    "rx": 0,
+    "ry": 0,
+    "rz": 0,
+    "c1": 0,
+    "c2": 1,
+}
+# Number of CX in Composition gates
+COMPOSITION_CX_TABLE = {
+    "p": 0,
+    "cz": 1,
+    "cy": 1,
+    "swap": 3,
+    "ch": 2,
+    "ccx": 6,
+    "cswap": 8,
+    "crx": 2,
+    "cry": 2,
+    "crz": 2,
+    "cu1": 2,
+    "cu3": 2,
+    "rxx": 2,
+    "rzz": 2,
+    "ryy": 2,
+    "rccx": 3,
+    "rc3x": 6,
+    "c3x": 6,
+    "c3sqrtx": 6,
+    "c4x": 18,
+}
+
+CX_TABLE = {
+    **STANDARD_CX_TABLE,
+    **COMPOSITION_CX_TABLE,
+}
+
+# ==================================================================================
+# Lexer for the processed QASM statements
+
+# The operands of a statement, after the operation and its parameters
+OPERANDS_REGEX = re.compile(r"^[ \t]*[^\s(;]*[ \t]*(?:\(.*\))?([^;]*)")
+# A register operand with an optional index, "q[3]" or "q"
+OPERAND_REGEX = re.compile(r"([A-Za-z_]\w*)\s*(?:\[\s*(\d+)\s*\])?")
+
+
+def byte_class(characters: bytes):
+    """
+    :param characters: bytes in the class
+    :return: lookup table, indexed by byte value, of membership in the class
+    """
+    table = np.zeros(256, dtype=bool)
+    table[np.frombuffer(characters, dtype=np.uint8)] = True
+    return table
+
+
+# Bytes that end the operation of a statement, like the cut in Preprocess.get_op
+OP_DELIMITERS = byte_class(b" \t(;\n")
+# Bytes that can precede the register name of an operand
+OPERAND_DELIMITERS = byte_class(b" \t,)\n")
+
+
 class Preprocess:
     """
     Preprocess class for QASM strings. Handles preprocessing.
@@ -69,118 +207,13 @@ class Preprocess:
     def __init__(self, qasm):
         self.qasm = qasm
         # =======  Global tables and variables =========
-
-        # Standard gates are gates defined in OpenQASM header.
-        # Dictionary in {"gate name": number of standard gates inside}
         # pylint: disable=invalid-name
-        self.STANDARD_GATE_TABLE = {
-            "r": 1,  # 2-Parameter rotation around Z-axis and X-axis
-            "sx": 1,  # SX Gate - Square root X gate
-            "u3": 1,  # 3-parameter 2-pulse single qubit gate
-            "u2": 1,  # 2-parameter 1-pulse single qubit gate
-            "u1": 1,  # 1-parameter 0-pulse single qubit gate
-            "cx": 1,  # controlled-NOT
-            "id": 1,  # idle gate(identity)
-            "x": 1,  # Pauli gate: bit-flip
-            "y": 1,  # Pauli gate: bit and phase flip
-            "z": 1,  # Pauli gate: phase flip
-            "h": 1,  # Clifford gate: Hadamard
-            "s": 1,  # Clifford gate: sqrt(Z) phase gate
-            "sdg": 1,  # Clifford gate: conjugate of sqrt(Z)
-            "t": 1,  # C3 gate: sqrt(S) phase gate
-            "tdg": 1,  # C3 gate: conjugate of sqrt(S)
-            "rx": 1,  # Rotation around X-axis
-            "ry": 1,  # Rotation around Y-axis
-            "rz": 1,  # Rotation around Z-axis
-            "c1": 1,  # Arbitrary 1-qubit gate
-            "c2": 1,
-        }  # Arbitrary 2-qubit gate
-
-        # Composition gates are gates defined in OpenQASM header.
-        # Dictionary in {"gate name": number of standard gates inside}
-        self.COMPOSITION_GATE_TABLE = {
-            "p": 1,  # Phase Gate
-            "cz": 3,  # Controlled-Phase
-            "cy": 3,  # Controlled-Y
-            "swap": 3,  # Swap
-            "ch": 11,  # Controlled-H
-            "ccx": 15,  # C3 gate: Toffoli
-            "cswap": 17,  # Fredkin
-            "crx": 5,  # Controlled RX rotation
-            "cry": 4,  # Controlled RY rotation
-            "crz": 4,  # Controlled RZ rotation
-            "cu1": 5,  # Controlled phase rotation
-            "cu3": 5,  # Controlled-U
-            "rxx": 7,  # Two-qubit XX rotation
-            "ryy": 7,
-            "rzz": 3,  # Two-qubit ZZ rotation
-            "rccx": 9,  # Relative-phase CCX
-            "rc3x": 18,  # Relative-phase 3-controlled X gate
-            "c3x": 27,  # 3-controlled X gate
-            "c3sqrtx": 27,  # 3-controlled sqrt(X) gate
-            "c4x": 87,  # 4-controlled X gate
-        }
-
-        # OpenQASM native gate table, other gates are user-defined.
-        self.GATE_TABLE = {
-            **self.COMPOSITION_GATE_TABLE,
-            **self.STANDARD_GATE_TABLE,
-        }
-
-        # ==================================================================================
-        # For the statistics of the number of CNOT or CX gate in the circuit
-
-        # Number of CX in Standard gates
-        self.STANDARD_CX_TABLE = {
-            "r": 0,
-            "u3": 0,
-            "u2": 0,
-            "u1": 0,
-            "sx": 0,
-            "cx": 1,
-            "id": 0,
-            "x": 0,
-            "y": 0,
-            "z": 0,
-            "h": 0,
-            "s": 0,
-            "sdg": 0,
-            "t": 0,
-            "tdg": 0,
-            "rx": 0,
-            "ry": 0,
-            "rz": 0,
-            "c1": 0,
-            "c2": 1,
-        }
-        # Number of CX in Composition gates
-        self.COMPOSITION_CX_TABLE = {
-            "p": 0,
-            "cz": 1,
-            "cy": 1,
-            "swap": 3,
-            "ch": 2,
-            "ccx": 6,
-            "cswap": 8,
-            "crx": 2,
-            "cry": 2,
-            "crz": 2,
-            "cu1": 2,
-            "cu3": 2,
-            "rxx": 2,
-            "rzz": 2,
-            "ryy": 2,
-            "rccx": 3,
-            "rc3x": 6,
-            "c3x": 6,
-            "c3sqrtx": 6,
-            "c4x": 18,
-        }
-
-        self.CX_TABLE = {
-            **self.STANDARD_CX_TABLE,
-            **self.COMPOSITION_CX_TABLE,
-        }
+        self.STANDARD_GATE_TABLE = dict(STANDARD_GATE_TABLE)
+        self.COMPOSITION_GATE_TABLE = dict(COMPOSITION_GATE_TABLE)
+        self.GATE_TABLE = dict(GATE_TABLE)
+        self.STANDARD_CX_TABLE = dict(STANDARD_CX_TABLE)
+        self.COMPOSITION_CX_TABLE = dict(COMPOSITION_CX_TABLE)
+        self.CX_TABLE = dict(CX_TABLE)
 
         self.USER_DEFINED_GATES = {}
         # pylint: enable=invalid-name
@@ -206,17 +239,31 @@ class Preprocess:
             "//",
         ]
 
-        self.circuit = qiskit.QuantumCircuit().from_qasm_str(qasm)
-        self.circuit = RemoveBarriers()(self.circuit)
+        # The qiskit circuit is only built when a metric reads self.circuit
+        self.source_qasm = qasm
+        self._circuit = None
 
         self.measurement_count = None
         # Filter the QASM code for all lines containing strings within the "SKIP Keys" variable
         self.qubit_count = None
         self.cbit_count = None
         self.qubit_labelled = None
+        self.qubit_registers = None
         self.cbit_labelled = None
         self.processed_qasm = None
 
+        # Instruction table filled by tokenize: one opcode per statement of
+        # processed_qasm (an index into op_names), the global indices of its
+        # qubits and the byte spans of its parameters in statement_bytes, both
+        # stored CSR-style behind offset arrays.
+        self.op_names = None
+        self.opcodes = None
+        self.qubit_offsets = None
+        self.qubit_indices = None
+        self.param_offsets = None
+        self.param_spans = None
+        self.statement_bytes = None
+
         self.preprocess_qasm()
 
     def preprocess_qasm(self):
@@ -224,8 +271,8 @@ class Preprocess:
         Preprocess pipeline for QASM strings.
         """
         self.collate_gates()
-        self.decompose_circuit()
         self.final_preprocessing()
+        self.tokenize()
 
     def get_op(self, line: str):
         """
@@ -291,6 +338,23 @@ class Preprocess:
         temporary_qasm = temporary_qasm[valid_indexes.astype("bool")]
         self.qasm = temporary_qasm
 
+    @property
+    def circuit(self):
+        """
+        The qiskit circuit of the QASM string, without barriers and with the
+        user-defined gates decomposed. It is built on first access, so metrics
+        that only read the QASM text never pay for it.
+        """
+        if self._circuit is None:
+            circuit = qiskit.QuantumCircuit().from_qasm_str(self.source_qasm)
+            self._circuit = RemoveBarriers()(circuit)
+            self.decompose_circuit()
+        return self._circuit
+
+    @circuit.setter
+    def circuit(self, circuit):
+        self._circuit = circuit
+
     def decompose_circuit(self):
         gates = list(self.USER_DEFINED_GATES.keys())
         for _ in range(len(gates)):
@@ -312,6 +376,7 @@ class Preprocess:
         t_qubits = 0
         t_cbits = 0
         qbit_labelled = {}
+        qubit_registers = {}
         # Load all qubits into the qubit count and give them unique IDs
         for qubit_index in qubit_count:
             info_string = qubit_index.split(" ")[-1]
@@ -323,6 +388,7 @@ class Preprocess:
                 previous_cap = 0
             for i in range(qbit_counts):
                 qbit_labelled[str(qubit_id) + str(i)] = i + previous_cap
+            qubit_registers[str(qubit_id)] = (previous_cap, qbit_counts)
             t_qubits += int(qbit_counts)
         # Search for all cbit declaration lines
         cbit_count = [x for x in qasm if creg in x]
@@ -359,5 +425,206 @@ class Preprocess:
         self.qubit_count = int(t_qubits)
         self.cbit_count = int(t_cbits)
         self.qubit_labelled = qbit_labelled
+        self.qubit_registers = qubit_registers
         self.cbit_labelled = cbit_labelled
         self.processed_qasm = filtered_qasm
+
+    def tokenize(self):
+        """
+        Lex the processed QASM once into an array-backed instruction table.
+
+        The statements are lexed together as one byte array: parentheses
+        depth, brackets and commas are located with NumPy, so no Python code
+        runs per qubit or per parameter. Statements whose operands are not all
+        indexed qubits of declared registers (e.g. a bare register, which
+        expands to all of its qubits) are resolved one at a time.
+        """
+        num_statements = len(self.processed_qasm)
+        self.statement_bytes = "\n".join(self.processed_qasm).encode()
+        data = np.frombuffer(self.statement_bytes, dtype=np.uint8)
+        newlines = np.flatnonzero(data == ord("\n"))
+        line_starts = np.concatenate(([0], newlines + 1))[:num_statements]
+        self.op_names, self.opcodes = self._lex_ops(data, line_starts)
+
+        def statement_counts(positions):
+            statement = np.searchsorted(newlines, positions)
+            return np.bincount(statement, minlength=num_statements)
+
+        is_open = data == ord("(")
+        is_close = data == ord(")")
+        depth = np.cumsum(is_open, dtype=np.int32) - np.cumsum(is_close, dtype=np.int32)
+        if np.any(depth[newlines] != 0) or (data.size and depth[-1] != 0):
+            raise ValueError("Unbalanced parentheses in QASM statement")
+        is_comma = data == ord(",")
+
+        # Parameter slots: from "(" or "," to "," or ")" at depth one
+        slot_starts = np.flatnonzero((is_open | is_comma) & (depth == 1))
+        slot_ends = np.flatnonzero(
+            (is_close & (depth == 0)) | (is_comma & (depth == 1))
+        )
+        self.param_spans = np.stack((slot_starts + 1, slot_ends), axis=1)
+        self.param_offsets = np.concatenate(
+            ([0], np.cumsum(statement_counts(slot_starts)))
+        ).astype(np.int64)
+
+        # Qubit operands: "register[index]", one per top-level comma
+        opens = np.flatnonzero(data == ord("["))
+        closes = np.flatnonzero(data == ord("]"))
+        if len(opens) != len(closes) or np.any(closes <= opens):
+            raise ValueError("Unbalanced brackets in QASM statement")
+        qubit_indices, valid = self._bracket_qubits(data, opens, closes)
+        bracket_counts = statement_counts(opens)
+        operand_counts = statement_counts(np.flatnonzero(is_comma & (depth == 0))) + 1
+        irregular = (bracket_counts != operand_counts) | (
+            statement_counts(opens[~valid]) > 0
+        )
+        if np.any(irregular):
+            qubit_indices, bracket_counts = self._splice_irregular(
+                qubit_indices, bracket_counts, irregular
+            )
+        self.qubit_indices = qubit_indices
+        self.qubit_offsets = np.concatenate(([0], np.cumsum(bracket_counts))).astype(
+            np.int64
+        )
+
+    @staticmethod
+    def _lex_ops(data, line_starts):
+        """
+        Give every statement an opcode from the name of its operation.
+
+        The names are compared as fixed-width byte strings so that the
+        vocabulary is built with a single np.unique.
+
+        :param data: statements as an array of bytes
+        :param line_starts: position of the first byte of every statement
+        :return: list of operation names and array of opcodes indexing it
+        """
+        not_blank = np.flatnonzero((data != ord(" ")) & (data != ord("\t")))
+        not_blank = np.append(not_blank, data.size)
+        op_starts = not_blank[np.searchsorted(not_blank, line_starts)]
+        delimiters = np.append(np.flatnonzero(OP_DELIMITERS[data]), data.size)
+        op_ends = delimiters[np.searchsorted(delimiters, op_starts)]
+        lengths = op_ends - op_starts
+        width = max(int(lengths.max(initial=0)), 1)
+        window = np.minimum(op_starts[:, None] + np.arange(width), data.size - 1)
+        names = np.where(np.arange(width) < lengths[:, None], data[window], 0)
+        keys = np.ascontiguousarray(names.astype(np.uint8)).view(f"S{width}").ravel()
+        vocabulary, opcodes = np.unique(keys, return_inverse=True)
+        op_names = [name.decode() for name in vocabulary]
+        return op_names, opcodes.astype(np.int32).ravel()
+
+    def _bracket_qubits(self, data, opens, closes):
+        """
+        Resolve every "register[index]" operand to a global qubit index.
+
+        :param data: statements as an array of bytes
+        :param opens: positions of the "[" of the operands
+        :param closes: positions of the matching "]"
+        :return: array of global qubit indices and mask of the operands that
+            are a valid index of a declared register
+        """
+        lengths = closes - opens - 1
+        width = int(lengths.max(initial=0))
+        window = np.minimum(opens[:, None] + 1 + np.arange(width), data.size - 1)
+        digits = data[window].astype(np.int64) - ord("0")
+        in_number = np.arange(width) < lengths[:, None]
+        valid = (lengths > 0) & np.all(
+            ~in_number | ((digits >= 0) & (digits <= 9)), axis=1
+        )
+        powers = 10 ** np.maximum(lengths[:, None] - 1 - np.arange(width), 0)
+        indices = np.sum(np.where(in_number, digits * powers, 0), axis=1)
+
+        registered = np.zeros(len(opens), dtype=bool)
+        for name, (start, size) in self.qubit_registers.items():
+            name_bytes = np.frombuffer(name.encode(), dtype=np.uint8)
+            name_start = opens - len(name_bytes)
+            position = np.maximum(name_start[:, None] + np.arange(len(name_bytes)), 0)
+            before = data[np.maximum(name_start - 1, 0)]
+            matches = (
+                (name_start >= 0)
+                & np.all(data[position] == name_bytes, axis=1)
+                & ((name_start == 0) | OPERAND_DELIMITERS[before])
+            )
+            valid &= ~matches | (indices < size)
+            indices[matches] += start
+            registered |= matches
+        return indices.astype(np.int32), valid & registered
+
+    def _splice_irregular(self, qubit_indices, qubit_counts, irregular):
+        """
+        Resolve the operands of irregular statements one at a time, expanding
+        bare registers and dropping operands that are not declared qubits,
+        and splice them into the bracket operands of the other statements.
+
+        :return: array of global qubit indices and array of qubit counts
+        """
+        per_statement = np.split(qubit_indices, np.cumsum(qubit_counts)[:-1])
+        qubit_counts = qubit_counts.copy()
+        for statement in np.flatnonzero(irregular):
+            operands = OPERANDS_REGEX.match(self.processed_qasm[statement]).group(1)
+            qubits = []
+            for register, index in OPERAND_REGEX.findall(operands):
+                if register not in self.qubit_registers:
+                    continue
+                start, size = self.qubit_registers[register]
+                if not index:
+                    qubits.extend(range(start, start + size))
+                elif int(index) < size:
+                    qubits.append(start + int(index))
+            per_statement[statement] = np.array(qubits, dtype=np.int32)
+            qubit_counts[statement] = len(qubits)
+        return np.concatenate(per_statement).astype(np.int32), qubit_counts
+
+    def param(self, slot: int):
+        """
+        :param slot: index of a parameter slot, see param_offsets
+        :return: text of the parameter
+        """
+        start, end = self.param_spans[slot]
+        return self.statement_bytes[start:end].decode().strip()
+
+    def op_table(self, table: dict, default: int = 0):
+        """
+        Look up every operation of the instruction table in a gate table.
+
+        :param table: dictionary from gate name to value, e.g. CX_TABLE
+        :param default: value of the operations missing from the table
+        :return: array of values indexed by opcode
+        """
+        return np.array(
+            [table.get(name, default) for name in self.op_names], dtype=np.int64
+        )
+
+    def uncounted_ops(self):
+        """
+        :return: names of the operations that are not in the gate table
+        """
+        return [name for name in self.op_names if name not in self.GATE_TABLE]
+
+    def qubit_depths(self):
+        """
+        Count the gates of the gate table acting on every qubit.
+
+        :return: array of gate counts indexed by global qubit index
+        """
+        counted = np.array(
+            [name in self.GATE_TABLE for name in self.op_names], dtype=bool
+        )
+        weights = np.repeat(counted[self.opcodes], np.diff(self.qubit_offsets))
+        return np.bincount(
+            self.qubit_indices, weights=weights, minlength=self.qubit_count
+        ).astype(np.int64)
+
+    def depth(self):
+        """
+        :return: largest number of counted gates acting on a single qubit, 0
+            for a circuit without counted gates
+        """
+        depths = self.qubit_depths()
+        return int(depths.max()) if depths.size else 0
+
+    def cx_count(self):
+        """
+        :return: number of CX gates in the circuit, following CX_TABLE
+        """
+        return int(self.op_table(self.CX_TABLE)[self.opcodes].sum())
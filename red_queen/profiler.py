@@ -0,0 +1,255 @@
+"""
+This module profiles a compilation and saves the profile as a ``.pstats``
+file, which ``pstats``, snakeviz and the like read, and as a collapsed-stack
+``.folded`` file, which flame-graph tools (flamegraph.pl, speedscope,
+inferno) read.
+
+Two profilers are available:
+
+* "cprofile": the deterministic profiler of the standard library. Its
+  ``.pstats`` are exact; its call graph only records callers and callees, so
+  the collapsed stacks are rebuilt by splitting the time of every function
+  over its callees in proportion to the time spent in each.
+* "sampling": a background thread records the Python stack of the compiling
+  thread every millisecond, with much less overhead than cProfile. Its
+  collapsed stacks are exact up to the sampling; its ``.pstats`` are built
+  from the samples. Time spent in native code that holds the GIL is counted
+  against the Python frame that called it.
+
+The weights of the collapsed stacks are microseconds.
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import cProfile
+import marshal
+import os
+import sys
+import threading
+import time
+
+PROFILE_MODES = ("cprofile", "sampling")
+# Seconds between two stack samples
+DEFAULT_SAMPLE_INTERVAL = 0.001
+# Shares of a function's time below this many seconds are dropped when the
+# collapsed stacks are rebuilt from a cProfile call graph
+MIN_STACK_SECONDS = 1e-6
+
+
+def frame_label(func: tuple):
+    """
+    :param func: pstats function key, (filename, line number, name)
+    :return: label of the function in a collapsed stack
+    """
+    filename, line, name = func
+    if filename == "~":
+        # Built-in functions have no file
+        label = name
+    else:
+        label = f"{name} ({os.path.basename(filename)}:{line})"
+    # ";" separates the frames of a collapsed stack
+    return label.replace(";", ":")
+
+
+def collapsed_from_pstats(stats: dict):
+    """
+    Rebuild collapsed stacks from a cProfile call graph.
+
+    Starting from the functions without callers, the time of every function
+    on a stack is split between its own time and its callees in proportion
+    to the time the call graph gives each; a function already on the stack
+    (recursion) is not entered again.
+
+    :param stats: the ``stats`` dictionary of a ``pstats.Stats``
+    :return: dictionary mapping stack (tuple of function keys, outermost
+        first) to seconds
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, caller_stats in callers.items():
+            # Callers hold (nc, cc, tt, ct) tuples, or a call count in old
+            # pstats files
+            edge_time = caller_stats[3] if isinstance(caller_stats, tuple) else 0
+            callees.setdefault(caller, []).append((func, edge_time))
+
+    stacks = {}
+
+    def visit(stack, seconds):
+        func = stack[-1]
+        total_time = stats[func][3]
+        if total_time <= 0:
+            return
+        own = seconds * stats[func][2] / total_time
+        if own > 0:
+            stacks[stack] = stacks.get(stack, 0.0) + own
+        for callee, edge_time in callees.get(func, []):
+            share = seconds * edge_time / total_time
+            if callee in stack or share < MIN_STACK_SECONDS:
+                continue
+            visit(stack + (callee,), share)
+
+    for func, (_, _, _, total_time, callers) in stats.items():
+        if not callers:
+            visit((func,), total_time)
+    return stacks
+
+
+def pstats_from_samples(samples: list):
+    """
+    Build a pstats ``stats`` dictionary from stack samples.
+
+    :param samples: list of pairs of a stack (tuple of function keys,
+        outermost first) and the seconds it stands for
+    :return: dictionary mapping function key to (primitive calls, calls, own
+        time, total time, callers), where the calls count the samples
+    """
+    stats = {}
+    for stack, seconds in samples:
+        for depth, func in enumerate(stack):
+            if func in stack[:depth]:
+                # A recursive frame is counted once per sample
+                continue
+            calls, _, own, total, callers = stats.get(func, (0, 0, 0.0, 0.0, {}))
+            stats[func] = (calls + 1, calls + 1, own, total + seconds, callers)
+            if depth:
+                caller = stack[depth - 1]
+                edge = callers.get(caller, (0, 0, 0.0, 0.0))
+                callers[caller] = (
+                    edge[0] + 1,
+                    edge[1] + 1,
+                    edge[2],
+                    edge[3] + seconds,
+                )
+        leaf = stack[-1]
+        calls, primitive_calls, own, total, callers = stats[leaf]
+        stats[leaf] = (calls, primitive_calls, own + seconds, total, callers)
+    return stats
+
+
+def write_collapsed(stacks: dict, path: str):
+    """
+    Write collapsed stacks, one "frame;frame;... weight" line per stack.
+
+    :param stacks: dictionary mapping stack to seconds
+    :param path: path of the .folded file
+    """
+    with open(path, "w", encoding="utf-8") as folded_file:
+        for stack, seconds in sorted(stacks.items(), key=lambda item: item[0]):
+            weight = round(seconds * 1e6)
+            if weight > 0:
+                labels = ";".join(frame_label(func) for func in stack)
+                folded_file.write(f"{labels} {weight}\n")
+
+
+class SamplingProfiler:
+    """
+    Context manager sampling the Python stack of the thread that enters it.
+
+    Only the frames below the one entering the profiler are kept. Every
+    sample stands for the time since the previous one. As in MemoryProbe,
+    the interpreter switch interval is lowered to the sampling interval so
+    that the sampling thread gets the GIL.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        """
+        :param interval: seconds between two samples
+        """
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_id = None
+        self._root = None
+        self._switch_interval = None
+        self._last_sample = None
+        self._stop_time = None
+
+    def __enter__(self):
+        self.samples = []
+        self._stop.clear()
+        self._stop_time = None
+        self._thread_id = threading.get_ident()
+        # Stacks are cut at the frame that entered the profiler
+        self._root = sys._getframe(1)  # pylint: disable=protected-access
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval))
+        self._last_sample = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        # Samples taken from now on would show the profiler waiting for its
+        # thread
+        self._stop_time = time.perf_counter()
+        self._stop.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+        self._root = None
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            # pylint: disable=protected-access
+            frame = sys._current_frames().get(self._thread_id)
+            now = time.perf_counter()
+            if self._stop_time is not None and now >= self._stop_time:
+                break
+            stack = []
+            while frame is not None and frame is not self._root:
+                code = frame.f_code
+                stack.append(
+                    (
+                        code.co_filename,
+                        code.co_firstlineno,
+                        getattr(code, "co_qualname", code.co_name),
+                    )
+                )
+                frame = frame.f_back
+            if stack:
+                self.samples.append((tuple(reversed(stack)), now - self._last_sample))
+            self._last_sample = now
+
+    def stacks(self):
+        """
+        :return: dictionary mapping stack to the seconds sampled in it
+        """
+        stacks = {}
+        for stack, seconds in self.samples:
+            stacks[stack] = stacks.get(stack, 0.0) + seconds
+        return stacks
+
+
+def profile_call(func, mode: str, path: str):
+    """
+    Profile a call and save the profile.
+
+    :param func: function to profile, called without arguments
+    :type func: callable
+    :param mode: "cprofile" or "sampling"
+    :param path: path of the profile without extension; ``path.pstats`` and
+        ``path.folded`` are written
+    :return: the result of the call
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if mode == "cprofile":
+        profile = cProfile.Profile()
+        result = profile.runcall(func)
+        profile.dump_stats(path + ".pstats")
+        profile.create_stats()
+        write_collapsed(collapsed_from_pstats(profile.stats), path + ".folded")
+        return result
+    if mode == "sampling":
+        with SamplingProfiler() as sampler:
+            result = func()
+        with open(path + ".pstats", "wb") as stats_file:
+            marshal.dump(pstats_from_samples(sampler.samples), stats_file)
+        write_collapsed(sampler.stacks(), path + ".folded")
+        return result
+    raise ValueError(f"Unknown profiler {mode}, expected one of {PROFILE_MODES}")
@@ -0,0 +1,298 @@
+"""
+This module computes the aggregate statistics of the results of a whole suite
+at once.
+
+The values of a metric over every (benchmark, target) pair are laid out in a
+single contiguous array, with one segment per pair described by its start
+offset and length, and every statistic is computed for all segments with
+vectorized NumPy operations: the mean, median, range, variance and standard
+deviation the results always had, the p5/p95/p99 percentiles, the median
+absolute deviation with the runs it flags as outliers, and bootstrap
+confidence intervals of the mean and the median.
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import numpy as np
+
+PERCENTILES = (5, 95, 99)
+# Modified z-score above which a run is flagged as an outlier (Iglewicz and
+# Hoaglin)
+OUTLIER_THRESHOLD = 3.5
+BOOTSTRAP_RESAMPLES = 1000
+BOOTSTRAP_CONFIDENCE = 0.95
+# Fixed so that the intervals saved in a results file are reproducible
+BOOTSTRAP_SEED = 0
+# Largest number of resampled values held in memory at once
+BOOTSTRAP_CHUNK_VALUES = 1 << 22
+
+
+class MetricColumn:
+    """
+    The values of one metric for many segments in one contiguous array.
+    """
+
+    def __init__(self, segments):
+        """
+        :param segments: list of sequences of values, one per segment
+        """
+        counts = np.fromiter((len(segment) for segment in segments), dtype=np.int64)
+        self._set_layout(
+            np.fromiter(
+                (value for segment in segments for value in segment),
+                dtype=float,
+                count=int(counts.sum()),
+            ),
+            counts,
+        )
+
+    def _set_layout(self, values, counts):
+        self.values = values
+        self.counts = counts
+        self.starts = np.zeros(len(counts), dtype=np.int64)
+        np.cumsum(counts[:-1], out=self.starts[1:])
+        # Segment of every value
+        self.segment_ids = np.repeat(np.arange(len(counts)), counts)
+
+    def select(self, segments: np.ndarray, values: np.ndarray = None):
+        """
+        :param segments: boolean mask of the segments to keep
+        :param values: values laid out like the column, the column by default
+        :return: a column with the kept segments of the values
+        """
+        values = self.values if values is None else values
+        column = MetricColumn([])
+        column._set_layout(  # pylint: disable=protected-access
+            values[segments[self.segment_ids]], self.counts[segments]
+        )
+        return column
+
+    def sort(self, values: np.ndarray = None):
+        """
+        :param values: values laid out like the column, the column by default
+        :return: the values sorted within every segment
+        """
+        values = self.values if values is None else values
+        return values[np.lexsort((values, self.segment_ids))]
+
+    def reduce_sum(self, values: np.ndarray):
+        """
+        :param values: array whose last axis is laid out like the column
+        :return: sum of every segment along the last axis
+        """
+        return np.add.reduceat(values, self.starts, axis=-1)
+
+
+def segment_quantiles(
+    sorted_values: np.ndarray, starts: np.ndarray, counts: np.ndarray, quantiles
+):
+    """
+    Linearly interpolated quantiles of segments sorted within themselves, the
+    same as ``np.percentile`` computes for a single segment.
+
+    :param sorted_values: array whose last axis holds the sorted segments
+    :param starts: start offset of every segment
+    :param counts: length of every segment
+    :param quantiles: quantiles in [0, 1]
+    :type quantiles: sequence of float
+    :return: array of shape ``sorted_values.shape[:-1] + (segments, quantiles)``
+    """
+    quantiles = np.asarray(quantiles, dtype=float)
+    positions = starts[:, None] + quantiles[None, :] * (counts[:, None] - 1)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.ceil(positions).astype(np.int64)
+    fraction = positions - lower
+    low_values = sorted_values[..., lower]
+    return low_values + (sorted_values[..., upper] - low_values) * fraction
+
+
+def bootstrap_intervals(
+    column: MetricColumn,
+    sorted_values: np.ndarray,
+    resamples: int = BOOTSTRAP_RESAMPLES,
+    confidence: float = BOOTSTRAP_CONFIDENCE,
+    seed: int = BOOTSTRAP_SEED,
+):
+    """
+    Percentile bootstrap confidence intervals of the mean and the median of
+    every segment.
+
+    A resample is drawn as the number of times every position of the sorted
+    segments is picked, so nothing needs sorting: the running total of these
+    counts over a resample reaches ``start + k`` at the position holding the
+    k-th smallest value of the resample of the segment starting at
+    ``start``, because every segment draws exactly as many values as it has.
+
+    :param column: the metric column
+    :param sorted_values: values of the column sorted within every segment
+    :param resamples: number of bootstrap resamples
+    :param confidence: confidence level of the intervals
+    :param seed: seed of the random generator
+    :return: arrays of shape (segments, 2) with the intervals of the mean and
+        of the median
+    """
+    rng = np.random.default_rng(seed)
+    num_values = len(column.values)
+    starts = column.starts[column.segment_ids]
+    counts = column.counts[column.segment_ids].astype(np.float32)
+    last = column.counts[column.segment_ids] - 1
+    # Ranks of the two middle values of every segment
+    middle = (column.counts - 1) / 2
+    ranks = np.stack([np.floor(middle), np.ceil(middle)]).astype(np.int64)
+    ranks += column.starts
+    boot_means = np.empty((resamples, len(column.counts)))
+    boot_medians = np.empty((resamples, len(column.counts)))
+    chunk = max(1, BOOTSTRAP_CHUNK_VALUES // max(num_values, 1))
+    for first in range(0, resamples, chunk):
+        rows = min(chunk, resamples - first)
+        row_offsets = np.arange(rows)[:, None] * num_values
+        # Single precision draws are plenty to pick among the runs of a
+        # segment and about twice as fast to generate; the rounding of a draw
+        # just below 1 must not step past the end of its segment
+        scaled = rng.random((rows, num_values), dtype=np.float32) * counts
+        draws = starts + np.minimum(scaled.astype(np.int64), last)
+        picks = np.bincount(
+            (draws + row_offsets).ravel(), minlength=rows * num_values
+        ).reshape(rows, num_values)
+        boot_means[first : first + rows] = (
+            column.reduce_sum(picks * sorted_values) / column.counts
+        )
+        # The running totals of consecutive rows are made increasing so that
+        # one searchsorted finds the middle values of every row
+        totals = (np.cumsum(picks, axis=1) + row_offsets).ravel()
+        positions = (
+            np.searchsorted(totals, ranks[:, None, :] + row_offsets[None], side="right")
+            - row_offsets[None]
+        )
+        boot_medians[first : first + rows] = sorted_values[positions].mean(axis=0)
+    tails = [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100]
+    return (
+        np.percentile(boot_means, tails, axis=0).T,
+        np.percentile(boot_medians, tails, axis=0).T,
+    )
+
+
+def column_statistics(column: MetricColumn, bootstrap: bool = True):
+    """
+    Compute every statistic of every segment of a metric column.
+
+    Every segment must hold at least one value.
+
+    :param column: the metric column
+    :param bootstrap: also compute the bootstrap confidence intervals
+    :return: dictionary mapping statistic name to an array indexed by segment
+        ("percentiles" and the intervals have a second axis), and "outliers"
+        to a list with the indices of the flagged runs of every segment
+    """
+    counts = column.counts
+    values = column.values
+    segment_ids = column.segment_ids
+
+    mean = column.reduce_sum(values) / counts
+    variance = column.reduce_sum((values - mean[segment_ids]) ** 2) / counts
+    sorted_values = column.sort()
+    quantiles = segment_quantiles(
+        sorted_values,
+        column.starts,
+        counts,
+        [0.5] + [percentile / 100 for percentile in PERCENTILES],
+    )
+    median = quantiles[:, 0]
+
+    deviations = np.abs(values - median[segment_ids])
+    mad = segment_quantiles(column.sort(deviations), column.starts, counts, [0.5])[:, 0]
+    # With more than half the runs equal the MAD is zero, and the mean
+    # absolute deviation scales the deviations instead
+    mean_deviation = column.reduce_sum(deviations) / counts
+    scale = np.where(mad > 0, 1.4826 * mad, 1.2533 * mean_deviation)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z_scores = np.where(
+            scale[segment_ids] > 0, deviations / scale[segment_ids], 0.0
+        )
+    flagged = np.flatnonzero(z_scores > OUTLIER_THRESHOLD)
+    flagged_segments = segment_ids[flagged]
+    run_indices = flagged - column.starts[flagged_segments]
+    outliers = np.split(
+        run_indices, np.searchsorted(flagged_segments, np.arange(1, len(counts)))
+    )
+
+    statistics = {
+        "mean": mean,
+        "median": median,
+        "min": sorted_values[column.starts],
+        "max": sorted_values[column.starts + counts - 1],
+        "variance": variance,
+        "standard_deviation": np.sqrt(variance),
+        "percentiles": quantiles[:, 1:],
+        "mad": mad,
+        "outliers": [indices.tolist() for indices in outliers],
+    }
+    if bootstrap:
+        # The intervals of a segment whose runs all agree are that value,
+        # which spares resampling e.g. the depth of deterministic compilers
+        varying = statistics["max"] > statistics["min"]
+        for interval in ("mean_ci", "median_ci"):
+            statistics[interval] = np.repeat(mean[:, None], 2, axis=1)
+        if varying.any():
+            (
+                statistics["mean_ci"][varying],
+                statistics["median_ci"][varying],
+            ) = bootstrap_intervals(
+                column.select(varying), column.select(varying, sorted_values).values
+            )
+    return statistics
+
+
+def aggregate_suite(benchmarks: list, bootstrap: bool = True):
+    """
+    Aggregate the metrics of many benchmarks at once.
+
+    :param benchmarks: list of pairs of a dictionary mapping metric name to
+        its values (one benchmark on one target) and the names of the metrics
+        to aggregate
+    :param bootstrap: also compute the bootstrap confidence intervals
+    :return: list with the "aggregate" dictionary of every benchmark, mapping
+        metric name to its statistics; a metric without values is left out
+    """
+    aggregates = [{} for _ in benchmarks]
+    segments = {}
+    for index, (benchmark_data, metrics) in enumerate(benchmarks):
+        for metric in metrics:
+            if benchmark_data.get(metric):
+                segments.setdefault(metric, []).append(index)
+
+    for metric, indices in segments.items():
+        column = MetricColumn([benchmarks[index][0][metric] for index in indices])
+        statistics = column_statistics(column, bootstrap)
+        for segment, index in enumerate(indices):
+            aggregate = {
+                "mean": float(statistics["mean"][segment]),
+                "median": float(statistics["median"][segment]),
+                "range": (
+                    float(statistics["min"][segment]),
+                    float(statistics["max"][segment]),
+                ),
+                "variance": float(statistics["variance"][segment]),
+                "standard_deviation": float(statistics["standard_deviation"][segment]),
+            }
+            for position, percentile in enumerate(PERCENTILES):
+                aggregate[f"p{percentile}"] = float(
+                    statistics["percentiles"][segment, position]
+                )
+            aggregate["mad"] = float(statistics["mad"][segment])
+            aggregate["outliers"] = statistics["outliers"][segment]
+            if bootstrap:
+                aggregate["mean_ci"] = statistics["mean_ci"][segment].tolist()
+                aggregate["median_ci"] = statistics["median_ci"][segment].tolist()
+            aggregates[index][metric] = aggregate
+    # Keep the metrics in the order they were asked for
+    return [
+        {metric: aggregate[metric] for metric in metrics if metric in aggregate}
+        for aggregate, (_, metrics) in zip(aggregates, benchmarks)
+    ]
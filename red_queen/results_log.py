@@ -0,0 +1,621 @@
+"""
+This module contains the ResultsLog class, an append-only JSON Lines log every
+completed measurement is written to as soon as it is taken, and the functions
+that rebuild the results entries of runner.py from such a log.
+
+Usage: python3 results_log.py LOG [OUTPUT]
+
+rebuilds the results file of an interrupted session from its log.
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from pass_timing import OVERHEAD_METRIC
+from result_statistics import aggregate_suite
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+# Kept in a subdirectory so the logs do not count towards the run numbers of
+# the results files
+RESULTS_LOG_DIR = os.path.join(RESULTS_DIR, "logs")
+
+PARSE_METRIC = "parsing/build_time (seconds)"
+# Number of timed compilations of a run under adaptive timing
+SAMPLES_METRIC = "timing_samples"
+# Key of the execution settings and host topology of a session in the
+# metadata of its results entries, see pinning.execution_metadata
+EXECUTION_KEY = "execution"
+
+
+def session_metrics(
+    compiler: str,
+    measure_parse: bool = True,
+    adaptive: bool = False,
+    pass_timing: bool = False,
+):
+    """
+    :param compiler: name of the compiler of the session
+    :param measure_parse: whether the parsing/build_time and total_time are
+        measured
+    :param adaptive: whether the timed compilations are adaptive
+    :param pass_timing: whether the passes of the timed compilations are timed
+    :return: names of the metrics measured on every run of a session
+    """
+    metrics = [
+        "total_time (seconds)",
+        PARSE_METRIC,
+        "transpile_time (seconds)",
+        "depth (gates)",
+        "memory_footprint (MiB)",
+        "memory_baseline (MiB)",
+        "memory_auc (MiB*s)",
+    ]
+    if not measure_parse:
+        metrics.remove("total_time (seconds)")
+        metrics.remove(PARSE_METRIC)
+    if compiler == "pytket":
+        # Building the noise-aware pass manager happens outside the timed
+        # compile and is reported on its own
+        metrics.append("tket_setup_time (seconds)")
+    if adaptive:
+        metrics.append(SAMPLES_METRIC)
+    if pass_timing:
+        # The pass_time and pass_size metrics are named after the passes and
+        # added as they are met
+        metrics.append(OVERHEAD_METRIC)
+    return metrics
+
+
+def total_time(transpile_time, parse_time: float):
+    """
+    :param transpile_time: transpile time of a run, or the list of its
+        samples under adaptive timing
+    :type transpile_time: float or list of float
+    :param parse_time: parsing/build_time of the benchmark
+    :return: total time of the run, or of each of its samples
+    """
+    if isinstance(transpile_time, list):
+        return [sample + parse_time for sample in transpile_time]
+    return transpile_time + parse_time
+
+
+def _run_number(name: str, extension: str):
+    # N of a results_run<N> file with the given extension, 0 for other files
+    stem, file_extension = os.path.splitext(name)
+    number = stem[len("results_run") :]
+    if (
+        file_extension == extension
+        and stem.startswith("results_run")
+        and number.isdigit()
+    ):
+        return int(number)
+    return 0
+
+
+def next_results_path(reuse_last: bool = False):
+    """
+    :param reuse_last: return the last results file instead, e.g. to add the
+        results of a second compiler to it
+    :return: path of the next results file, results/results_run<N>.json with
+        N one more than the last run number of the results files and of their
+        logs, so that the log left by an interrupted session, which has no
+        results file yet, is not taken over by the next one
+    """
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    run_numbers = [_run_number(name, ".json") for name in os.listdir(RESULTS_DIR)]
+    if os.path.isdir(RESULTS_LOG_DIR):
+        run_numbers.extend(
+            _run_number(name, ".jsonl") for name in os.listdir(RESULTS_LOG_DIR)
+        )
+    run_number = 1 + max(run_numbers, default=0)
+    if reuse_last:
+        run_number -= 1
+    return os.path.join(RESULTS_DIR, f"results_run{run_number}.json")
+
+
+def log_path(results_path: str):
+    """
+    :param results_path: path of a results file, e.g. results/results_run3.json
+    :return: path of the log the results file is built from
+    """
+    name = os.path.splitext(os.path.basename(results_path))[0]
+    return os.path.join(os.path.dirname(results_path), "logs", name + ".jsonl")
+
+
+def results_subdir(directory: str, results_path: str):
+    """
+    :param directory: directory of the files saved for runs, e.g.
+        results/profiles
+    :param results_path: path of the results file the runs are added to
+    :return: subdirectory of ``directory`` named after the results file, e.g.
+        results/profiles/results_run3, so that the files of a later session
+        do not overwrite those of an earlier one
+    """
+    name = os.path.splitext(os.path.basename(results_path))[0]
+    return os.path.join(directory, name)
+
+
+def compiler_key(compiler_dict: dict):
+    """
+    :param compiler_dict: dictionary of compiler info, or the metadata of a
+        results entry
+    :return: hashable key identifying the compiler, version and
+        optimization level of a session, regardless of its execution settings
+    """
+    return json.dumps(
+        {key: value for key, value in compiler_dict.items() if key != EXECUTION_KEY},
+        sort_keys=True,
+    )
+
+
+def to_builtin(value):
+    """
+    ``default`` of json.dump for the NumPy scalars found in metrics.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ResultsLog:
+    """
+    Append-only JSON Lines log of the measurements of one or more sessions.
+
+    Every record is written and flushed as soon as it is appended, so it
+    survives the process being killed; ``os.fsync`` is only called every
+    ``sync_every`` records or ``sync_interval`` seconds, so a machine crash
+    loses at most that batch. Appending is thread-safe.
+
+    The log holds three kinds of records, told apart by their "type":
+
+    * "session": a Runner started, with its compiler, targets, metrics and
+      benchmarks, and its execution settings
+    * "parse": a benchmark was parsed, with its parsing/build_time shared by
+      every target
+    * "run": a run of a benchmark on a target completed, with its metrics
+
+    Every record also holds the Unix "time" it was written at.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sync_every: int = 32,
+        sync_interval: float = 5.0,
+        append: bool = True,
+    ):
+        """
+        :param path: path of the log
+        :param sync_every: number of records written between two fsyncs
+        :param sync_interval: largest number of seconds between two fsyncs
+        :param append: append to the log if it exists; otherwise a log that
+            already holds records raises FileExistsError, so that a new
+            session does not mix its runs with those of an old one
+        """
+        if not append and os.path.exists(path) and os.path.getsize(path):
+            raise FileExistsError(
+                f"{path} already holds the log of another session, resume it "
+                "explicitly to add runs to it"
+            )
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(  # pylint: disable=consider-using-with
+            path, "a", encoding="utf-8"
+        )
+        # Terminate a record left truncated by a killed session, so that it
+        # does not swallow the first record appended now
+        if self._file.tell() and not self._ends_with_newline(path):
+            self._file.write("\n")
+
+    def append(self, record: dict):
+        """
+        Write a record to the log.
+
+        :param record: JSON-serializable dictionary with a "type" key, saved
+            with the Unix "time" it was appended at
+        """
+        line = json.dumps({**record, "time": time.time()}, default=to_builtin) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self._pending += 1
+            if (
+                self._pending >= self.sync_every
+                or time.monotonic() - self._last_sync >= self.sync_interval
+            ):
+                self._sync()
+
+    def log_session(
+        self, compiler_dict: dict, targets, metrics, benchmarks, execution: dict = None
+    ):
+        """
+        Record the start of a session.
+
+        :param compiler_dict: dictionary of compiler info
+        :param targets: names of the targets
+        :type targets: iterable of str
+        :param metrics: names of the metrics measured on every run
+        :type metrics: iterable of str
+        :param benchmarks: names of the benchmarks, in the order they are run
+        :type benchmarks: iterable of str
+        :param execution: execution settings and host topology of the
+            session, see pinning.execution_metadata
+        """
+        record = {
+            "type": "session",
+            "compiler": compiler_dict,
+            "targets": list(targets),
+            "metrics": list(metrics),
+            "benchmarks": list(benchmarks),
+        }
+        if execution is not None:
+            record[EXECUTION_KEY] = execution
+        self.append(record)
+
+    def log_parse(self, compiler_dict: dict, benchmark: str, seconds: float):
+        """
+        Record the parsing/build_time of a benchmark.
+        """
+        self.append(
+            {
+                "type": "parse",
+                "compiler": compiler_dict,
+                "benchmark": benchmark,
+                "seconds": seconds,
+            }
+        )
+
+    def log_run(
+        self, compiler_dict: dict, target: str, benchmark: str, run: int, metrics: dict
+    ):
+        """
+        Record the metrics of a completed run.
+
+        :param compiler_dict: dictionary of compiler info
+        :param target: name of the target
+        :param benchmark: name of the benchmark
+        :param run: index of the run
+        :param metrics: dictionary mapping metric name to its value in the run
+        """
+        self.append(
+            {
+                "type": "run",
+                "compiler": compiler_dict,
+                "target": target,
+                "benchmark": benchmark,
+                "run": run,
+                "metrics": metrics,
+            }
+        )
+
+    def close(self):
+        """
+        Flush and fsync the remaining records and close the log.
+        """
+        with self._lock:
+            if self._file.closed:
+                return
+            self._sync()
+            self._file.close()
+
+    @staticmethod
+    def _ends_with_newline(path: str):
+        with open(path, "rb") as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b"\n"
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def add_run_metrics(benchmark_data: dict, metrics: dict):
+    """
+    Add the metrics of a run to the metric lists of a benchmark.
+
+    A metric sampled several times in a run, like the transpile time under
+    adaptive timing, has a list of values that are all added.
+
+    :param benchmark_data: dictionary mapping metric name to its values
+    :param metrics: dictionary mapping metric name to its value in the run
+    """
+    for metric, value in metrics.items():
+        values = benchmark_data.setdefault(metric, [])
+        if isinstance(value, list):
+            values.extend(value)
+        else:
+            values.append(value)
+
+
+def read_log(path: str):
+    """
+    Read the records of a log.
+
+    A line that cannot be decoded, normally the last one of a session that was
+    killed while writing it, is skipped with a warning.
+
+    :param path: path of the log
+    :return: list of records in the order they were written
+    """
+    records = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line_num, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(
+                    "Skipping truncated record on line %d of %s", line_num, path
+                )
+    return records
+
+
+def results_from_records(records: list):
+    """
+    Rebuild the results entries of runner.py from the records of a log.
+
+    There is one entry per (compiler, target) pair, in the order the sessions
+    started. A benchmark appears in an entry once it has a run; its metric
+    lists are in run order, with one parsing/build_time per parse of the
+    benchmark. The metadata of an entry holds the "execution" settings of the
+    first session of its pair, when it recorded them. Aggregates are not
+    computed here, see aggregate_metrics.
+
+    :param records: records as returned by read_log
+    :return: list of results entries
+    """
+    entries = {}
+    metrics = {}
+    benchmarks = {}
+    parse_times = {}
+    runs = {}
+    for record in records:
+        key = compiler_key(record["compiler"])
+        if record["type"] == "session":
+            metrics[key] = record["metrics"]
+            for benchmark in record["benchmarks"]:
+                benchmarks.setdefault(key, {})[benchmark] = None
+            metadata = record["compiler"]
+            if EXECUTION_KEY in record:
+                metadata = {**metadata, EXECUTION_KEY: record[EXECUTION_KEY]}
+            for target in record["targets"]:
+                entries.setdefault(
+                    (key, target), {"metadata: ": metadata, "backend": target}
+                )
+        elif record["type"] == "parse":
+            parse_times.setdefault((key, record["benchmark"]), []).append(
+                record["seconds"]
+            )
+        elif record["type"] == "run":
+            runs.setdefault((key, record["target"], record["benchmark"]), {})[
+                record["run"]
+            ] = record["metrics"]
+
+    for (key, target), entry in entries.items():
+        for benchmark in benchmarks[key]:
+            benchmark_runs = runs.get((key, target, benchmark))
+            if not benchmark_runs:
+                continue
+            benchmark_data = {metric: [] for metric in metrics[key]}
+            if PARSE_METRIC in benchmark_data:
+                benchmark_data[PARSE_METRIC] = list(
+                    parse_times.get((key, benchmark), [])
+                )
+            for run in sorted(benchmark_runs):
+                add_run_metrics(benchmark_data, benchmark_runs[run])
+            entry[benchmark] = benchmark_data
+    return list(entries.values())
+
+
+def completed_runs(records: list, compiler_dict: dict):
+    """
+    Find the runs of a compiler that a log already holds.
+
+    :param records: records as returned by read_log
+    :param compiler_dict: dictionary of compiler info, compared on every key
+    :return: dictionary mapping (target, benchmark) to the set of indices of
+        its completed runs
+    """
+    key = compiler_key(compiler_dict)
+    completed = {}
+    for record in records:
+        if record["type"] == "run" and compiler_key(record["compiler"]) == key:
+            completed.setdefault((record["target"], record["benchmark"]), set()).add(
+                record["run"]
+            )
+    return completed
+
+
+def import_results(results_path: str, path: str):
+    """
+    Write the log of a results file that was saved without one.
+
+    The runs of every benchmark are numbered in the order of its metric
+    lists, and the parsing/build_times of the first target stand for every
+    target of the same compiler. Under adaptive timing, the timing_samples of
+    the runs tell which values of the sampled metrics belong to which run.
+
+    :param results_path: path of the results file
+    :param path: path of the log to write
+    """
+    with open(results_path, "r", encoding="utf-8") as json_file:
+        entries = json.load(json_file)
+    with ResultsLog(path) as results_log:
+        for key, metadata in {
+            compiler_key(entry["metadata: "]): entry["metadata: "] for entry in entries
+        }.items():
+            compiler_entries = [
+                entry for entry in entries if compiler_key(entry["metadata: "]) == key
+            ]
+            compiler_dict = {
+                name: value for name, value in metadata.items() if name != EXECUTION_KEY
+            }
+            benchmarks = [
+                name
+                for name in compiler_entries[0]
+                if name not in ("metadata: ", "backend")
+            ]
+            metrics = []
+            if benchmarks:
+                metrics = [
+                    metric
+                    for metric in compiler_entries[0][benchmarks[0]]
+                    if metric != "aggregate"
+                ]
+            results_log.log_session(
+                compiler_dict,
+                [entry["backend"] for entry in compiler_entries],
+                metrics,
+                benchmarks,
+                metadata.get(EXECUTION_KEY),
+            )
+            for benchmark in benchmarks:
+                for seconds in compiler_entries[0][benchmark].get(PARSE_METRIC, []):
+                    results_log.log_parse(compiler_dict, benchmark, seconds)
+            for entry in compiler_entries:
+                for benchmark in benchmarks:
+                    benchmark_data = entry.get(benchmark, {})
+                    for run, run_metrics in enumerate(
+                        _split_runs(benchmark_data, metrics)
+                    ):
+                        results_log.log_run(
+                            compiler_dict, entry["backend"], benchmark, run, run_metrics
+                        )
+
+
+def _split_runs(benchmark_data: dict, metrics):
+    # Metrics of every run of a benchmark of a results file
+    run_metrics = [
+        metric
+        for metric in metrics
+        if metric != PARSE_METRIC and benchmark_data.get(metric)
+    ]
+    samples = benchmark_data.get(SAMPLES_METRIC)
+    if samples:
+        num_runs = len(samples)
+        bounds = np.cumsum([0] + samples).tolist()
+    else:
+        num_runs = min(
+            (len(benchmark_data[metric]) for metric in run_metrics), default=0
+        )
+    runs = [{} for _ in range(num_runs)]
+    for metric in run_metrics:
+        values = benchmark_data[metric]
+        sampled = samples and len(values) == bounds[-1] and len(values) != num_runs
+        for run, metrics_of_run in enumerate(runs):
+            if sampled:
+                metrics_of_run[metric] = values[bounds[run] : bounds[run + 1]]
+            elif run < len(values):
+                metrics_of_run[metric] = values[run]
+    return runs
+
+
+def aggregate_metrics(benchmark_data: dict, metrics: list):
+    """
+    Calculate the statistics of every metric of a benchmark, see
+    result_statistics.aggregate_suite.
+
+    :param benchmark_data: dictionary mapping metric name to its values
+    :param metrics: names of the metrics to aggregate
+    :return: dictionary mapping metric name to its statistics
+    """
+    return aggregate_suite([(benchmark_data, metrics)])[0]
+
+
+def aggregate_entries(entries: list):
+    """
+    Add the "aggregate" statistics of every benchmark of results entries.
+
+    :param entries: list of results entries, as built by results_from_records
+    :return: the entries
+    """
+    # The whole suite is aggregated at once
+    benchmarks = [
+        (benchmark_data, list(benchmark_data))
+        for entry in entries
+        for name, benchmark_data in entry.items()
+        if name not in ("metadata: ", "backend")
+    ]
+    for (benchmark_data, _), aggregate in zip(benchmarks, aggregate_suite(benchmarks)):
+        benchmark_data["aggregate"] = aggregate
+    return entries
+
+
+def build_results(path: str):
+    """
+    Build the aggregated results entries of a log.
+
+    :param path: path of the log
+    :return: list of results entries with their "aggregate" statistics
+    """
+    return aggregate_entries(results_from_records(read_log(path)))
+
+
+def write_results(entries: list, results_path: str):
+    """
+    Atomically write results entries to a results file.
+
+    :param entries: list of results entries
+    :param results_path: path of the results file
+    """
+    temp_path = results_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as json_file:
+        json.dump(entries, json_file, indent=2, default=to_builtin)
+    os.replace(temp_path, results_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild a results file from its results log."
+    )
+    parser.add_argument(
+        "log", help="path of the log, e.g. results/logs/results_run3.jsonl"
+    )
+    parser.add_argument(
+        "output",
+        nargs="?",
+        default=None,
+        help="path of the results file, the one the log belongs to by default",
+    )
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(args.log))),
+        os.path.splitext(os.path.basename(args.log))[0] + ".json",
+    )
+    write_results(build_results(args.log), output)
+    print(f"Results saved to: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -56,7 +56,7 @@ venv_spinup () {
         source $venv_name/bin/activate
         
         echo "📦 Installing dependencies..."
-        pip install --quiet memory_profiler numpy
+        pip install --quiet memory_profiler numpy scipy psutil
         
         if [ "$1" = "pytket" ]; then
             echo "Installing PyTKET $2..."
@@ -89,7 +89,11 @@ venv_spinup () {
     
     # Run the benchmarking
     echo "🚀 Starting benchmarking process..."
-    python3 runner.py $1 $2 $3 $4 $5 $6 
+    # Set RQ_JOBS to spread the benchmark runs over several worker processes
+    # Set RQ_THREADS to limit the compiler thread pools and RQ_PIN_CPUS=1 to
+    # pin every worker process to its own CPUs
+    python3 runner.py $1 $2 $3 $4 $5 $6 --jobs ${RQ_JOBS:-1} \
+        ${RQ_THREADS:+--threads $RQ_THREADS} ${RQ_PIN_CPUS:+--pin-cpus}
     
     deactivate
 }
@@ -55,26 +55,71 @@ running benchmarks on a given backend using a given compiler.
 #
 # https://github.com/pnnl/QASMBench/blob/master/metrics/QMetric.py
 
-import sys
 import os
 import json
 import time
-import multiprocessing
+import argparse
 import logging
 import copy
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from preprocessing import Preprocess
-from utils import initialize_tket_pass_manager, FakeFlamingo
+from metrics import circuit_depth
+from circuit_cache import CircuitCache, DEFAULT_CACHE_SIZE_MIB, parse_circuit
+from utils import get_tket_pass_manager, get_fake_flamingo
 from progress_visualizer import ProgressVisualizer
+from worker_pool import WorkerPool
+from memory_probe import MemoryProbe
+from timing import TimingHarness
+from pass_timing import PassTimer
+from profiler import PROFILE_MODES, profile_call
+from pinning import (
+    cpu_slots,
+    execution_metadata,
+    pin_process,
+    restart_with_environment,
+    thread_environment,
+)
+from results_log import (
+    RESULTS_DIR,
+    ResultsLog,
+    add_run_metrics,
+    aggregate_metrics,
+    build_results,
+    compiler_key,
+    completed_runs,
+    import_results,
+    log_path,
+    next_results_path,
+    read_log,
+    results_from_records,
+    session_metrics,
+    total_time,
+    write_results,
+)
+from columnar_store import store_path, write_store
+from tasks import (
+    BENCHMARK_DIR,
+    PROFILE_DIR,
+    build_task,
+    is_profiled,
+    list_benchmarks,
+    session_profile_dir,
+)
+from scaling import (
+    SWEEP_BENCHMARK_DIR,
+    fit_results,
+    format_report,
+    save_report,
+    sweep_order,
+)
 
 import qiskit
 from qiskit import transpile, QuantumCircuit
 from qiskit import qasm2
 
 # pylint: disable=import-error
-from memory_profiler import memory_usage
-import numpy as np
-
 from pytket.qasm import circuit_to_qasm_str
 from pytket.qasm import circuit_from_qasm
 
@@ -86,50 +131,509 @@ console_handler.setLevel(logging.INFO)
 
 logger.addHandler(console_handler)
 
+# Parsed benchmark circuits held by a worker process, keyed by (path, compiler)
+_WORKER_CIRCUITS = {}
+
+
+def time_compilation(
+    circuit,
+    backend,
+    compiler_dict: dict,
+    harness: TimingHarness,
+    pass_timer: PassTimer = None,
+):
+    """
+    Compile a circuit with the configured compiler, timing the compilation
+    with a timing harness.
+
+    :param circuit: high-level circuit to compile, modified in place by
+        pytket unless the harness compiles it more than once
+    :type circuit: QuantumCircuit or pytket.Circuit
+    :param backend: backend to compile for
+    :type backend: BackendV2
+    :param compiler_dict: dictionary of compiler info
+    :param harness: timing harness deciding the warm-up and the number of
+        timed compilations
+    :param pass_timer: timer recording every pass of every compilation,
+        ``None`` to compile without per-pass timing
+    :return: the circuit of the last compilation and the list of compilation
+        times in seconds
+    """
+    if compiler_dict["compiler"] == "pytket":
+        tket_pm, _ = get_tket_pass_manager(
+            backend, optimization_level=compiler_dict["optimization_level"]
+        )
+
+        def compile_copy(circuit_copy):
+            if pass_timer is not None:
+                pass_timer.start()
+                return pass_timer.apply_tket(tket_pm, circuit_copy)
+            tket_pm.apply(circuit_copy)
+            return circuit_copy
+
+        if pass_timer is not None:
+            pass_timer.prepare_tket(tket_pm)
+
+        if harness.warmup or harness.adaptive:
+            # Every compilation gets a fresh copy, made outside the timed region
+            return harness.measure(compile_copy, setup=circuit.copy)
+        return harness.measure(lambda: compile_copy(circuit))
+
+    def compile_circuit():
+        if pass_timer is not None:
+            pass_timer.start()
+        return transpile(
+            circuit,
+            backend=backend,
+            optimization_level=compiler_dict["optimization_level"],
+            callback=pass_timer,
+        )
+
+    return harness.measure(compile_circuit)
+
+
+def compile_benchmark(circuit, backend, compiler_dict: dict):
+    """
+    Compile a circuit with the configured compiler and time the compilation.
+
+    :param circuit: high-level circuit to compile, modified in place by pytket
+    :type circuit: QuantumCircuit or pytket.Circuit
+    :param backend: backend to compile for
+    :type backend: BackendV2
+    :param compiler_dict: dictionary of compiler info
+    :return: the compiled circuit and the compilation time in seconds
+    """
+    compiled_circuit, times = time_compilation(
+        circuit, backend, compiler_dict, TimingHarness()
+    )
+    return compiled_circuit, times[0]
+
+
+def compiled_to_qasm(compiled_circuit, compiler_dict: dict):
+    """
+    Dump a compiled circuit to an OpenQASM 2 string.
+
+    :param compiled_circuit: circuit returned by compile_benchmark
+    :type compiled_circuit: QuantumCircuit or pytket.Circuit
+    :param compiler_dict: dictionary of compiler info
+    """
+    if compiler_dict["compiler"] == "pytket":
+        return circuit_to_qasm_str(compiled_circuit)
+    # If the qiskit version is less than 1.0 use the old qasm method
+    if int(qiskit.__version__[0]) < 1:
+        return compiled_circuit.qasm()
+    return qasm2.dumps(compiled_circuit)
+
+
+def compiled_circuit_depth(compiled_circuit, compiler_dict: dict, verify: bool = False):
+    """
+    Get the depth of a compiled circuit from the compiler's native output.
+
+    Compilers without a native depth metric fall back to dumping the circuit
+    to QASM and measuring the depth with Preprocess. With ``verify`` the QASM
+    path is run as well and a mismatch is logged.
+
+    :param compiled_circuit: circuit returned by compile_benchmark
+    :type compiled_circuit: QuantumCircuit or pytket.Circuit
+    :param compiler_dict: dictionary of compiler info
+    :param verify: cross-check the native depth against the QASM path
+    """
+    try:
+        depth = circuit_depth(compiled_circuit, compiler_dict["compiler"])
+    except ValueError:
+        verify = False
+        depth = None
+    if depth is None or verify:
+        processed_qasm = Preprocess(compiled_to_qasm(compiled_circuit, compiler_dict))
+        qasm_depth = Runner.get_circuit_depth(processed_qasm)
+        if verify and qasm_depth != depth:
+            logger.warning(
+                "Native depth %s does not match QASM depth %s", depth, qasm_depth
+            )
+        depth = qasm_depth if depth is None else depth
+    return depth
+
+
+def load_benchmark_circuit(path: str, compiler: str, circuit_cache_mib: float = None):
+    """
+    Get a fresh copy of a benchmark circuit inside a worker process.
+
+    The circuit is loaded the first time a worker sees a benchmark, from the
+    on-disk circuit cache when it is enabled, and kept for the lifetime of
+    the worker, so tasks only have to carry the path of the benchmark.
+
+    :param path: path of the .qasm benchmark
+    :param compiler: name of the compiler whose circuit type is built
+    :param circuit_cache_mib: size of the on-disk circuit cache, ``None`` to
+        parse the .qasm file without it
+    """
+    key = (path, compiler)
+    if key not in _WORKER_CIRCUITS:
+        if circuit_cache_mib:
+            circuit_cache = CircuitCache(max_size_mib=circuit_cache_mib)
+            _WORKER_CIRCUITS[key] = circuit_cache.load(path, compiler)
+        else:
+            _WORKER_CIRCUITS[key] = parse_circuit(path, compiler)
+    return copy.deepcopy(_WORKER_CIRCUITS[key])
+
+
+def target_spec(target: str):
+    """
+    :param target: name of the target, "heavy_hex", "all_to_all" or "linear"
+    :return: keyword arguments of get_fake_flamingo building the target
+    """
+    return {"target": target, "qubits": 200, "distance": 11}
+
+
+def time_parse(path: str, compiler: str):
+    """
+    Parse a .qasm benchmark into a high-level circuit, timing the parse. The
+    file is read before the timer starts.
+
+    :param path: path of the .qasm benchmark
+    :param compiler: name of the compiler whose circuit type is built
+    :return: the circuit and its parsing/build_time in seconds
+    :raises ValueError: if the compiler is not supported
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        qasm = file.read()
+    start_time = time.perf_counter()
+    if compiler == "pytket":
+        circuit = circuit_from_qasm(path)
+    elif compiler == "qiskit":
+        circuit = QuantumCircuit.from_qasm_str(qasm)
+    else:
+        raise ValueError(f"Unknown compiler: {compiler}")
+    return circuit, time.perf_counter() - start_time
+
+
+def run_file_stem(compiler_dict: dict, target: str, benchmark: str, run: int):
+    """
+    :return: name, without extension, of a file saved for a run of a
+        benchmark, e.g. its memory timeline or its profile
+    """
+    return (
+        f"{compiler_dict['compiler']}_{compiler_dict['version']}_"
+        f"O{compiler_dict['optimization_level']}_{target}_"
+        f"{os.path.splitext(benchmark)[0]}_run{run}"
+    )
+
+
+def profile_compilation(circuit, backend, compiler_dict: dict, mode: str, path: str):
+    """
+    Profile an extra, untimed compilation of a circuit, so that the profiler
+    does not slow down the timed ones.
+
+    :param circuit: high-level circuit to compile, modified in place by pytket
+    :type circuit: QuantumCircuit or pytket.Circuit
+    :param backend: backend to compile for
+    :type backend: BackendV2
+    :param compiler_dict: dictionary of compiler info
+    :param mode: profiler, "cprofile" or "sampling"
+    :param path: path of the profile without extension, see
+        profiler.profile_call
+    """
+    profile_call(lambda: compile_benchmark(circuit, backend, compiler_dict), mode, path)
+
+
+def transpile_in_process(
+    compiler_dict: dict, backend, circuit, timeline_path: str = None
+):
+    """
+    Transpile a circuit in a worker process to get memory usage.
+
+    The RSS of the worker is sampled on a background thread during the
+    compilation, see MemoryProbe. Only its peak, baseline and area belong to
+    this compilation: the kernel's ru_maxrss is not reported, because the
+    worker is reused across runs and ru_maxrss is the peak over its whole
+    life.
+
+    The tket pass manager, cached per worker, is built before the probe
+    starts, so that every run measures the compilation alone whether or not
+    the worker has built it before.
+
+    :param compiler_dict: dictionary of compiler info
+    :param backend: backend to compile for
+    :type backend: BackendV2
+    :param circuit: benchmark to be transpiled
+    :type circuit: QuantumCircuit or pytket.Circuit
+    :param timeline_path: path of a .npz file to save the sampled RSS
+        timeline to, ``None`` to not save it
+    :return: dictionary of memory metrics in MiB
+    """
+    if compiler_dict["compiler"] == "pytket":
+        get_tket_pass_manager(backend, compiler_dict["optimization_level"])
+    with MemoryProbe() as probe:
+        compile_benchmark(circuit, backend, compiler_dict)
+    if timeline_path:
+        probe.save_timeline(timeline_path)
+    return {
+        "memory_footprint (MiB)": probe.footprint_mib,
+        "memory_baseline (MiB)": probe.baseline_mib,
+        "memory_auc (MiB*s)": probe.auc_mib_s,
+    }
+
+
+def run_task(task: dict):
+    """
+    Execute a task descriptor inside a worker process.
+
+    A task only names the benchmark, the compiler settings and the target, so
+    the cost of sending it does not grow with the size of the suite. Memory is
+    measured around a first compilation; for ``"measure": "all"`` the transpile
+    time is then taken from a second, unprofiled compilation and the depth is
+    computed from its output.
+
+    :param task: dictionary with the keys "benchmark", "path", "run",
+        "compiler", "target", "persist_backends", "verify_depth",
+        "circuit_cache_mib", "memory_timeline" (directory to save the RSS
+        timelines to, or ``None``), "timing" (the TimingHarness of the timed
+        compilation), "pass_timing" (time every pass of the timed
+        compilations), "profile" (profiler of an extra compilation, or
+        ``None``), "profile_dir" and "measure" ("memory" or "all")
+    :return: dictionary with the benchmark name, the target, the run number
+        and the metrics measured for that run
+    """
+    compiler_dict = task["compiler"]
+    circuit = load_benchmark_circuit(
+        task["path"], compiler_dict["compiler"], task["circuit_cache_mib"]
+    )
+    backend = get_fake_flamingo(**task["target"], persist=task["persist_backends"])
+    file_stem = run_file_stem(
+        compiler_dict, task["target"]["target"], task["benchmark"], task["run"]
+    )
+    timeline_path = None
+    if task["memory_timeline"]:
+        timeline_path = os.path.join(task["memory_timeline"], file_stem + ".npz")
+    metrics = transpile_in_process(
+        compiler_dict, backend, copy.deepcopy(circuit), timeline_path
+    )
+
+    if task["measure"] == "all":
+        harness = task["timing"]
+        pass_timer = PassTimer() if task["pass_timing"] else None
+        compiled_circuit, transpile_times = time_compilation(
+            circuit, backend, compiler_dict, harness, pass_timer
+        )
+        if harness.adaptive:
+            metrics["transpile_time (seconds)"] = transpile_times
+            metrics["timing_samples"] = len(transpile_times)
+        else:
+            metrics["transpile_time (seconds)"] = transpile_times[0]
+        if pass_timer is not None:
+            metrics.update(pass_timer.metrics(len(transpile_times)))
+        metrics["depth (gates)"] = compiled_circuit_depth(
+            compiled_circuit, compiler_dict, verify=task["verify_depth"]
+        )
+        if compiler_dict["compiler"] == "pytket":
+            metrics["tket_setup_time (seconds)"] = get_tket_pass_manager(
+                backend, compiler_dict["optimization_level"]
+            )[1]
+        if task["profile"]:
+            profile_compilation(
+                load_benchmark_circuit(
+                    task["path"], compiler_dict["compiler"], task["circuit_cache_mib"]
+                ),
+                backend,
+                compiler_dict,
+                task["profile"],
+                os.path.join(task["profile_dir"], file_stem),
+            )
+
+    return {
+        "benchmark": task["benchmark"],
+        "target": task["target"]["target"],
+        "run": task["run"],
+        "metrics": metrics,
+    }
+
 
 class Runner:
     """
-    Class for running benchmarks on a given backend using a given compiler.
+    Class for running benchmarks on a list of targets using a given compiler.
     """
 
     def __init__(
         self,
         compiler_dict: dict,
-        backend,
+        targets,
         num_runs: int,
         second_compiler_readout: str,
+        jobs: int = 1,
+        max_tasks_per_worker: int = None,
+        max_rss_growth_mib: float = 64,
+        persist_backends: bool = False,
+        verify_depth: bool = False,
+        circuit_cache_mib: float = DEFAULT_CACHE_SIZE_MIB,
+        measure_parse: bool = True,
+        prefetch: int = 1,
+        benchmark_dir: str = None,
+        resume: str = None,
+        sweep: bool = False,
+        memory_timeline: str = None,
+        timing: TimingHarness = None,
+        columnar: str = None,
+        pass_timing: bool = False,
+        profile: str = None,
+        profile_benchmarks=None,
+        profile_dir: str = None,
+        benchmarks=None,
+        worker_pool: WorkerPool = None,
+        parse_times: dict = None,
+        threads: int = None,
+        pin_cpus: bool = False,
     ):
         """
         :param compiler_dict: dictionary of compiler info --> {"compiler": "COMPILER_NAME",
             "version": "VERSION NUM", "optimization_level": OPTIMIZATION_LEVEL}
-        :param backend: name of backend to be used --> "BACKEND_NAME"
-        :param num_runs: number of times to run each benchmark
+        :param targets: name or list of names of the targets to compile for
+            --> "heavy_hex", "all_to_all" or "linear"
+        :param num_runs: number of times to run each benchmark on each target
+        :param jobs: number of worker processes; more than one spreads the
+            (benchmark, target, run) work items over a process pool
+        :param max_tasks_per_worker: recycle a worker process after this many
+            tasks, ``None`` to only recycle on memory growth
+        :param max_rss_growth_mib: recycle a worker process once its resident
+            set size has grown by this many MiB, ``None`` to disable
+        :param persist_backends: also cache the built FakeFlamingo backends on disk
+        :param verify_depth: cross-check the native depth metric against the
+            depth measured from the QASM dump of the compiled circuit
+        :param circuit_cache_mib: size of the on-disk cache of parsed
+            circuits, ``0`` or ``None`` to disable it
+        :param measure_parse: measure the parsing/build_time (and so the
+            total_time) metric, which always parses the .qasm files; without it
+            the circuits are loaded from the circuit cache
+        :param prefetch: number of benchmarks parsed ahead of the one being
+            compiled by the worker processes, ``0`` to parse each benchmark only
+            when it is reached
+        :param benchmark_dir: directory of the .qasm benchmarks, defaults to
+            benchmarking/benchmarks
+        :param resume: path of a results file to add the runs missing from it
+            to, instead of writing a new one; it is started if it does not
+            exist
+        :param sweep: only run the parameterized benchmark families (e.g.
+            efficient_su2_<qubits>) in size order and fit scaling models to
+            their results; the benchmark directory defaults to
+            benchmarking/efficientSU2
+        :param memory_timeline: directory to save the sampled RSS timeline of
+            every memory measurement to, ``None`` to not save them
+        :param timing: timing harness of the timed compilation, a single
+            timed compilation by default; with adaptive timing every run
+            records all of its samples of the transpile time
+        :param columnar: also write the measurements of the results file to a
+            columnar store in results/columnar, "npy" or "parquet"; ``None``
+            to not write one
+        :param pass_timing: time every pass of the timed compilations, adding
+            a pass_time and a pass_size metric per pass and the overhead of
+            the instrumentation, which the transpile time then includes
+        :param profile: profile an extra, untimed compilation of every run
+            with this profiler, "cprofile" or "sampling"; ``None`` to not
+            profile
+        :param profile_benchmarks: glob patterns of the benchmarks to
+            profile, every benchmark by default
+        :param profile_dir: directory to save the .pstats and .folded
+            profiles to, in a subdirectory named after the results file,
+            results/profiles by default
+        :param benchmarks: glob patterns of the benchmarks of the benchmark
+            directory to run, every benchmark by default
+        :param worker_pool: worker pool to run the tasks on, kept open at the
+            end of the session so that other sessions of the same compiler
+            reuse its workers; by default a pool of ``jobs`` workers is
+            started and closed by the session
+        :param parse_times: dictionary mapping benchmark path to its
+            parsing/build_time, shared by sessions that only differ in their
+            optimization level: a benchmark found in it is loaded from the
+            circuit cache and gets the time of the parse already measured,
+            and the parses measured are added to it
+        :param threads: largest number of threads of the compilers in the
+            worker processes, set through their environment before they
+            import the compilers (runner.py --threads also restarts itself
+            with it); unlimited by default
+        :param pin_cpus: pin every worker process to its own ``threads`` (1
+            by default) CPUs, and in a serial session this process to the
+            CPUs of its worker; the CPUs of a shared worker_pool are used
+            as they are
         """
 
         self.compiler_dict = compiler_dict
-        self.backend = backend
+        self.targets = [targets] if isinstance(targets, str) else list(targets)
+        self.target_specs = {target: target_spec(target) for target in self.targets}
         self.num_runs = num_runs
-
-        self.full_benchmark_list = None
-        self.metric_data = {"metadata: ": self.compiler_dict, "backend": self.backend}
-        self.metric_list = [
-            "total_time (seconds)",
-            "parsing/build_time (seconds)",
-            "transpile_time (seconds)",
-            "depth (gates)",
-            "memory_footprint (MiB)",
-        ]
+        self.jobs = jobs
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.max_rss_growth_mib = max_rss_growth_mib
+        self.persist_backends = persist_backends
+        self.verify_depth = verify_depth
+        self.circuit_cache_mib = circuit_cache_mib or None
+        self.circuit_cache = (
+            CircuitCache(max_size_mib=circuit_cache_mib) if circuit_cache_mib else None
+        )
+        self.measure_parse = measure_parse
+        self.prefetch = prefetch
+        self.sweep = sweep
+        self.memory_timeline = memory_timeline and os.path.abspath(memory_timeline)
+        self.timing = timing or TimingHarness()
+        self.columnar = columnar
+        self.pass_timing = pass_timing
+        self.profile = profile
+        self.profile_benchmarks = profile_benchmarks
+        self.profile_dir = os.path.abspath(profile_dir or PROFILE_DIR)
+        # Options of the task of every run, see tasks.build_task
+        self.task_options = {
+            "persist_backends": self.persist_backends,
+            "verify_depth": self.verify_depth,
+            "circuit_cache_mib": self.circuit_cache_mib,
+            "memory_timeline": self.memory_timeline,
+            "pass_timing": self.pass_timing,
+            "profile": self.profile,
+            "profile_benchmarks": self.profile_benchmarks,
+            "profile_dir": self.profile_dir,
+        }
+        if benchmark_dir is None and sweep:
+            benchmark_dir = SWEEP_BENCHMARK_DIR
+        self.benchmark_dir = benchmark_dir or BENCHMARK_DIR
+        self.worker_pool = None
+        self.shared_worker_pool = worker_pool
+        self.benchmark_patterns = benchmarks
+        self.parse_times = parse_times
+        self.threads = threads
+        self.worker_environment = thread_environment(threads) if threads else None
+        if worker_pool is not None:
+            self.cpu_sets = worker_pool.cpu_sets
+        elif pin_cpus:
+            self.cpu_sets = cpu_slots(self.jobs, threads or 1)
+        else:
+            self.cpu_sets = None
+        self.resume = resume
+        self.results_path = None
+        self.results_log = None
+        self.legacy_results = False
+        # Indices of the runs of every (target, benchmark) measured by a
+        # previous session
+        self.completed_runs = {}
+
+        self.benchmark_paths = {}
+        # Results are grouped per target, each in the format of a results entry
+        self.metric_data = {
+            target: {"metadata: ": self.compiler_dict, "backend": target}
+            for target in self.targets
+        }
+        self.metric_list = session_metrics(
+            self.compiler_dict["compiler"],
+            measure_parse=self.measure_parse,
+            adaptive=self.timing.adaptive,
+            pass_timing=self.pass_timing,
+        )
         self.second_compiler_readout = second_compiler_readout
         self.progress_visualizer = None
 
         self.preprocess_benchmarks()
+        if self.resume:
+            self.load_completed_runs(self.resume)
 
     def get_qasm_benchmark(self, qasm_name):
-        benchmarking_path = os.path.join(
-            os.path.dirname(__file__), "benchmarking", "benchmarks"
-        )
         with open(
-            os.path.join(benchmarking_path, qasm_name), "r", encoding="utf-8"
+            os.path.join(self.benchmark_dir, qasm_name), "r", encoding="utf-8"
         ) as file:
             qasm = file.read()
         return qasm
@@ -149,149 +653,436 @@ class Runner:
     def preprocess_benchmarks(self):
         """
         Preprocess benchmarks before running them.
+
+        Only the benchmark files are listed here; the circuits are parsed by
+        iter_benchmarks just before they are run.
         """
-        benchmarking_path = os.path.join(
-            os.path.dirname(__file__), "benchmarking", "benchmarks"
-        )
-        benchmarks = self.list_files(benchmarking_path)
-        self.full_benchmark_list = []
-        
+        benchmarks = list_benchmarks(self.benchmark_dir, self.benchmark_patterns)
+        if self.sweep:
+            benchmarks = sweep_order(benchmarks)
+
         # Initialize progress visualizer
         self.progress_visualizer = ProgressVisualizer(
-            total_benchmarks=len([b for b in benchmarks if b != ".DS_Store"]),
+            total_benchmarks=len(benchmarks) * len(self.targets),
             num_runs=self.num_runs,
             compiler_info=self.compiler_dict
         )
-        
+
         for benchmark in benchmarks:
-            if benchmark == ".DS_Store":
-                continue
-            qasm = self.get_qasm_benchmark(benchmark)
+            self.benchmark_paths[benchmark] = os.path.join(
+                self.benchmark_dir, benchmark
+            )
+            for target in self.targets:
+                self.metric_data[target][benchmark] = {
+                    metric: [] for metric in self.metric_list
+                }
+
+    def load_benchmark(self, benchmark: str):
+        """
+        Parse a benchmark, recording its parsing/build_time for every target.
+
+        :param benchmark: name of the benchmark
+        :return: the parsed circuit
+        """
+        path = self.benchmark_paths[benchmark]
+        compiler = self.compiler_dict["compiler"]
+        if not self.measure_parse:
+            if self.circuit_cache:
+                return self.circuit_cache.load(path, compiler)
+            return parse_circuit(path, compiler)
+
+        if self.parse_times is not None and path in self.parse_times:
+            # Parsed by a session of another optimization level
+            parse_time = self.parse_times[path]
+            if self.circuit_cache:
+                circuit = self.circuit_cache.load(path, compiler)
+            else:
+                circuit = parse_circuit(path, compiler)
+        else:
             print(f"Converting {benchmark} to high-level circuit...")
+            circuit, parse_time = time_parse(path, compiler)
+            if self.parse_times is not None:
+                self.parse_times[path] = parse_time
+        # The circuit is parsed once and shared by every target
+        for target in self.targets:
+            self.metric_data[target][benchmark]["parsing/build_time (seconds)"].append(
+                parse_time
+            )
+        if self.results_log:
+            self.results_log.log_parse(self.compiler_dict, benchmark, parse_time)
+        # Workers and later sessions load the parsed circuit from the cache
+        if self.circuit_cache and not self.circuit_cache.contains(path, compiler):
+            self.circuit_cache.put(path, compiler, circuit)
+        return circuit
+
+    def load_completed_runs(self, results_path: str):
+        """
+        Load the runs of this compiler already in a results file into
+        ``metric_data``, so that only the missing runs are measured and the
+        aggregates cover old and new runs together.
+
+        :param results_path: path of the results file, whose log is written
+            first if it was saved without one; a results file that does not
+            exist yet is started
+        """
+        if not os.path.exists(log_path(results_path)):
+            if not os.path.exists(results_path):
+                return
+            import_results(results_path, log_path(results_path))
+        records = read_log(log_path(results_path))
+        self.completed_runs = completed_runs(records, self.compiler_dict)
+
+        for entry in results_from_records(records):
+            target = entry["backend"]
+            if (
+                compiler_key(entry["metadata: "]) != compiler_key(self.compiler_dict)
+                or target not in self.targets
+            ):
+                continue
+            for benchmark, benchmark_data in entry.items():
+                if benchmark not in self.benchmark_paths:
+                    continue
+                for metric in self.metric_list:
+                    self.metric_data[target][benchmark][metric].extend(
+                        benchmark_data.get(metric, [])
+                    )
+
+        num_completed = sum(
+            self.num_runs - len(self.pending_runs(benchmark, target))
+            for benchmark in self.benchmark_paths
+            for target in self.targets
+        )
+        if self.progress_visualizer:
+            self.progress_visualizer.info(
+                f"Resuming {results_path}: {num_completed} of "
+                f"{self.num_runs * len(self.benchmark_paths) * len(self.targets)} "
+                "runs already measured"
+            )
+
+    def pending_runs(self, benchmark: str, target: str):
+        """
+        :return: indices of the runs of a benchmark on a target that are still
+            to be measured
+        """
+        completed = self.completed_runs.get((target, benchmark), set())
+        return [run_num for run_num in range(self.num_runs) if run_num not in completed]
+
+    def iter_benchmarks(self, prefetch: int = 0):
+        """
+        Yield the benchmarks one at a time, parsing each just before it is
+        needed so that only a bounded number of circuits is alive at once.
+
+        Benchmarks with no pending run on any target are skipped.
 
-            start_time = time.perf_counter()
-            if self.compiler_dict["compiler"] == "pytket":
-                circuit = circuit_from_qasm(os.path.join(benchmarking_path, benchmark))
-            elif self.compiler_dict["compiler"] == "qiskit":
-                circuit = QuantumCircuit.from_qasm_str(qasm)
-            build_time = time.perf_counter()
-            self.full_benchmark_list.append({benchmark: circuit})
-            self.metric_data[benchmark] = {
-                "total_time (seconds)": [],
-                "parsing/build_time (seconds)": [build_time - start_time],
-                "transpile_time (seconds)": [],
-                "depth (gates)": [],
-                "memory_footprint (MiB)": [],
-            }
+        :param prefetch: number of benchmarks parsed ahead in a background
+            thread while the caller works on the current one
+        :return: generator of (benchmark name, circuit) pairs
+        """
+        benchmarks = [
+            benchmark
+            for benchmark in self.benchmark_paths
+            if any(self.pending_runs(benchmark, target) for target in self.targets)
+        ]
+        if prefetch <= 0:
+            for benchmark in benchmarks:
+                yield benchmark, self.load_benchmark(benchmark)
+            return
+
+        # A single thread keeps the timed parses from overlapping each other
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = deque()
+            for benchmark in benchmarks:
+                pending.append(
+                    (benchmark, executor.submit(self.load_benchmark, benchmark))
+                )
+                if len(pending) > prefetch:
+                    name, future = pending.popleft()
+                    yield name, future.result()
+            while pending:
+                name, future = pending.popleft()
+                yield name, future.result()
 
     def run_benchmarks(self):
         """
-        Run all benchmarks in full_benchmark_list.
+        Run every benchmark on every target.
         """
         if self.progress_visualizer:
             self.progress_visualizer.start_benchmarking()
-        
-        for benchmark in self.full_benchmark_list:
-            benchmark_name = list(benchmark.keys())[0]
-            
-            if self.progress_visualizer:
-                self.progress_visualizer.start_benchmark(benchmark_name)
 
-            for run_num in range(self.num_runs):
+        # Every completed measurement is appended to the log of the results
+        # file straight away, so an interrupted session keeps them
+        self.results_path = self.get_results_path()
+        # A results file written before logs existed is extended the old way
+        self.legacy_results = (
+            self.second_compiler_readout == "true"
+            and not self.resume
+            and not os.path.exists(log_path(self.results_path))
+        )
+        if self.cpu_sets and self.jobs == 1:
+            # The timed compilations of a serial session run in this process
+            pin_process(self.cpu_sets[0])
+        # Only a results file named by --resume, or the one a second compiler
+        # is added to, may already have a log
+        self.results_log = ResultsLog(
+            log_path(self.results_path),
+            append=bool(self.resume) or self.second_compiler_readout == "true",
+        )
+        self.results_log.log_session(
+            self.compiler_dict,
+            self.targets,
+            self.metric_list,
+            self.benchmark_paths,
+            # The parses of a parallel session run while the workers compile
+            execution_metadata(
+                self.threads,
+                self.cpu_sets,
+                parse_overlap=self.jobs > 1 and self.measure_parse,
+            ),
+        )
+
+        # The worker processes are started once and reused by every run
+        self.worker_pool = self.shared_worker_pool or WorkerPool(
+            self.jobs,
+            max_tasks_per_worker=self.max_tasks_per_worker,
+            max_rss_growth_mib=self.max_rss_growth_mib,
+            cpu_sets=self.cpu_sets,
+            environment=self.worker_environment,
+        )
+        try:
+            if self.jobs > 1:
+                self.run_benchmarks_parallel()
+            else:
+                self.run_benchmarks_serial()
+        finally:
+            if self.worker_pool is not self.shared_worker_pool:
+                self.worker_pool.close()
+            self.worker_pool = None
+            self.results_log.close()
+
+        if self.progress_visualizer:
+            self.progress_visualizer.print_summary()
+
+        self.save_results()
+        if self.sweep:
+            self.save_scaling_report()
+
+    def run_benchmarks_serial(self):
+        """
+        Run every benchmark one run at a time in this process.
+        """
+        # Benchmarks are not prefetched here: a parse in a background thread
+        # would compete with the timed compilation in this process.
+        for benchmark_name, circuit in self.iter_benchmarks():
+            benchmark = {benchmark_name: circuit}
+
+            for target in self.targets:
+                run_nums = self.pending_runs(benchmark_name, target)
+                if not run_nums:
+                    continue
+                label = self.progress_label(benchmark_name, target)
+                if self.progress_visualizer:
+                    self.progress_visualizer.start_benchmark(label)
+
+                for run_num in run_nums:
+                    if self.progress_visualizer:
+                        self.progress_visualizer.start_run(run_num + 1)
+
+                    metrics = self.run_benchmark(benchmark, target, run_num)
+                    self.results_log.log_run(
+                        self.compiler_dict, target, benchmark_name, run_num, metrics
+                    )
+
+                self.calculate_aggregate_statistics(benchmark_name, target)
+
                 if self.progress_visualizer:
-                    self.progress_visualizer.start_run(run_num + 1)
-                
-                self.run_benchmark(benchmark)
+                    self.progress_visualizer.complete_benchmark(
+                        label, self.metric_data[target][benchmark_name]
+                    )
+            del benchmark, circuit
 
-            self.calculate_aggregate_statistics(benchmark)
-            
+    def run_benchmarks_parallel(self):
+        """
+        Spread every (benchmark, target, run) work item over the ``self.jobs``
+        worker processes of the pool. Results are merged back into
+        ``metric_data`` in run order.
+
+        The tasks are generated lazily: the pool only asks for the next task
+        when a worker is idle, so a benchmark is parsed (timed, and stored in
+        the circuit cache the workers load from) shortly before its tasks are
+        sent, with ``self.prefetch`` benchmarks parsed ahead.
+        """
+        tasks = (
+            (self.make_task(name, target, run_num, "all"),)
+            for name, _ in self.iter_benchmarks(self.prefetch)
+            for target in self.targets
+            for run_num in self.pending_runs(name, target)
+        )
+        run_results = {
+            (name, target): {}
+            for name in self.benchmark_paths
+            for target in self.targets
+        }
+        num_pending = {
+            (name, target): len(self.pending_runs(name, target))
+            for name, target in run_results
+        }
+
+        for record in self.worker_pool.imap_unordered(run_task, tasks):
+            benchmark_name, target = record["benchmark"], record["target"]
+            run_num = record["run"]
+            metrics = record["metrics"]
+            if self.measure_parse:
+                metrics["total_time (seconds)"] = total_time(
+                    metrics["transpile_time (seconds)"],
+                    self.metric_data[target][benchmark_name][
+                        "parsing/build_time (seconds)"
+                    ][-1],
+                )
+            self.results_log.log_run(
+                self.compiler_dict, target, benchmark_name, run_num, metrics
+            )
+            runs = run_results[(benchmark_name, target)]
+            runs[run_num] = metrics
             if self.progress_visualizer:
-                self.progress_visualizer.complete_benchmark(
-                    benchmark_name, 
-                    self.metric_data[benchmark_name]
+                self.progress_visualizer.start_run(run_num + 1)
+                self.progress_visualizer.update_progress(
+                    f"✓ {self.progress_label(benchmark_name, target)} run {run_num + 1}",
+                    "\033[96m",
                 )
-        
+            if len(runs) == num_pending[(benchmark_name, target)]:
+                self.record_runs(benchmark_name, target, runs)
+
+    def record_runs(self, benchmark_name: str, target: str, runs: dict):
+        """
+        Merge the per-run metrics of a benchmark on a target into
+        ``metric_data`` and aggregate them.
+
+        :param benchmark_name: name of the benchmark
+        :param target: name of the target
+        :param runs: dictionary mapping run number to the metrics of that run
+        """
+        benchmark_data = self.metric_data[target][benchmark_name]
+        for run_num in sorted(runs):
+            add_run_metrics(benchmark_data, runs[run_num])
+
+        self.calculate_aggregate_statistics(benchmark_name, target)
+
         if self.progress_visualizer:
-            self.progress_visualizer.print_summary()
-            
-        self.save_results()
+            self.progress_visualizer.complete_benchmark(
+                self.progress_label(benchmark_name, target), benchmark_data
+            )
 
-    def save_results(self):
-        results_dir = os.path.join(os.path.dirname(__file__), "results")
+    @staticmethod
+    def progress_label(benchmark_name: str, target: str):
+        """
+        :return: name of a (benchmark, target) pair in the progress display
+        """
+        return f"{benchmark_name} [{target}]"
 
+    def get_results_path(self):
+        """
+        :return: path of the results file of this session, the previous one
+            when the results of a second compiler are added to it; run
+            numbers left by interrupted sessions are skipped, see
+            results_log.next_results_path
+        """
+        if self.resume:
+            return self.resume
         # Check if the directory exists and create it if it doesn't
-        if not os.path.exists(results_dir):
-            os.makedirs(results_dir)
+        if not os.path.exists(RESULTS_DIR):
+            os.makedirs(RESULTS_DIR)
 
-        self.delete_ds_store("results")
-        run_number = len(self.list_files("results")) + 1
+        self.delete_ds_store(RESULTS_DIR)
+        return next_results_path(reuse_last=self.second_compiler_readout == "true")
 
-        if self.second_compiler_readout == "true":
-            results_path = os.path.join(
-                os.path.dirname(__file__),
-                "results",
-                f"results_run{run_number - 1}.json",
-            )
+    def save_results(self):
+        """
+        Build the results file from its log.
 
+        The log of a results file holds the sessions of every compiler written
+        to it, so adding a second compiler does not need to read the results
+        file back. Only a results file written before logs existed is extended
+        the old way.
+        """
+        results_path = self.results_path
+        data = []
+        if self.legacy_results:
             with open(results_path, "r", encoding="utf-8") as json_file:
                 data = json.load(json_file)
-            data.append(self.metric_data)
-            with open(results_path, "w", encoding="utf-8") as json_file:
-                json.dump(data, json_file, indent=2)
-        else:
-            results_path = os.path.join(
-                os.path.dirname(__file__), "results", f"results_run{run_number}.json"
-            )
-            with open(results_path, "w", encoding="utf-8") as json_file:
-                json.dump([self.metric_data], json_file, indent=2)
-        
+        data.extend(build_results(log_path(results_path)))
+        write_results(data, results_path)
+
         if self.progress_visualizer:
             self.progress_visualizer.info(f"Results saved to: {results_path}")
 
-    def transpile_in_process(self, benchmark: QuantumCircuit, optimization_level: int):
+        if self.columnar:
+            columnar_path = store_path(results_path, self.columnar)
+            write_store(read_log(log_path(results_path)), columnar_path, self.columnar)
+            if self.progress_visualizer:
+                self.progress_visualizer.info(f"Store saved to: {columnar_path}")
+
+    def save_scaling_report(self):
+        """
+        Fit scaling models to the benchmark families of the results file and
+        save them to results/scaling.
         """
-        Transpile a circuit in a separate process to get memory usage.
+        with open(self.results_path, "r", encoding="utf-8") as json_file:
+            entries = json.load(json_file)
+        records = fit_results(entries, self.benchmark_dir)
+        print(format_report(records))
+        report_path = save_report(records, self.results_path)
+        if self.progress_visualizer:
+            self.progress_visualizer.info(f"Scaling report saved to: {report_path}")
 
-        :param benchmark: benchmark to be transpiled
-        :param optimization_level: level of optimization to be used
+    def make_task(self, benchmark_name: str, target: str, run_num: int, measure: str):
         """
-        backend = FakeFlamingo(qubits=200, target=self.backend, distance=11) #choose_backend(self.backend)  
-        start_mem = memory_usage(max_usage=True)
-        if self.compiler_dict["compiler"] == "pytket":
-            tket_pm = initialize_tket_pass_manager(backend, optimization_level)
-            tket_pm.apply(benchmark)
-        else:
-            transpile(
-                benchmark, backend, optimization_level=optimization_level
-            )
+        Build the task descriptor sent to a worker process.
 
-        end_mem = memory_usage(max_usage=True)
-        memory = end_mem - start_mem
-        return memory
+        :param benchmark_name: name of the benchmark
+        :param target: name of the target
+        :param run_num: index of the run
+        :param measure: "memory" to only measure memory, "all" for every metric
+        """
+        return build_task(
+            benchmark_name,
+            self.benchmark_paths[benchmark_name],
+            run_num,
+            self.compiler_dict,
+            self.target_specs[target],
+            self.timing,
+            self.task_options,
+            self.results_path,
+            measure,
+        )
 
-    def profile_func(self, benchmark: QuantumCircuit):
+    def profile_func(self, benchmark_name: str, target: str, run_num: int = 0):
         """
         Profile a function to get memory usage.
 
-        :param benchmark: benchmark to be run
+        :param benchmark_name: name of the benchmark to be run
+        :param target: name of the target
+        :param run_num: index of the run
+        :return: dictionary of memory metrics
         """
         # To get accurate memory usage, need to multiprocess transpilation
-        with multiprocessing.Pool(1) as pool:
-            memory = pool.apply(
-                self.transpile_in_process,
-                (benchmark, self.compiler_dict["optimization_level"]),
-            )
-        return memory
+        record = self.worker_pool.apply(
+            run_task, (self.make_task(benchmark_name, target, run_num, "memory"),)
+        )
+        return record["metrics"]
 
-    def run_benchmark(self, benchmark: dict):
+    def run_benchmark(self, benchmark: dict, target: str, run_num: int = 0):
         """
         Run a single benchmark.
 
         :param benchmark: Name and circuit of benchmark to be run
+        :param target: name of the target to compile for
+        :param run_num: index of the run
+        :return: dictionary of the metrics of the run
         """
 
         benchmark_name = list(benchmark.keys())[0]
         benchmark_circuit = list(benchmark.values())[0]
+        benchmark_data = self.metric_data[target][benchmark_name]
 
         #############################
         # MEMORY FOOTPRINT
@@ -302,11 +1093,11 @@ class Runner:
             self.progress_visualizer.update_progress("📊 Calculating memory footprint...", "\033[96m")
         
         # Multiprocesss transpilation to get accurate memory usage
-        # Must deepcopy benchmark_circuit to avoid compiling the same circuit multiple times
-        memory = self.profile_func(copy.deepcopy(benchmark_circuit))
-        self.metric_data[benchmark_name]["memory_footprint (MiB)"].append(memory)
+        metrics = self.profile_func(benchmark_name, target, run_num)
 
-        backend = backend = FakeFlamingo(qubits=200, target=self.backend, distance=11)
+        backend = get_fake_flamingo(
+            **self.target_specs[target], persist=self.persist_backends
+        )
 
         #############################
         # TRANSPILATION TIME
@@ -316,32 +1107,31 @@ class Runner:
             self.progress_visualizer.update_progress("⚡ Calculating transpilation time...", "\033[93m")
         
         # to get accurate time measurement, need to run transpilation without profiling
-        benchmark_copy = copy.deepcopy(benchmark_circuit)
-        if self.compiler_dict["compiler"] == "pytket":
-            tket_pm = initialize_tket_pass_manager(
-                backend, optimization_level=self.compiler_dict["optimization_level"]
-            )
-            start_time = time.perf_counter()
-            tket_pm.apply(benchmark_copy)
-
+        pass_timer = PassTimer() if self.pass_timing else None
+        transpiled_circuit, transpile_times = time_compilation(
+            copy.deepcopy(benchmark_circuit),
+            backend,
+            self.compiler_dict,
+            self.timing,
+            pass_timer,
+        )
+        if self.timing.adaptive:
+            metrics["transpile_time (seconds)"] = transpile_times
+            metrics["timing_samples"] = len(transpile_times)
         else:
-            start_time = time.perf_counter()
-            transpiled_circuit = transpile(
-                benchmark_copy,
-                backend=backend,
-                optimization_level=self.compiler_dict["optimization_level"],
+            metrics["transpile_time (seconds)"] = transpile_times[0]
+        if pass_timer is not None:
+            metrics.update(pass_timer.metrics(len(transpile_times)))
+        if self.measure_parse:
+            metrics["total_time (seconds)"] = total_time(
+                metrics["transpile_time (seconds)"],
+                benchmark_data["parsing/build_time (seconds)"][-1],
             )
-
-        end_time = time.perf_counter()
-        self.metric_data[benchmark_name]["transpile_time (seconds)"].append(
-            end_time - start_time
-        )
-        self.metric_data[benchmark_name]["total_time (seconds)"].append(
-            end_time
-            - start_time
-            + +self.metric_data[benchmark_name]["parsing/build_time (seconds)"][-1]
-            + self.metric_data[benchmark_name]["transpile_time (seconds)"][-1]
-        )
+        if self.compiler_dict["compiler"] == "pytket":
+            _, setup_time = get_tket_pass_manager(
+                backend, self.compiler_dict["optimization_level"]
+            )
+            metrics["tket_setup_time (seconds)"] = setup_time
 
         #############################
         # DEPTH
@@ -349,96 +1139,291 @@ class Runner:
 
         if self.progress_visualizer:
             self.progress_visualizer.update_progress("🔍 Calculating circuit depth...", "\033[95m")
-        if self.compiler_dict["compiler"] == "pytket":
-            transpiled_circuit = benchmark_copy
-            qasm_string = circuit_to_qasm_str(transpiled_circuit)
-        else:
-            # If the qiskit version is less than 1.0 use the old qasm method
-            if int(qiskit.__version__[0]) < 1:
-                qasm_string = transpiled_circuit.qasm()
-            else:
-                qasm_string = qasm2.dumps(transpiled_circuit)
-        processed_qasm = Preprocess(qasm_string)
-        depth = self.get_circuit_depth(processed_qasm)
-        self.metric_data[benchmark_name]["depth (gates)"].append(depth)
-
-    def get_circuit_depth(self, benchmark):
-        self.get_qubit_depths(benchmark)
-        _, depth = self.get_maximum_qubit_depth(benchmark)
+        metrics["depth (gates)"] = compiled_circuit_depth(
+            transpiled_circuit, self.compiler_dict, verify=self.verify_depth
+        )
+
+        # Profiled after the timed compilation, which it must not slow down
+        if is_profiled(benchmark_name, self.profile, self.profile_benchmarks):
+            profile_compilation(
+                copy.deepcopy(benchmark_circuit),
+                backend,
+                self.compiler_dict,
+                self.profile,
+                os.path.join(
+                    session_profile_dir(self.profile_dir, self.results_path),
+                    run_file_stem(self.compiler_dict, target, benchmark_name, run_num),
+                ),
+            )
+        add_run_metrics(benchmark_data, metrics)
+        return metrics
+
+    @staticmethod
+    def get_circuit_depth(benchmark):
+        _, depth = Runner.get_maximum_qubit_depth(benchmark)
         return depth
 
-    def get_qubit_depths(self, benchmark):
+    @staticmethod
+    def get_qubit_depths(benchmark):
         """
         Get depth of a specific qubit
         :return:
         """
-        qubit_depth = {}
-        for gate in benchmark.processed_qasm:
-            op = benchmark.get_op(gate)
-            if op not in benchmark.GATE_TABLE:
-                print(
-                    f"{op} not counted towards evaluation. Not a valid from default gate tables"
-                )
-                continue
-            qubit_id = benchmark.get_qubit_id(gate)
-            for qubit in qubit_id:
-                if qubit not in qubit_depth:
-                    qubit_depth[qubit] = 0
-                qubit_depth[qubit] += 1
-        return qubit_depth
-
-    def get_maximum_qubit_depth(self, benchmark):
+        for op in benchmark.uncounted_ops():
+            print(
+                f"{op} not counted towards evaluation. Not a valid from default gate tables"
+            )
+        labels = {index: label for label, index in benchmark.qubit_labelled.items()}
+        return {
+            labels[index]: int(depth)
+            for index, depth in enumerate(benchmark.qubit_depths())
+            if depth
+        }
+
+    @staticmethod
+    def get_maximum_qubit_depth(benchmark):
         """
         Get maximum qubit depth
         :return:
         """
-        qubit_depths = self.get_qubit_depths(benchmark)
-        max_value = max(qubit_depths.values())  # maximum value
-        max_keys = [k for k, v in qubit_depths.items() if v == max_value][0]
+        qubit_depths = Runner.get_qubit_depths(benchmark)
+        max_value = max(qubit_depths.values(), default=0)  # maximum value
+        max_keys = next((k for k, v in qubit_depths.items() if v == max_value), None)
         # getting all keys containing the `maximum`
         return max_keys, max_value
 
-    def calculate_aggregate_statistics(self, benchmark):
+    def calculate_aggregate_statistics(self, benchmark_name: str, target: str):
         """
         Calculate aggregate statistics on metrics.
         """
         # For each metric, calculate mean, median, range, variance, standard dev
-        benchmark_name = list(benchmark.keys())[0]
-        self.metric_data[benchmark_name]["aggregate"] = {}
-        for metric in self.metric_list:
-            self.metric_data[benchmark_name]["aggregate"][metric] = {}
-            self.metric_data[benchmark_name]["aggregate"][metric]["mean"] = np.mean(
-                np.array(self.metric_data[benchmark_name][metric], dtype=float)
-            )
-            self.metric_data[benchmark_name]["aggregate"][metric]["median"] = np.median(
-                np.array(self.metric_data[benchmark_name][metric], dtype=float)
-            )
-            self.metric_data[benchmark_name]["aggregate"][metric]["range"] = (
-                np.min(np.array(self.metric_data[benchmark_name][metric], dtype=float)),
-                np.max(np.array(self.metric_data[benchmark_name][metric], dtype=float)),
-            )
-            self.metric_data[benchmark_name]["aggregate"][metric]["variance"] = np.var(
-                np.array(self.metric_data[benchmark_name][metric], dtype=float)
-            )
-            self.metric_data[benchmark_name]["aggregate"][metric][
-                "standard_deviation"
-            ] = np.std(np.array(self.metric_data[benchmark_name][metric], dtype=float))
+        benchmark_data = self.metric_data[target][benchmark_name]
+        benchmark_data["aggregate"] = aggregate_metrics(
+            benchmark_data, self.metric_list
+        )
 
 
 if __name__ == "__main__":
 
-    targets = ["heavy_hex", "all_to_all", "linear"]
-
-    for target in targets:
-
-        runner = Runner(
-            {
-                "compiler": str(sys.argv[1]),
-                "version": str(sys.argv[2]),
-                "optimization_level": int(sys.argv[3]),
-            },
-            target,
-            int(sys.argv[5]),
-            str(sys.argv[6]),
-        )
-        runner.run_benchmarks()
+    parser = argparse.ArgumentParser(description="Run the red-queen benchmarks.")
+    parser.add_argument("compiler")
+    parser.add_argument("version")
+    parser.add_argument("optimization_level", type=int)
+    parser.add_argument("backend", help="unused, see --targets")
+    parser.add_argument("num_runs", type=int)
+    parser.add_argument("second_compiler_readout")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes to spread (benchmark, target, run) "
+        "work items over",
+    )
+    parser.add_argument(
+        "--targets",
+        nargs="+",
+        default=["heavy_hex", "all_to_all", "linear"],
+        choices=["heavy_hex", "all_to_all", "linear"],
+        help="targets to compile for, all of them by default",
+    )
+    parser.add_argument(
+        "--benchmark-dir",
+        default=None,
+        help="directory of the .qasm benchmarks, benchmarking/benchmarks by default",
+    )
+    parser.add_argument(
+        "--benchmarks",
+        nargs="+",
+        default=None,
+        metavar="PATTERN",
+        help="glob patterns of the benchmarks to run, all of them by default",
+    )
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="run the benchmark families (efficient_su2_<qubits>, ...) in size "
+        "order and fit scaling models to their results",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="limit the thread pools of the compilers (RAYON_NUM_THREADS, "
+        "OMP_NUM_THREADS, qiskit parallel settings) to this many threads",
+    )
+    parser.add_argument(
+        "--pin-cpus",
+        action="store_true",
+        help="pin every worker process to its own --threads (1 by default) CPUs",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=0,
+        help="untimed compilations before the timed ones of every run",
+    )
+    parser.add_argument(
+        "--disable-gc",
+        action="store_true",
+        help="disable the garbage collector during the timed compilations",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="repeat the timed compilation of every run until the median is "
+        "precise to --target-rel-ci or --time-budget runs out",
+    )
+    parser.add_argument(
+        "--target-rel-ci",
+        type=float,
+        default=0.02,
+        help="relative width of the 95%% confidence interval of the median "
+        "transpile time at which adaptive timing stops",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        default=30.0,
+        help="seconds of timed compilations per run after which adaptive "
+        "timing stops",
+    )
+    parser.add_argument(
+        "--max-samples",
+        type=int,
+        default=1000,
+        help="largest number of timed compilations per run with --adaptive",
+    )
+    parser.add_argument(
+        "--pass-timing",
+        action="store_true",
+        help="time every pass of the timed compilations (transpile callback for "
+        "qiskit, pass by pass for pytket)",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        choices=PROFILE_MODES,
+        help="profile an extra, untimed compilation of every run and save it as "
+        ".pstats and collapsed stacks (.folded) for flame graphs",
+    )
+    parser.add_argument(
+        "--profile-benchmarks",
+        nargs="+",
+        default=None,
+        metavar="PATTERN",
+        help="glob patterns of the benchmarks to profile, all of them by default",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=None,
+        metavar="DIR",
+        help="directory of the profiles, results/profiles by default",
+    )
+    parser.add_argument(
+        "--memory-timeline",
+        default=None,
+        metavar="DIR",
+        help="save the sampled RSS timeline of every memory measurement to DIR",
+    )
+    parser.add_argument(
+        "--columnar",
+        nargs="?",
+        const="npy",
+        default=None,
+        choices=["npy", "parquet"],
+        help="also write the measurements to a columnar store in results/columnar, "
+        "npy columns by default or a Parquet file (needs pyarrow)",
+    )
+    parser.add_argument(
+        "--resume",
+        default=None,
+        metavar="RESULTS",
+        help="add the runs missing from this results file to it instead of "
+        "writing a new one (it is started if it does not exist)",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=1,
+        help="benchmarks parsed ahead of the ones being compiled with --jobs > 1",
+    )
+    parser.add_argument(
+        "--max-tasks-per-worker",
+        type=int,
+        default=None,
+        help="recycle a worker process after this many tasks",
+    )
+    parser.add_argument(
+        "--max-rss-growth",
+        type=float,
+        default=64,
+        help="recycle a worker process once its RSS has grown by this many MiB",
+    )
+    parser.add_argument(
+        "--persist-backends",
+        action="store_true",
+        help="cache the built FakeFlamingo backends on disk between sessions",
+    )
+    parser.add_argument(
+        "--verify-depth",
+        action="store_true",
+        help="cross-check the native depth metric against the QASM round-trip",
+    )
+    parser.add_argument(
+        "--circuit-cache-size",
+        type=float,
+        default=DEFAULT_CACHE_SIZE_MIB,
+        help="size in MiB of the on-disk cache of parsed circuits, 0 to disable it",
+    )
+    parser.add_argument(
+        "--no-parse-time",
+        action="store_true",
+        help="skip the parsing/build_time and total_time metrics and load the "
+        "parsed circuits from the cache",
+    )
+    args = parser.parse_args()
+    if args.threads:
+        # The limits must be in the environment before the compilers load
+        restart_with_environment(thread_environment(args.threads))
+
+    # A single Runner serves every target so that the parsed circuits, the
+    # worker processes and the cached backends are shared by the whole matrix
+    runner = Runner(
+        {
+            "compiler": args.compiler,
+            "version": args.version,
+            "optimization_level": args.optimization_level,
+        },
+        args.targets,
+        args.num_runs,
+        args.second_compiler_readout,
+        jobs=args.jobs,
+        max_tasks_per_worker=args.max_tasks_per_worker,
+        max_rss_growth_mib=args.max_rss_growth,
+        persist_backends=args.persist_backends,
+        verify_depth=args.verify_depth,
+        circuit_cache_mib=args.circuit_cache_size,
+        measure_parse=not args.no_parse_time,
+        prefetch=args.prefetch,
+        benchmark_dir=args.benchmark_dir,
+        resume=args.resume,
+        sweep=args.sweep,
+        memory_timeline=args.memory_timeline,
+        timing=TimingHarness(
+            warmup=args.warmup,
+            disable_gc=args.disable_gc,
+            adaptive=args.adaptive,
+            target_rel_ci=args.target_rel_ci,
+            budget=args.time_budget,
+            max_samples=args.max_samples,
+        ),
+        columnar=args.columnar,
+        pass_timing=args.pass_timing,
+        profile=args.profile,
+        profile_benchmarks=args.profile_benchmarks,
+        profile_dir=args.profile_dir,
+        benchmarks=args.benchmarks,
+        threads=args.threads,
+        pin_cpus=args.pin_cpus,
+    )
+    runner.run_benchmarks()
@@ -0,0 +1,350 @@
+"""
+This module finds the parameterized benchmark families of a benchmark
+directory (e.g. efficient_su2_20 ... efficient_su2_200) and fits empirical
+scaling models to the results measured on them.
+
+For every compiler, target, family and metric, two models are fitted against
+the number of qubits and the number of gates of the benchmarks:
+
+* a power law ``y = a * n^b``, fitted in log-log space, reporting the
+  exponent ``b`` with its confidence interval
+* ``y = c * n log n + d``, reporting the coefficient ``c`` with its
+  confidence interval
+
+Every run is a data point, so the intervals reflect the run-to-run noise.
+
+Usage: python3 scaling.py RESULTS [--benchmark-dir DIR] [--output PATH]
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import argparse
+import json
+import os
+import re
+
+import numpy as np
+from scipy import stats
+
+from circuit_cache import CircuitCache
+from preprocessing import GATE_TABLE
+
+SCALING_DIR = os.path.join(os.path.dirname(__file__), "results", "scaling")
+SWEEP_BENCHMARK_DIR = os.path.join(
+    os.path.dirname(__file__), "benchmarking", "efficientSU2"
+)
+
+# A family member is named <family>_<size>.qasm
+FAMILY_REGEX = re.compile(r"^(?P<family>.+)_(?P<size>\d+)\.qasm$")
+# Smallest number of sizes a family needs for a fit
+MIN_FAMILY_SIZES = 3
+
+SCALING_METRICS = [
+    "transpile_time (seconds)",
+    "memory_footprint (MiB)",
+    "depth (gates)",
+]
+
+
+def find_families(benchmarks):
+    """
+    Group benchmarks into parameterized families.
+
+    :param benchmarks: names of the .qasm benchmarks
+    :type benchmarks: iterable of str
+    :return: dictionary mapping family name to its benchmarks in size order,
+        for the families with at least MIN_FAMILY_SIZES members
+    """
+    families = {}
+    for benchmark in benchmarks:
+        match = FAMILY_REGEX.match(benchmark)
+        if match:
+            families.setdefault(match["family"], []).append(
+                (int(match["size"]), benchmark)
+            )
+    return {
+        family: [benchmark for _, benchmark in sorted(members)]
+        for family, members in sorted(families.items())
+        if len(members) >= MIN_FAMILY_SIZES
+    }
+
+
+def sweep_order(benchmarks):
+    """
+    :param benchmarks: names of the .qasm benchmarks
+    :type benchmarks: iterable of str
+    :return: the members of every family, family by family in size order
+    """
+    return [
+        benchmark
+        for members in find_families(benchmarks).values()
+        for benchmark in members
+    ]
+
+
+def circuit_sizes(path: str, circuit_cache: CircuitCache = None):
+    """
+    Measure the size of a benchmark.
+
+    Gates that are not in the gate table, like the single gate_EfficientSU2
+    the efficientSU2 benchmarks are wrapped in, are expanded into their
+    definitions first.
+
+    :param path: path of the .qasm benchmark
+    :param circuit_cache: cache the circuit is loaded through
+    :return: dictionary with the number of "qubits" and of "gates", counting
+        the gates of the gate table like the depth metric does
+    """
+    circuit = (circuit_cache or CircuitCache()).load(path, "qiskit")
+    while True:
+        composite = {
+            instruction.operation.name
+            for instruction in circuit.data
+            if instruction.operation.name not in GATE_TABLE
+            and instruction.operation.definition is not None
+        }
+        if not composite:
+            break
+        circuit = circuit.decompose(gates_to_decompose=list(composite))
+    return {
+        "qubits": circuit.num_qubits,
+        "gates": sum(
+            1
+            for instruction in circuit.data
+            if instruction.operation.name in GATE_TABLE
+        ),
+    }
+
+
+def _finite(value):
+    # NaN is not valid JSON, an undefined statistic is saved as null
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def _confidence_interval(slope, stderr, dof, confidence):
+    if dof <= 0:
+        return [None, None]
+    half_width = stats.t.ppf(0.5 + confidence / 2, dof) * stderr
+    return [_finite(slope - half_width), _finite(slope + half_width)]
+
+
+def fit_power_law(sizes: list, values: list, confidence: float = 0.95):
+    """
+    Fit ``values = a * sizes^b`` by least squares in log-log space.
+
+    Points with a non-positive value have no logarithm and are left out.
+
+    :param sizes: size of the benchmark of every data point
+    :param values: measured value of every data point
+    :param confidence: confidence level of the interval of the exponent
+    :return: dictionary with the "exponent", its "ci", the "prefactor", the
+        "r_squared" of the fit in log space and the number of "points", or
+        ``None`` if fewer than three points or two sizes remain
+    """
+    sizes = np.asarray(sizes, dtype=float)
+    values = np.asarray(values, dtype=float)
+    keep = (values > 0) & (sizes > 0)
+    if keep.sum() < 3 or len(np.unique(sizes[keep])) < 2:
+        return None
+    fit = stats.linregress(np.log(sizes[keep]), np.log(values[keep]))
+    return {
+        "exponent": float(fit.slope),
+        "ci": _confidence_interval(fit.slope, fit.stderr, keep.sum() - 2, confidence),
+        "prefactor": float(np.exp(fit.intercept)),
+        "r_squared": _finite(fit.rvalue**2),
+        "points": int(keep.sum()),
+    }
+
+
+def fit_n_log_n(sizes: list, values: list, confidence: float = 0.95):
+    """
+    Fit ``values = c * sizes * log(sizes) + d`` by least squares.
+
+    :param sizes: size of the benchmark of every data point
+    :param values: measured value of every data point
+    :param confidence: confidence level of the interval of the coefficient
+    :return: dictionary with the "coefficient", its "ci", the "intercept",
+        the "r_squared" of the fit and the number of "points", or ``None`` if
+        fewer than three points or two sizes are given
+    """
+    sizes = np.asarray(sizes, dtype=float)
+    values = np.asarray(values, dtype=float)
+    keep = sizes > 1
+    if keep.sum() < 3 or len(np.unique(sizes[keep])) < 2:
+        return None
+    fit = stats.linregress(sizes[keep] * np.log(sizes[keep]), values[keep])
+    return {
+        "coefficient": float(fit.slope),
+        "ci": _confidence_interval(fit.slope, fit.stderr, keep.sum() - 2, confidence),
+        "intercept": float(fit.intercept),
+        "r_squared": _finite(fit.rvalue**2),
+        "points": int(keep.sum()),
+    }
+
+
+def fit_entry(entry: dict, families: dict, sizes: dict, confidence: float = 0.95):
+    """
+    Fit the scaling models to the families of a results entry.
+
+    :param entry: results entry of one compiler on one target
+    :param families: dictionary mapping family name to its benchmarks
+    :param sizes: dictionary mapping benchmark to its circuit_sizes
+    :param confidence: confidence level of the intervals
+    :return: list with one scaling record per family with results
+    """
+    records = []
+    for family, members in families.items():
+        members = [benchmark for benchmark in members if benchmark in entry]
+        if len(members) < MIN_FAMILY_SIZES:
+            continue
+        fits = {}
+        for metric in SCALING_METRICS:
+            fits[metric] = {}
+            for variable in ("qubits", "gates"):
+                points = [
+                    (sizes[benchmark][variable], value)
+                    for benchmark in members
+                    for value in entry[benchmark].get(metric, [])
+                ]
+                x_values = [x for x, _ in points]
+                y_values = [y for _, y in points]
+                fits[metric][variable] = {
+                    "power_law": fit_power_law(x_values, y_values, confidence),
+                    "n_log_n": fit_n_log_n(x_values, y_values, confidence),
+                }
+        records.append(
+            {
+                "metadata: ": entry["metadata: "],
+                "backend": entry["backend"],
+                "family": family,
+                "benchmarks": members,
+                "qubits": [sizes[benchmark]["qubits"] for benchmark in members],
+                "gates": [sizes[benchmark]["gates"] for benchmark in members],
+                "confidence": confidence,
+                "fits": fits,
+            }
+        )
+    return records
+
+
+def fit_results(entries: list, benchmark_dir: str, confidence: float = 0.95):
+    """
+    Fit the scaling models to every entry of a results file.
+
+    :param entries: list of results entries
+    :param benchmark_dir: directory holding the benchmarks of the entries
+    :param confidence: confidence level of the intervals
+    :return: list of scaling records
+    """
+    benchmarks = {
+        name
+        for entry in entries
+        for name in entry
+        if name not in ("metadata: ", "backend")
+    }
+    families = find_families(benchmarks)
+    circuit_cache = CircuitCache()
+    sizes = {
+        benchmark: circuit_sizes(os.path.join(benchmark_dir, benchmark), circuit_cache)
+        for members in families.values()
+        for benchmark in members
+    }
+    return [
+        record
+        for entry in entries
+        for record in fit_entry(entry, families, sizes, confidence)
+    ]
+
+
+def format_report(records: list):
+    """
+    :param records: scaling records as returned by fit_results
+    :return: table of the fitted power-law exponents
+    """
+    lines = [
+        f"{'compiler':<24}{'target':<12}{'family':<16}{'metric':<26}{'vs':<8}"
+        f"{'exponent':>9}  {'CI':<18}{'R^2':>6}"
+    ]
+    for record in records:
+        compiler = record["metadata: "]
+        label = (
+            f"{compiler['compiler']} {compiler['version']} "
+            f"O{compiler['optimization_level']}"
+        )
+        for metric, fits in record["fits"].items():
+            for variable, models in fits.items():
+                power_law = models["power_law"]
+                if power_law is None:
+                    continue
+                low, high, r_squared = (
+                    "n/a" if value is None else f"{value:.3f}"
+                    for value in power_law["ci"] + [power_law["r_squared"]]
+                )
+                lines.append(
+                    f"{label:<24}{record['backend']:<12}{record['family']:<16}"
+                    f"{metric:<26}{variable:<8}{power_law['exponent']:>9.3f}  "
+                    f"{f'[{low}, {high}]':<18}{r_squared:>6}"
+                )
+    return "\n".join(lines)
+
+
+def save_report(records: list, results_path: str):
+    """
+    Write the scaling records of a results file to results/scaling.
+
+    :param records: scaling records as returned by fit_results
+    :param results_path: path of the results file they were fitted to
+    :return: path of the scaling report
+    """
+    os.makedirs(SCALING_DIR, exist_ok=True)
+    report_path = os.path.join(SCALING_DIR, os.path.basename(results_path))
+    with open(report_path, "w", encoding="utf-8") as json_file:
+        json.dump(records, json_file, indent=2)
+    return report_path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fit scaling models to the benchmark families of a results file."
+    )
+    parser.add_argument("results", help="path of the results file")
+    parser.add_argument(
+        "--benchmark-dir",
+        default=SWEEP_BENCHMARK_DIR,
+        help="directory of the benchmarks of the results, benchmarking/efficientSU2 "
+        "by default",
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        default=0.95,
+        help="confidence level of the intervals",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="path of the scaling report, results/scaling/<results file> by default",
+    )
+    args = parser.parse_args()
+
+    with open(args.results, "r", encoding="utf-8") as json_file:
+        entries = json.load(json_file)
+    records = fit_results(entries, args.benchmark_dir, args.confidence)
+    print(format_report(records))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as json_file:
+            json.dump(records, json_file, indent=2)
+        print(f"Scaling report saved to: {args.output}")
+    else:
+        print(f"Scaling report saved to: {save_report(records, args.results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+This module describes the runs of a session the same way for runner.py and
+for the Orchestrator of matrix.py: the benchmarks it runs, which of them are
+profiled, and the task descriptor of every run that runner.run_task executes
+in a worker process.
+
+It does not import the compilers, so that the orchestrator can use it.
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import fnmatch
+import os
+
+from results_log import RESULTS_DIR, results_subdir
+
+BENCHMARK_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "benchmarking", "benchmarks"
+)
+PROFILE_DIR = os.path.join(RESULTS_DIR, "profiles")
+
+
+def matches(name: str, patterns: list = None):
+    """
+    :param name: file name
+    :param patterns: glob patterns, e.g. "qft_*"
+    :return: whether the name matches any of the patterns, or there are none
+    """
+    return not patterns or any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def list_benchmarks(benchmark_dir: str, patterns: list = None):
+    """
+    :param benchmark_dir: directory of the benchmark files
+    :param patterns: glob patterns of the benchmarks to run, every benchmark by
+        default
+    :return: sorted list of the names of the benchmark files matching any of
+        the patterns
+    """
+    return [
+        benchmark
+        for benchmark in sorted(os.listdir(benchmark_dir))
+        if os.path.isfile(os.path.join(benchmark_dir, benchmark))
+        and benchmark != ".DS_Store"
+        and matches(benchmark, patterns)
+    ]
+
+
+def is_profiled(benchmark: str, profile: str = None, patterns: list = None):
+    """
+    :param benchmark: name of the benchmark
+    :param profile: profiler of the session, ``None`` if it is not profiled
+    :param patterns: glob patterns of the profiled benchmarks, every benchmark
+        by default
+    :return: whether the runs of the benchmark are profiled
+    """
+    return bool(profile) and matches(benchmark, patterns)
+
+
+def session_profile_dir(directory: str, results_path: str):
+    """
+    :param directory: directory of the profiles, ``None`` for
+        results/profiles
+    :param results_path: path of the results file the runs are added to
+    :return: absolute directory the profiles of the runs of the results file
+        are saved to, see results_log.results_subdir
+    """
+    return results_subdir(os.path.abspath(directory or PROFILE_DIR), results_path)
+
+
+def build_task(
+    benchmark: str,
+    path: str,
+    run: int,
+    compiler_dict: dict,
+    target,
+    timing,
+    options: dict,
+    results_path: str,
+    measure: str = "all",
+):
+    """
+    Build the task descriptor of a run, executed by runner.run_task.
+
+    :param benchmark: name of the benchmark
+    :param path: path of the benchmark file
+    :param run: index of the run
+    :param compiler_dict: dictionary of the compiler, its version and
+        optimization level
+    :param target: keyword arguments of utils.get_fake_flamingo, or the name
+        of the target for an environment worker
+    :type target: dict or str
+    :param timing: TimingHarness of the timed compilation, or its keyword
+        arguments for an environment worker
+    :type timing: TimingHarness or dict
+    :param options: dictionary of the runner options of the session, with the
+        names of the keyword arguments of runner.Runner; "circuit_cache_mib"
+        is only set in the task when it is in ``options``
+    :param results_path: path of the results file the run is added to
+    :param measure: "memory" to only measure memory, "all" for every metric
+    :return: dictionary describing the run
+    """
+    task = {
+        "benchmark": benchmark,
+        "path": path,
+        "run": run,
+        "compiler": compiler_dict,
+        "target": target,
+        "persist_backends": options.get("persist_backends", False),
+        "verify_depth": options.get("verify_depth", False),
+        "memory_timeline": options.get("memory_timeline"),
+        "timing": timing,
+        "pass_timing": options.get("pass_timing", False),
+        "profile": (
+            options.get("profile")
+            if is_profiled(
+                benchmark, options.get("profile"), options.get("profile_benchmarks")
+            )
+            else None
+        ),
+        "profile_dir": session_profile_dir(options.get("profile_dir"), results_path),
+        "measure": measure,
+    }
+    if "circuit_cache_mib" in options:
+        task["circuit_cache_mib"] = options["circuit_cache_mib"]
+    return task
@@ -0,0 +1,151 @@
+"""
+This module contains the TimingHarness class, which times a compilation with
+optional warm-up iterations and garbage collection disabled and, in adaptive
+mode, repeats it until the median is known precisely enough or a time budget
+runs out.
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import gc
+import math
+import time
+
+import numpy as np
+from scipy import stats
+
+
+def median_ci(samples, confidence: float = 0.95):
+    """
+    Distribution-free confidence interval of the median.
+
+    The bounds are order statistics of the samples chosen from the binomial
+    distribution of the number of samples below the median, so no assumption
+    is made on the distribution of the timings.
+
+    :param samples: measured values
+    :type samples: sequence of float
+    :param confidence: confidence level of the interval
+    :return: lower and upper bound, or ``None`` if there are too few samples
+        for an interval at this confidence level
+    """
+    num_samples = len(samples)
+    if num_samples == 0:
+        return None
+    rank = int(stats.binom.ppf((1 - confidence) / 2, num_samples, 0.5))
+    if rank < 1:
+        return None
+    ordered = np.sort(np.asarray(samples, dtype=float))
+    return float(ordered[rank - 1]), float(ordered[num_samples - rank])
+
+
+def relative_median_ci(samples, confidence: float = 0.95):
+    """
+    :return: width of the confidence interval of the median relative to the
+        median, ``inf`` if the interval is not defined yet
+    """
+    interval = median_ci(samples, confidence)
+    median = float(np.median(samples)) if len(samples) else 0.0
+    if interval is None or median <= 0:
+        return math.inf
+    return (interval[1] - interval[0]) / median
+
+
+class TimingHarness:
+    """
+    Times a function with ``time.perf_counter_ns``.
+
+    ``warmup`` untimed calls come first. With ``disable_gc`` the garbage
+    collector is run before and disabled during every timed call. Without
+    ``adaptive`` a single timed call is made; with it the function is called
+    again until the relative width of the confidence interval of the median
+    is at most ``target_rel_ci``, the timed calls have taken ``budget``
+    seconds, or ``max_samples`` calls were made, whichever comes first. At
+    least one timed call is always made, so a function slower than the budget
+    gets a single sample.
+    """
+
+    def __init__(
+        self,
+        warmup: int = 0,
+        disable_gc: bool = False,
+        adaptive: bool = False,
+        target_rel_ci: float = 0.02,
+        budget: float = 30.0,
+        max_samples: int = 1000,
+        confidence: float = 0.95,
+    ):
+        """
+        :param warmup: number of untimed calls before the timed ones
+        :param disable_gc: disable the garbage collector during the timed calls
+        :param adaptive: repeat the timed call until the median is precise
+        :param target_rel_ci: relative width of the confidence interval of the
+            median at which adaptive timing stops
+        :param budget: seconds of timed calls after which adaptive timing stops
+        :param max_samples: largest number of timed calls in adaptive mode
+        :param confidence: confidence level of the interval of the median
+        """
+        self.warmup = warmup
+        self.disable_gc = disable_gc
+        self.adaptive = adaptive
+        self.target_rel_ci = target_rel_ci
+        self.budget = budget
+        self.max_samples = max_samples
+        self.confidence = confidence
+
+    def measure(self, func, setup=None):
+        """
+        Time ``func``.
+
+        :param func: function to time, called with the value returned by
+            ``setup`` if given and without arguments otherwise
+        :type func: callable
+        :param setup: untimed function preparing the argument of every call,
+            e.g. a fresh copy of a circuit that ``func`` modifies in place
+        :type setup: callable
+        :return: the result of the last timed call and the list of timings
+            in seconds
+        """
+
+        def call():
+            if setup is None:
+                return self._timed_call(func)
+            return self._timed_call(func, setup())
+
+        for _ in range(self.warmup):
+            call()
+
+        samples = []
+        elapsed = 0
+        while True:
+            result, duration = call()
+            samples.append(duration)
+            elapsed += duration
+            if (
+                not self.adaptive
+                or len(samples) >= self.max_samples
+                or elapsed >= self.budget * 1e9
+                or relative_median_ci(samples, self.confidence) <= self.target_rel_ci
+            ):
+                break
+        return result, [sample / 1e9 for sample in samples]
+
+    def _timed_call(self, func, *args):
+        gc_enabled = gc.isenabled()
+        if self.disable_gc:
+            gc.collect()
+            gc.disable()
+        try:
+            start_time = time.perf_counter_ns()
+            result = func(*args)
+            end_time = time.perf_counter_ns()
+        finally:
+            if self.disable_gc and gc_enabled:
+                gc.enable()
+        return result, end_time - start_time
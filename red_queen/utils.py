@@ -11,7 +11,11 @@ This module contains utility functions and classes for the red_queen project.
 # that they have been altered from the originals.
 
 # PyTket imports
+import os
+import pickle
 import statistics
+import tempfile
+import time
 
 import numpy as np
 import rustworkx as rx
@@ -33,6 +37,7 @@ from pytket.passes import (
     SequencePass,
 )
 
+from qiskit import __version__ as qiskit_version
 from qiskit.providers import BackendV2, Options
 from qiskit.transpiler import Target, InstructionProperties
 from qiskit.circuit.library import XGate, SXGate, RZGate, CZGate
@@ -86,11 +91,58 @@ from qiskit.circuit import Measure, Delay, Parameter, IfElseOp
 #     FakeYorktownV2,
 # )
 
+# Seed of the random error rates and durations of the FakeFlamingo targets
+BACKEND_SEED = 12345678942
+
+# Directory where built FakeFlamingo backends are persisted between sessions
+BACKEND_CACHE_DIR = os.path.join(os.path.dirname(__file__), ".cache", "backends")
+
+# FakeFlamingo backends built by this process, keyed by (target, qubits, distance, seed)
+_BACKEND_CACHE = {}
+
+# tket noise maps of a backend and their build time, keyed by the backend cache key
+_TKET_NOISE_MAPS = {}
+
+# tket pass managers and their setup time, keyed by (backend cache key, optimization level)
+_TKET_PASS_MANAGERS = {}
+
+# (low, high) bounds of the uniform draws made for every qubit, in draw order:
+# x error, x duration, sx error, sx duration, measure error, measure duration
+QUBIT_PROPERTY_BOUNDS = (
+    (1e-6, 1e-4),
+    (1e-8, 9e-7),
+    (1e-6, 1e-4),
+    (1e-8, 9e-7),
+    (1e-3, 1e-1),
+    (1e-8, 9e-7),
+)
+# (low, high) bounds of the uniform draws made for every edge: cz error, cz duration
+EDGE_PROPERTY_BOUNDS = ((1e-5, 5e-3), (1e-8, 9e-7))
+
+
+def draw_uniform_rows(rng: np.random.Generator, bounds, rows: int):
+    """
+    Draw ``rows`` rows of uniform values in a single call.
+
+    Row ``i`` holds the values that ``rng.uniform(low, high)`` would return
+    when called once per column, in column order, for the ``i``-th time, so
+    the result is identical to the equivalent scalar draws.
+
+    :param rng: numpy random Generator
+    :param bounds: sequence of (low, high) bounds, one per column
+    :type bounds: sequence of tuple
+    :param rows: number of rows to draw
+    :return: array of shape (rows, len(bounds))
+    """
+    lows = np.array([low for low, _ in bounds])
+    highs = np.array([high for _, high in bounds])
+    return lows + (highs - lows) * rng.random((rows, len(bounds)))
+
 
 class FakeFlamingo(BackendV2):
     """Fake multi chip backend."""
 
-    def __init__(self, qubits=200, target="heavy_hex", distance=11):
+    def __init__(self, qubits=200, target="heavy_hex", distance=11, seed=BACKEND_SEED):
         """Instantiate a new fake multi chip backend.
 
         Args:
@@ -99,8 +151,10 @@ class FakeFlamingo(BackendV2):
                 to the number of qubits by:
                 :math:`n = \\frac{5d^2 - 2d - 1}{2}` where :math:`n` is the
                 number of qubits and :math:`d` is the ``distance``
+            seed (int): Seed of the random gate errors and durations.
         """
         super().__init__(name="Fake Multi-QPU with Coupler Backend")
+        self.cache_key = (target, qubits, distance, seed)
         if target == "heavy_hex":
             graph = rx.generators.directed_heavy_hex_graph(distance, bidirectional=False)
         if target == "linear":
@@ -108,40 +162,46 @@ class FakeFlamingo(BackendV2):
         if target == "all_to_all":
             graph = rx.generators.directed_complete_graph(qubits)
         num_qubits = len(graph)
-        rng = np.random.default_rng(seed=12345678942)
-        rz_props = {}
-        x_props = {}
-        sx_props = {}
-        measure_props = {}
-        delay_props = {}
+        rng = np.random.default_rng(seed=seed)
         self._target = Target("Fake multi-chip backend", num_qubits=num_qubits)
-        for i in range(num_qubits):
-            qarg = (i,)
-            rz_props[qarg] = InstructionProperties(error=0.0, duration=0.0)
-            x_props[qarg] = InstructionProperties(
-                error=rng.uniform(1e-6, 1e-4), duration=rng.uniform(1e-8, 9e-7)
-            )
-            sx_props[qarg] = InstructionProperties(
-                error=rng.uniform(1e-6, 1e-4), duration=rng.uniform(1e-8, 9e-7)
-            )
-            measure_props[qarg] = InstructionProperties(
-                error=rng.uniform(1e-3, 1e-1), duration=rng.uniform(1e-8, 9e-7)
-            )
-            delay_props[qarg] = None
-        self._target.add_instruction(XGate(), x_props)
-        self._target.add_instruction(SXGate(), sx_props)
-        self._target.add_instruction(RZGate(Parameter("theta")), rz_props)
-        self._target.add_instruction(Measure(), measure_props)
-        self._target.add_instruction(Delay(Parameter("t")), delay_props)
-        cz_props = {}
-        for root_edge in graph.edge_list():
-            edge = (root_edge[0], root_edge[1])
-            cz_props[edge] = InstructionProperties(
-                error=rng.uniform(1e-5, 5e-3), duration=rng.uniform(1e-8, 9e-7)
-            )
-        self._target.add_instruction(CZGate(), cz_props)
+
+        # Every property is drawn in bulk, in the same order as one scalar
+        # draw per qubit and then per edge would produce them
+        qubit_values = draw_uniform_rows(rng, QUBIT_PROPERTY_BOUNDS, num_qubits)
+        qargs = [(i,) for i in range(num_qubits)]
+        x_error, x_duration, sx_error, sx_duration = qubit_values.T[:4].tolist()
+        m_error, m_duration = qubit_values.T[4:].tolist()
+        self._target.add_instruction(
+            XGate(), self._properties(qargs, x_error, x_duration)
+        )
+        self._target.add_instruction(
+            SXGate(), self._properties(qargs, sx_error, sx_duration)
+        )
+        self._target.add_instruction(
+            RZGate(Parameter("theta")),
+            {qarg: InstructionProperties(error=0.0, duration=0.0) for qarg in qargs},
+        )
+        self._target.add_instruction(
+            Measure(), self._properties(qargs, m_error, m_duration)
+        )
+        self._target.add_instruction(Delay(Parameter("t")), dict.fromkeys(qargs))
+
+        edges = [(edge[0], edge[1]) for edge in graph.edge_list()]
+        cz_error, cz_duration = draw_uniform_rows(
+            rng, EDGE_PROPERTY_BOUNDS, len(edges)
+        ).T.tolist()
+        self._target.add_instruction(
+            CZGate(), self._properties(edges, cz_error, cz_duration)
+        )
         self._target.add_instruction(IfElseOp, name="if_else")
 
+    @staticmethod
+    def _properties(qargs, errors, durations):
+        return {
+            qarg: InstructionProperties(error=error, duration=duration)
+            for qarg, error, duration in zip(qargs, errors, durations)
+        }
+
     @property
     def target(self):
         return self._target
@@ -158,9 +218,69 @@ class FakeFlamingo(BackendV2):
         raise NotImplementedError("Lasciate ogne speranza, voi ch'intrate")
 
 
-def initialize_tket_pass_manager(backend, optimization_level):
+def get_fake_flamingo(
+    target: str = "heavy_hex",
+    qubits: int = 200,
+    distance: int = 11,
+    seed: int = BACKEND_SEED,
+    persist: bool = False,
+):
     """
-    Initialize a pass manager for tket.
+    Get a FakeFlamingo backend, building it only if it has not been built yet.
+
+    Backends are deterministic for a given seed, so they are memoized in
+    memory for the lifetime of the process. With ``persist`` they are also
+    pickled to ``BACKEND_CACHE_DIR`` so that later processes load a ready-made
+    Target instead of rebuilding it. The backend is shared between callers and
+    must not be modified.
+
+    :param target: coupling map of the backend ("heavy_hex", "linear" or "all_to_all")
+    :param qubits: number of qubits of the linear and all_to_all targets
+    :param distance: code distance of the heavy_hex target
+    :param seed: seed of the random gate errors and durations
+    :param persist: also look up and store the backend on disk
+    """
+    key = (target, qubits, distance, seed)
+    if key in _BACKEND_CACHE:
+        return _BACKEND_CACHE[key]
+
+    # Pickles are only valid for the qiskit version that wrote them
+    path = os.path.join(
+        BACKEND_CACHE_DIR,
+        f"{target}_q{qubits}_d{distance}_s{seed}_qiskit{qiskit_version}.pickle",
+    )
+    backend = None
+    if persist and os.path.exists(path):
+        try:
+            with open(path, "rb") as file:
+                backend = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            backend = None
+    if backend is None:
+        backend = FakeFlamingo(
+            qubits=qubits, target=target, distance=distance, seed=seed
+        )
+        if persist:
+            os.makedirs(BACKEND_CACHE_DIR, exist_ok=True)
+            # Write to a temporary file first so concurrent workers never
+            # read a partially written pickle
+            with tempfile.NamedTemporaryFile(
+                dir=BACKEND_CACHE_DIR, suffix=".tmp", delete=False
+            ) as file:
+                pickle.dump(backend, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(file.name, path)
+
+    _BACKEND_CACHE[key] = backend
+    return backend
+
+
+def tket_noise_maps(backend: BackendV2):
+    """
+    Build the tket architecture and averaged noise maps of a backend.
+
+    :param backend: qiskit backend
+    :return: tuple of the Architecture and the averaged node gate, edge gate
+        and readout errors
     """
     # Build equivalent of tket backend, it can't represent heterogenous gate sets
     arch = Architecture(backend.coupling_map.graph.edge_list())
@@ -190,6 +310,69 @@ def initialize_tket_pass_manager(backend, optimization_level):
             averaged_node_gate_errors[Node(qarg[0])] = avg
         else:
             averaged_edge_gate_errors[tuple(Node(x) for x in qarg)] = avg
+    return (
+        arch,
+        averaged_node_gate_errors,
+        averaged_edge_gate_errors,
+        averaged_readout_errors,
+    )
+
+
+def get_tket_pass_manager(backend: BackendV2, optimization_level: int):
+    """
+    Get the tket pass manager of a backend, building it only once per
+    (backend, optimization level).
+
+    The noise maps are shared by every optimization level of a backend.
+    Backends without a ``cache_key`` are never cached.
+
+    :param backend: qiskit backend
+    :param optimization_level: tket optimization level
+    :return: the pass manager and the time in seconds it takes to set it up
+        from scratch (noise maps included)
+    """
+    backend_key = getattr(backend, "cache_key", None)
+    if backend_key is None:
+        start_time = time.perf_counter()
+        tket_pm = initialize_tket_pass_manager(backend, optimization_level)
+        return tket_pm, time.perf_counter() - start_time
+
+    if backend_key not in _TKET_NOISE_MAPS:
+        start_time = time.perf_counter()
+        noise_maps = tket_noise_maps(backend)
+        _TKET_NOISE_MAPS[backend_key] = (noise_maps, time.perf_counter() - start_time)
+    noise_maps, noise_time = _TKET_NOISE_MAPS[backend_key]
+
+    pm_key = (backend_key, optimization_level)
+    if pm_key not in _TKET_PASS_MANAGERS:
+        start_time = time.perf_counter()
+        tket_pm = initialize_tket_pass_manager(
+            backend, optimization_level, noise_maps=noise_maps
+        )
+        setup_time = noise_time + time.perf_counter() - start_time
+        _TKET_PASS_MANAGERS[pm_key] = (tket_pm, setup_time)
+    return _TKET_PASS_MANAGERS[pm_key]
+
+
+def initialize_tket_pass_manager(
+    backend: BackendV2, optimization_level: int, noise_maps: tuple = None
+):
+    """
+    Initialize a pass manager for tket.
+
+    :param backend: qiskit backend
+    :param optimization_level: tket optimization level
+    :param noise_maps: result of tket_noise_maps for the backend, computed if
+        not given
+    """
+    if noise_maps is None:
+        noise_maps = tket_noise_maps(backend)
+    (
+        arch,
+        averaged_node_gate_errors,
+        averaged_edge_gate_errors,
+        averaged_readout_errors,
+    ) = noise_maps
     # BUild tket compilation sequence:
     passlist = [DecomposeBoxes()]
     rebase_pass = AutoRebase({OpType.X, OpType.SX, OpType.Rz, OpType.CZ})
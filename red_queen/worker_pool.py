@@ -0,0 +1,228 @@
+"""
+This module contains the WorkerPool class, a long-lived pool of worker
+processes that is reused across benchmark runs.
+"""
+
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the root directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+
+import multiprocessing
+from multiprocessing.connection import wait
+import traceback
+
+# pylint: disable=import-error
+from memory_profiler import memory_usage
+
+from pinning import launch_settings
+
+# Worker processes are spawned rather than forked: forking a parent that has
+# already started qiskit's Rust thread pool can deadlock the child.
+MP_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def _worker_loop(conn):
+    """
+    Serve tasks sent over ``conn`` until the pool asks the worker to stop.
+
+    Every reply carries the resident set size of the worker after the task so
+    the pool can decide whether to recycle it.
+
+    :param conn: worker end of the pipe to the pool
+    """
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        func, args = task
+        try:
+            reply = (True, func(*args))
+        except Exception as ex:  # pylint: disable=broad-except
+            reply = (False, (repr(ex), traceback.format_exc()))
+        conn.send(reply + (memory_usage(max_usage=True),))
+    conn.close()
+
+
+class WorkerError(RuntimeError):
+    """
+    Raised in the parent when a task fails inside a worker process.
+    """
+
+
+class _Worker:
+    """
+    Book-keeping for a single worker process of a WorkerPool.
+    """
+
+    def __init__(self, cpus=None, environment=None):
+        self.cpus = cpus
+        self.environment = environment
+        self.conn, child_conn = MP_CONTEXT.Pipe()
+        self.process = MP_CONTEXT.Process(
+            target=_worker_loop, args=(child_conn,), daemon=True
+        )
+        # The worker is pinned and limited before it imports the compilers
+        with launch_settings(cpus, environment):
+            self.process.start()
+        child_conn.close()
+        self.tasks_done = 0
+        self.baseline_rss = None
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """
+    Pool of long-lived worker processes owned by a Runner.
+
+    Workers are started once and reused across runs so that process start-up
+    and compiler imports are not paid for every measurement. A worker is
+    recycled (stopped and replaced by a fresh one) once it has served
+    ``max_tasks_per_worker`` tasks, or once its resident set size has grown by
+    more than ``max_rss_growth_mib`` over the size it had after its first task.
+
+    Every worker can be pinned to its own set of CPUs and started with
+    environment variables, e.g. thread limits, see pinning.py; a recycled
+    worker is replaced by one with the same settings.
+    """
+
+    def __init__(
+        self,
+        processes: int = 1,
+        max_tasks_per_worker: int = None,
+        max_rss_growth_mib: float = None,
+        cpu_sets=None,
+        environment: dict = None,
+    ):
+        """
+        :param processes: number of worker processes
+        :param max_tasks_per_worker: recycle a worker after this many tasks,
+            ``None`` to never recycle on task count
+        :param max_rss_growth_mib: recycle a worker once its RSS has grown by
+            this many MiB since its first task, ``None`` to never recycle on RSS
+        :param cpu_sets: list of the CPUs to pin every worker to, ``None`` to
+            leave the workers unpinned
+        :param environment: dictionary of environment variables the workers
+            are started with
+        """
+        self.processes = processes
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.max_rss_growth_mib = max_rss_growth_mib
+        self.cpu_sets = cpu_sets
+        self.environment = environment
+        self.recycled = 0
+        self._workers = [
+            _Worker(cpu_sets[index] if cpu_sets else None, environment)
+            for index in range(processes)
+        ]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Stop every worker process.
+        """
+        for worker in self._workers:
+            worker.stop()
+        self._workers = []
+
+    def apply(self, func, args: tuple = ()):
+        """
+        Run ``func(*args)`` in a worker and return its result.
+
+        :param func: picklable callable to run
+        :type func: callable
+        :param args: arguments of the call
+        """
+        return next(self.imap_unordered(func, [args]))
+
+    def imap_unordered(self, func, iterable):
+        """
+        Run ``func(*args)`` for every ``args`` in ``iterable`` and yield the
+        results in completion order.
+
+        :param func: picklable callable to run
+        :type func: callable
+        :param iterable: iterable of argument tuples
+        :type iterable: iterable of tuple
+        """
+        pending = iter(iterable)
+        idle = list(self._workers)
+        busy = {}
+
+        try:
+            while True:
+                while idle:
+                    try:
+                        args = next(pending)
+                    except StopIteration:
+                        break
+                    worker = idle.pop()
+                    worker.conn.send((func, args))
+                    busy[worker.conn] = worker
+                if not busy:
+                    return
+
+                for conn in wait(list(busy)):
+                    worker, success, result = self._receive(busy.pop(conn))
+                    idle.append(worker)
+                    if not success:
+                        raise WorkerError(f"{result[0]} raised in worker:\n{result[1]}")
+                    yield result
+        finally:
+            # Collect the replies of tasks still in flight so that the
+            # workers are idle for the next call.
+            for worker in busy.values():
+                self._receive(worker)
+
+    def _receive(self, worker: _Worker):
+        """
+        Wait for the reply of a busy worker and apply the recycle policy.
+
+        :return: the worker to use for the next task, whether the task
+            succeeded, and its result (or error description)
+        """
+        try:
+            success, result, rss = worker.conn.recv()
+        except EOFError as ex:
+            self._replace(worker)
+            raise WorkerError("Worker process died during a task") from ex
+
+        worker.tasks_done += 1
+        if worker.baseline_rss is None:
+            worker.baseline_rss = rss
+        exhausted = (
+            self.max_tasks_per_worker is not None
+            and worker.tasks_done >= self.max_tasks_per_worker
+        )
+        grown = (
+            self.max_rss_growth_mib is not None
+            and rss - worker.baseline_rss > self.max_rss_growth_mib
+        )
+        if exhausted or grown:
+            self.recycled += 1
+            worker = self._replace(worker)
+        return worker, success, result
+
+    def _replace(self, worker: _Worker):
+        worker.stop()
+        fresh = _Worker(worker.cpus, worker.environment)
+        self._workers[self._workers.index(worker)] = fresh
+        return fresh